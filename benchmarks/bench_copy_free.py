@@ -0,0 +1,79 @@
+"""Compares the P2 clean + curate peak memory: copies (default) vs copy-free (`copy=False`)
+
+Runs clean and curate on a synthetic dataset (as read from `collisions_raw`)
+once per mode, each in its own process, and reports the peak memory
+allocated while transforming, traced with tracemalloc (numpy buffers included).
+
+Usage:
+    uv run python benchmarks/bench_copy_free.py --rows 500000
+"""
+
+from de_project.project_p1_p2.ingest.transform import transform
+from de_project.project_p1_p2.transform.clean import clean
+from de_project.project_p1_p2.transform.curated import curate
+from de_project.project_p1_p2.transform.mapping_engine import get_compiled_mappings
+from synthetic import make_raw_dataset
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+
+MODES = {"copies": True, "copy-free": False}
+MiB = 1024 * 1024
+
+
+def run(rows: int, copy: bool) -> dict:
+    """Runs clean + curate, returns the dataset size and the peak memory of the run"""
+    df = transform(make_raw_dataset(rows))
+    get_compiled_mappings()  # loaded once per process, not part of the measure
+    dataset_mib = df.memory_usage(deep=True).sum() / MiB
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = curate(clean(df, copy=copy), copy=copy)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "dataset_mib": dataset_mib,
+        "peak_mib": peak / MiB,
+        "elapsed": elapsed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.rows, MODES[args.mode])))
+        return
+
+    results = {}
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, __file__, "--rows", str(args.rows), "--mode", mode],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        results[mode] = json.loads(output.splitlines()[-1])
+
+    print(f"{args.rows} rows, input dataset {results['copies']['dataset_mib']:.1f} MiB")
+    print(f"{'':12}{'peak (MiB)':>12}{'x dataset':>12}{'time (s)':>12}")
+    for mode, result in results.items():
+        print(
+            f"{mode:12}{result['peak_mib']:>12.1f}"
+            f"{result['peak_mib'] / result['dataset_mib']:>12.1f}"
+            f"{result['elapsed']:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Compares `collision_datetime` construction: per row string parsing vs distinct values parsing
+
+Builds the datetimes of a synthetic raw dataset `date` and `time` columns
+with both implementations, checks the results are identical and reports the timings.
+
+Usage:
+    uv run python benchmarks/bench_datetime.py --rows 1000000
+"""
+
+import pandas as pd
+
+from de_project.project_p1_p2.ingest.transform import (
+    _build_datetime,
+    _parse_datetime_strings,
+)
+from synthetic import make_raw_dataset
+
+import argparse
+import time
+
+
+def _best_time(build, df: pd.DataFrame, repeat: int) -> tuple[float, pd.Series]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = build(df["date"], df["time"])
+        best = min(best, time.perf_counter() - start)
+    return (best, result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = make_raw_dataset(args.rows)[["date", "time"]]
+
+    previous_time, expected = _best_time(_parse_datetime_strings, df, args.repeat)
+    builder_time, actual = _best_time(_build_datetime, df, args.repeat)
+    pd.testing.assert_series_equal(actual, expected, check_names=False)
+
+    print(f"{args.rows} rows")
+    print(f"{'strings':>10}{'builder':>10}{'speedup':>10}")
+    print(
+        f"{previous_time:>9.3f}s{builder_time:>9.3f}s"
+        f"{previous_time / builder_time:>9.1f}x"
+    )
+    print("results identical")
+
+
+if __name__ == "__main__":
+    main()
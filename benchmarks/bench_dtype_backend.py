@@ -0,0 +1,90 @@
+"""Compares the pipeline dtype backends: numpy (default) vs Arrow (`ARROW_DTYPES=true`)
+
+Runs P1 read + transform and P2 clean + curate on a synthetic raw CSV file
+once per backend, each in its own process, and reports time and memory.
+
+Usage:
+    uv run python benchmarks/bench_dtype_backend.py --rows 500000
+"""
+
+from de_project.project_p1_p2.ingest.extract import read_csv_file
+from de_project.project_p1_p2.ingest.transform import transform
+from de_project.project_p1_p2.transform.clean import clean
+from de_project.project_p1_p2.transform.curated import curate
+from synthetic import write_raw_csv
+
+from pathlib import Path
+import argparse
+import json
+import os
+import subprocess
+import sys
+import resource
+import tempfile
+import time
+
+BACKENDS = {"numpy": "false", "arrow": "true"}
+MiB = 1024 * 1024
+
+
+def run(csv_path: Path) -> dict:
+    """Runs the pipeline steps with the backend of the current process"""
+    timings = {}
+
+    start = time.perf_counter()
+    df = read_csv_file(csv_path)
+    timings["read"] = time.perf_counter() - start
+
+    for name, step in (("transform", transform), ("clean", clean), ("curate", curate)):
+        start = time.perf_counter()
+        df = step(df)
+        timings[name] = time.perf_counter() - start
+
+    return {
+        "timings": timings,
+        "dataset_mib": df.memory_usage(deep=True).sum() / MiB,
+        # peak resident memory of the process, numpy and Arrow buffers included
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--csv", type=Path, help="raw CSV file, synthetic if missing")
+    parser.add_argument("--backend", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(run(args.csv)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = args.csv
+        if csv_path is None:
+            csv_path = write_raw_csv(Path(tmp_dir) / "raw.csv", args.rows)
+
+        results = {}
+        for backend, enabled in BACKENDS.items():
+            output = subprocess.run(
+                [sys.executable, __file__, "--backend", backend, "--csv", csv_path],
+                env=os.environ | {"ARROW_DTYPES": enabled},
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            results[backend] = json.loads(output.splitlines()[-1])
+
+    steps = list(results["numpy"]["timings"])
+    print(f"{'':18}" + "".join(f"{backend:>12}" for backend in results))
+    for step in steps:
+        print(
+            f"{step + ' (s)':18}"
+            + "".join(f"{r['timings'][step]:>12.2f}" for r in results.values())
+        )
+    for metric in ("dataset_mib", "peak_rss_mib"):
+        print(f"{metric:18}" + "".join(f"{r[metric]:>12.1f}" for r in results.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Compares code to label mapping: per column `Series.map` vs the compiled mapping engine
+
+Maps the code columns and special code columns of a synthetic raw dataset
+with both implementations, checks the results are identical and reports the timings.
+
+Usage:
+    uv run python benchmarks/bench_mapping_engine.py --rows 1000000
+"""
+
+import pandas as pd
+
+from de_project.project_p1_p2.ingest.transform import transform
+from de_project.project_p1_p2.transform.clean import _rename_columns
+from de_project.project_p1_p2.transform.code_mappings import (
+    get_mappings,
+    mapping_to_dict,
+)
+from de_project.project_p1_p2.transform.mapping_engine import (
+    compile_mapping,
+    get_compiled_mappings,
+    map_codes,
+    map_special_codes,
+)
+from synthetic import make_raw_dataset
+
+import argparse
+import time
+
+SPECIAL_CODES = {
+    "first_road_number": {-1: "Unknown", 0: "Unclassified"},
+    "speed_limit": {-1: "Unknown", 99: "Unknown"},
+    "second_road_number": {-1: "Unknown", 0: "Unclassified"},
+}
+
+
+def map_codes_with_series_map(df: pd.DataFrame) -> dict[str, pd.Series]:
+    """The previous implementation: a `Series.map` and an unmapped scan per column"""
+    result = {}
+    for col, mapping in get_mappings().items():
+        mapping = mapping_to_dict(mapping)
+        s = df[col]
+        categories = pd.CategoricalDtype(list(dict.fromkeys(mapping.values())))
+        mapped = s.map(mapping).astype(categories)
+        mask_unmapped = mapped.isna() & s.notna()
+        if mask_unmapped.any():
+            raise ValueError(f"Unmapped values in column {col}")
+        result[col] = mapped
+    return result
+
+
+def map_codes_with_engine(df: pd.DataFrame) -> dict[str, pd.Series]:
+    """The mapping engine: a single gather for all integer code columns"""
+    mapped, unmapped = map_codes(df, get_compiled_mappings())
+    if unmapped:
+        raise ValueError(f"Unmapped values in columns {list(unmapped)}")
+    return {col: pd.Series(values, index=df.index) for col, values in mapped.items()}
+
+
+def map_special_codes_with_mask(df: pd.DataFrame) -> dict[str, pd.Series]:
+    """The previous implementation: a `Series.mask` per special code"""
+    result = {}
+    for col, mapping in SPECIAL_CODES.items():
+        mapped = df[col].astype("Int64").astype("string")
+        for code, value in mapping.items():
+            mapped = mapped.mask(df[col] == code, value)
+        result[col] = mapped
+    return result
+
+
+def map_special_codes_with_engine(df: pd.DataFrame) -> dict[str, pd.Series]:
+    """The mapping engine: a single lookup and `Series.mask` per column"""
+    return {
+        col: map_special_codes(df[col], compile_mapping(mapping))
+        for col, mapping in SPECIAL_CODES.items()
+    }
+
+
+def _best_time(map_columns, df: pd.DataFrame, repeat: int) -> tuple[float, dict]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = map_columns(df)
+        best = min(best, time.perf_counter() - start)
+    return (best, result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = _rename_columns(transform(make_raw_dataset(args.rows)))
+    get_compiled_mappings()  # compiled once per process, not part of the timings
+
+    benchmarks = {
+        "code columns": (map_codes_with_series_map, map_codes_with_engine),
+        "special codes": (map_special_codes_with_mask, map_special_codes_with_engine),
+    }
+    print(f"{len(df)} rows")
+    print(f"{'':16}{'previous':>10}{'engine':>10}{'speedup':>10}")
+    for name, (previous, engine) in benchmarks.items():
+        previous_time, expected = _best_time(previous, df, args.repeat)
+        engine_time, actual = _best_time(engine, df, args.repeat)
+        for col in expected:
+            pd.testing.assert_series_equal(
+                actual[col], expected[col], check_names=False
+            )
+        print(
+            f"{name:16}{previous_time:>9.3f}s{engine_time:>9.3f}s"
+            f"{previous_time / engine_time:>9.1f}x"
+        )
+    print("results identical")
+
+
+if __name__ == "__main__":
+    main()
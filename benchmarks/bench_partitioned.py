@@ -0,0 +1,83 @@
+"""Compares P2 clean + curate: whole dataset vs month-partitioned (`PARTITIONED_PROCESSING`)
+
+Runs clean and curate on a synthetic dataset (as read from `collisions_raw`) in both modes,
+checks the clean, rejected and curated datasets are identical and reports the timings.
+Collision ids are duplicated across months and the first month holds a single severity,
+so the partitions miss categories the whole dataset has. Curate also runs on
+the severity labels (not categorical), the partitions then infer their own categories.
+
+Usage:
+    uv run python benchmarks/bench_partitioned.py --rows 1000000 --workers 4
+"""
+
+import numpy as np
+import pandas as pd
+
+from de_project.project_p1_p2.ingest.transform import transform
+from de_project.project_p1_p2.transform.clean import clean_with_rejected
+from de_project.project_p1_p2.transform.curated import curate
+from de_project.project_p1_p2.transform.mapping_engine import get_compiled_mappings
+from de_project.project_p1_p2.transform.partitioned import (
+    clean_partitioned,
+    curate_partitioned,
+)
+from synthetic import make_raw_dataset
+
+import argparse
+import time
+
+SLIGHT = 3  # collision_severity code of the single severity of the first month
+
+
+def make_dataset(rows: int) -> pd.DataFrame:
+    """Returns a transformed synthetic raw dataset with cross-month duplicate ids
+    and a first month of slight collisions only"""
+    df = transform(make_raw_dataset(rows))
+    rng = np.random.default_rng(0)
+    duplicates = rng.choice(len(df), (2, len(df) // 100), replace=False)
+    df.loc[duplicates[1], "collision_index"] = df.loc[
+        duplicates[0], "collision_index"
+    ].to_numpy()
+    first_month = df["collision_datetime"].dt.month == 1
+    df.loc[first_month, "collision_severity"] = SLIGHT
+    return df
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return (time.perf_counter() - start, result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    df = make_dataset(args.rows)
+    get_compiled_mappings()  # loaded once, not part of the measure
+
+    whole_time, (clean, rejected) = _timed(clean_with_rejected, df)
+    part_time, (part_clean, part_rejected) = _timed(clean_partitioned, df, args.workers)
+    pd.testing.assert_frame_equal(part_clean, clean)
+    pd.testing.assert_frame_equal(part_rejected, rejected)
+
+    curate_time, curated = _timed(curate, clean)
+    part_curate_time, part_curated = _timed(curate_partitioned, clean, args.workers)
+    pd.testing.assert_frame_equal(part_curated, curated)
+
+    labels = clean.astype({"collision_severity": object})
+    pd.testing.assert_frame_equal(
+        curate_partitioned(labels, args.workers), curate(labels)
+    )
+
+    print(f"{args.rows} rows, {len(rejected)} rejected, workers={args.workers}")
+    print(f"{'':10}{'whole':>10}{'months':>10}")
+    print(f"{'clean':10}{whole_time:>9.3f}s{part_time:>9.3f}s")
+    print(f"{'curate':10}{curate_time:>9.3f}s{part_curate_time:>9.3f}s")
+    print("results identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Compares P1 raw dataset validation: full pandera validation vs fast mode
+
+Validates a synthetic transformed raw dataset in both `SCHEMA_VALIDATION` modes,
+checks the validated datasets are identical and reports the timings.
+
+Usage:
+    uv run python benchmarks/bench_schema_validation.py --rows 1000000
+"""
+
+import pandas as pd
+
+from de_project.project_p1_p2.ingest.transform import _transform
+from de_project.project_p1_p2.ingest.validation import validate_raw
+from synthetic import make_raw_dataset
+
+import argparse
+import os
+import time
+
+
+def _best_time(mode: str, df: pd.DataFrame, repeat: int) -> tuple[float, pd.DataFrame]:
+    os.environ["SCHEMA_VALIDATION"] = mode
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = validate_raw(df)
+        best = min(best, time.perf_counter() - start)
+    return (best, result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = _transform(make_raw_dataset(args.rows)).reset_index(drop=True)
+
+    full_time, expected = _best_time("full", df, args.repeat)
+    fast_time, actual = _best_time("fast", df, args.repeat)
+    pd.testing.assert_frame_equal(actual, expected)
+
+    print(
+        f"{args.rows} rows, SCHEMA_SAMPLE_SIZE={os.environ.get('SCHEMA_SAMPLE_SIZE')}"
+    )
+    print(f"{'full':>10}{'fast':>10}{'speedup':>10}")
+    print(f"{full_time:>9.3f}s{fast_time:>9.3f}s{full_time / fast_time:>9.1f}x")
+    print("results identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Synthetic raw collisions datasets for benchmarks
+
+Generates datasets shaped like the DfT raw CSV files:
+code columns hold valid codes from the code mappings,
+so the generated datasets go through the whole pipeline.
+"""
+
+import numpy as np
+import pandas as pd
+
+from de_project.project_p1_p2.ingest.schema import CollisionsRawSchema
+from de_project.project_p1_p2.transform.code_mappings import (
+    get_mappings,
+    mapping_to_dict,
+)
+
+from pathlib import Path
+
+
+def make_raw_dataset(rows: int, year: int = 2023, seed: int = 0) -> pd.DataFrame:
+    """Returns a synthetic raw dataset, as read from a raw CSV file"""
+    rng = np.random.default_rng(seed)
+    mappings = get_mappings()
+
+    columns = {}
+    for name, column in CollisionsRawSchema.to_schema().columns.items():
+        if name == "collision_datetime":
+            continue
+        if name in mappings:
+            codes = np.array(list(mapping_to_dict(mappings[name])), dtype=object)
+            columns[name] = rng.choice(codes, rows)
+        elif str(column.dtype).startswith("int"):
+            columns[name] = rng.integers(-1, 100, rows)
+        elif str(column.dtype).startswith("float"):
+            columns[name] = rng.normal(0, 1, rows).round(4)
+        else:
+            columns[name] = [f"s{i}" for i in rng.integers(0, 50, rows)]
+
+    columns["collision_index"] = [f"{year}{i:08d}" for i in range(rows)]
+    columns["collision_year"] = year
+    columns["longitude"] = rng.uniform(-5, 1.5, rows).round(5)
+    columns["latitude"] = rng.uniform(50, 58, rows).round(5)
+
+    days = pd.Timestamp(f"{year}-01-01") + pd.to_timedelta(
+        rng.integers(0, 365, rows), "D"
+    )
+    columns["date"] = days.strftime("%d/%m/%Y")
+    columns["time"] = [
+        f"{hour:02d}:{minute:02d}"
+        for hour, minute in zip(rng.integers(0, 24, rows), rng.integers(0, 60, rows))
+    ]
+
+    return pd.DataFrame(columns)
+
+
+def write_raw_csv(file_path: Path, rows: int, year: int = 2023) -> Path:
+    """Writes a synthetic raw dataset CSV file, returns the file path"""
+    make_raw_dataset(rows, year).to_csv(file_path, index=False)
+    return file_path
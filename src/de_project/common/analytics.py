@@ -0,0 +1,349 @@
+"""Analytical store of the P3 star schema (fact and dimension tables)
+
+With `ANALYTICS_BACKEND=sqlite` (default), the tables are stored in the pipeline SQLite database.
+With `ANALYTICS_BACKEND=duckdb`, they are stored in an embedded DuckDB database file,
+`analytics.duckdb` next to the SQLite database, loaded from Arrow tables with DuckDB columnar bulk path.
+The analytical queries (`project_p3/analytical-queries.sql`) run unchanged on both backends.
+
+Tables are written whole (`write_tables`) or maintained with row changes (`apply_deltas`).
+Every table write records a new version of the table in `analytics_table_versions`,
+in the same transaction, so readers can tell whether a table changed (e.g. to cache query results).
+"""
+
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import Engine, inspect
+
+from de_project.common.bulk_load import (
+    bulk_add_counts,
+    bulk_delete,
+    bulk_insert,
+    bulk_load_connection,
+)
+from de_project.common.config import get_analytics_backend
+from de_project.common.db import get_db_folder
+from de_project.common.dtypes import read_options, to_pandas_options
+from de_project.common.table_versions import (
+    TABLE_VERSIONS_TABLE,
+    UPSERT_VERSION,
+    new_versions,
+    read_table_versions,
+)
+
+from dataclasses import dataclass
+from pathlib import Path
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+DUCKDB_FILE = "analytics.duckdb"
+
+# name of the Arrow table registered as a DuckDB view during a load
+_ARROW_VIEW = "_arrow_dataset"
+
+
+@dataclass
+class TableDelta:
+    """Row changes of a table of the analytical store, applied by `apply_deltas`
+    in this order: deleted, inserted, then counts"""
+
+    table_name: str
+    deleted: pd.DataFrame | None = None  # key columns of the rows to delete
+    inserted: pd.DataFrame | None = None  # rows to insert
+    # key columns and count column: the counts are added to the stored counts of the keys,
+    # missing keys are inserted, rows left without a count are deleted
+    counts: pd.DataFrame | None = None
+    count_column: str | None = None
+
+
+def get_duckdb_path() -> Path:
+    """Returns the path to the DuckDB database file"""
+    return get_db_folder() / DUCKDB_FILE
+
+
+def connect_duckdb(read_only: bool = False):
+    """Returns a connection to the DuckDB database file, created if missing.
+
+    DuckDB is an optional dependency: `uv sync --extra duckdb`
+    """
+    try:
+        import duckdb
+    except ImportError as exc:
+        raise ImportError(
+            "ANALYTICS_BACKEND=duckdb requires the duckdb package, "
+            "install it with: uv sync --extra duckdb"
+        ) from exc
+
+    return duckdb.connect(str(get_duckdb_path()), read_only=read_only)
+
+
+def _write_duckdb_tables(tables: dict[str, pd.DataFrame]) -> None:
+    conn = connect_duckdb()
+    try:
+        conn.begin()
+        for table_name, df in tables.items():
+            start = time.perf_counter()
+            # DuckDB scans the Arrow buffers, column by column, without a row conversion
+            conn.register(_ARROW_VIEW, pa.Table.from_pandas(df, preserve_index=False))
+            conn.execute(
+                f'CREATE OR REPLACE TABLE "{table_name}" AS SELECT * FROM {_ARROW_VIEW}'
+            )
+            conn.unregister(_ARROW_VIEW)
+
+            elapsed = time.perf_counter() - start
+            rows_per_sec = len(df) / elapsed if elapsed else float("inf")
+            logger.info(
+                f"[METRIC] DuckDB loaded {len(df)} rows into '{table_name}' "
+                f"in {elapsed:.2f}s ({rows_per_sec:.0f} rows/sec)"
+            )
+
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLE_VERSIONS_TABLE} "
+            "(table_name VARCHAR PRIMARY KEY, version VARCHAR, updated_at VARCHAR)"
+        )
+        conn.executemany(UPSERT_VERSION, new_versions(tables))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def write_tables(engine: Engine, tables: dict[str, pd.DataFrame]) -> None:
+    """Writes the datasets to the analytical store, replacing the tables, in a single transaction.
+
+    :param engine: the pipeline SQLite engine, used by the `sqlite` backend
+    :param tables: the datasets by table name
+    """
+    backend = get_analytics_backend()
+    logger.info(f"Writing tables {list(tables)} to the '{backend}' analytical store")
+
+    if backend == "duckdb":
+        _write_duckdb_tables(tables)
+        return
+
+    # each table write records a new table version, see `bulk_insert`
+    with bulk_load_connection(engine) as conn:
+        for table_name, df in tables.items():
+            bulk_insert(conn, df, table_name)
+
+
+def _has_rows(df: pd.DataFrame | None) -> bool:
+    return df is not None and not df.empty
+
+
+def _apply_duckdb_deltas(deltas: list[TableDelta]) -> None:
+    conn = connect_duckdb()
+    try:
+        conn.begin()
+        for delta in deltas:
+            start = time.perf_counter()
+            table = f'"{delta.table_name}"'
+
+            if _has_rows(delta.deleted):
+                match = " AND ".join(
+                    f'{table}."{col}" = d."{col}"' for col in delta.deleted
+                )
+                conn.register(
+                    _ARROW_VIEW,
+                    pa.Table.from_pandas(delta.deleted, preserve_index=False),
+                )
+                conn.execute(f"DELETE FROM {table} USING {_ARROW_VIEW} d WHERE {match}")
+                conn.unregister(_ARROW_VIEW)
+
+            if _has_rows(delta.inserted):
+                columns = ", ".join(f'"{col}"' for col in delta.inserted)
+                conn.register(
+                    _ARROW_VIEW,
+                    pa.Table.from_pandas(delta.inserted, preserve_index=False),
+                )
+                conn.execute(
+                    f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {_ARROW_VIEW}"
+                )
+                conn.unregister(_ARROW_VIEW)
+
+            if _has_rows(delta.counts):
+                count = f'"{delta.count_column}"'
+                keys = [col for col in delta.counts if col != delta.count_column]
+                match = " AND ".join(f'{table}."{key}" = d."{key}"' for key in keys)
+                columns = ", ".join(f'"{col}"' for col in delta.counts)
+                conn.register(
+                    _ARROW_VIEW,
+                    pa.Table.from_pandas(delta.counts, preserve_index=False),
+                )
+                conn.execute(
+                    f"UPDATE {table} SET {count} = {table}.{count} + d.{count} "
+                    f"FROM {_ARROW_VIEW} d WHERE {match}"
+                )
+                conn.execute(
+                    f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {_ARROW_VIEW} d "
+                    f"WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {match})"
+                )
+                conn.execute(
+                    f"DELETE FROM {table} USING {_ARROW_VIEW} d "
+                    f"WHERE {match} AND {table}.{count} <= 0"
+                )
+                conn.unregister(_ARROW_VIEW)
+
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"[METRIC] DuckDB applied the row changes of '{delta.table_name}' in {elapsed:.2f}s"
+            )
+
+        conn.executemany(
+            UPSERT_VERSION, new_versions(delta.table_name for delta in deltas)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def apply_deltas(engine: Engine, deltas: list[TableDelta]) -> None:
+    """Applies the row changes to existing tables of the analytical store (written with
+    `write_tables`), in a single transaction. Unlike `write_tables`, the write cost
+    depends on the changed rows, not on the table size.
+
+    :param engine: the pipeline SQLite engine, used by the `sqlite` backend
+    :param deltas: the row changes, by table
+    """
+    backend = get_analytics_backend()
+    logger.info(
+        f"Applying row changes to tables {[delta.table_name for delta in deltas]} "
+        f"of the '{backend}' analytical store"
+    )
+
+    if backend == "duckdb":
+        _apply_duckdb_deltas(deltas)
+        return
+
+    # each table write records a new table version, see `bulk_load`
+    with bulk_load_connection(engine) as conn:
+        for delta in deltas:
+            if _has_rows(delta.deleted):
+                bulk_delete(conn, delta.deleted, delta.table_name)
+            if _has_rows(delta.inserted):
+                bulk_insert(
+                    conn,
+                    delta.inserted,
+                    delta.table_name,
+                    if_exists="append",
+                    build_indexes=False,
+                )
+            if _has_rows(delta.counts):
+                keys = [col for col in delta.counts if col != delta.count_column]
+                bulk_add_counts(
+                    conn, delta.counts, delta.table_name, keys, delta.count_column
+                )
+
+
+def get_table_versions(engine: Engine, table_names: list[str]) -> dict[str, str]:
+    """Returns the current version of the tables, by table name.
+
+    Tables never written with `write_tables` have no version.
+
+    :param engine: the pipeline SQLite engine, used by the `sqlite` backend
+    """
+    if get_analytics_backend() != "duckdb":
+        return read_table_versions(engine, table_names)
+
+    if not table_names or not has_table(engine, TABLE_VERSIONS_TABLE):
+        return {}
+    query = (
+        f"SELECT table_name, version FROM {TABLE_VERSIONS_TABLE} "
+        f"WHERE table_name IN ({', '.join('?' for _ in table_names)})"
+    )
+    conn = connect_duckdb(read_only=True)
+    try:
+        return dict(conn.execute(query, list(table_names)).fetchall())
+    finally:
+        conn.close()
+
+
+def has_table(engine: Engine, table_name: str) -> bool:
+    """Returns whether the table exists in the analytical store
+
+    :param engine: the pipeline SQLite engine, used by the `sqlite` backend
+    """
+    if get_analytics_backend() == "duckdb":
+        if not get_duckdb_path().exists():
+            return False
+        conn = connect_duckdb(read_only=True)
+        try:
+            tables = conn.execute(
+                "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?",
+                [table_name],
+            )
+            return tables.fetchone()[0] > 0
+        finally:
+            conn.close()
+
+    return inspect(engine).has_table(table_name)
+
+
+def read_table(
+    engine: Engine, table_name: str, columns: list[str] | None = None
+) -> pd.DataFrame:
+    """Reads a table from the analytical store
+
+    :param engine: the pipeline SQLite engine, used by the `sqlite` backend
+    :param columns=None: the columns to read, all if None
+    """
+    if get_analytics_backend() == "duckdb":
+        conn = connect_duckdb(read_only=True)
+        try:
+            relation = conn.table(table_name)
+            if columns is not None:
+                relation = relation.select(*columns)
+            return relation.to_arrow_table().to_pandas(**to_pandas_options())
+        finally:
+            conn.close()
+
+    with engine.connect() as conn:
+        return pd.read_sql_table(table_name, conn, columns=columns, **read_options())
+
+
+def run_query(engine: Engine, sql: str) -> pd.DataFrame:
+    """Runs a query against the analytical store. Returns the result rows
+
+    :param engine: the pipeline SQLite engine, used by the `sqlite` backend
+    """
+    if get_analytics_backend() == "duckdb":
+        conn = connect_duckdb(read_only=True)
+        try:
+            return conn.sql(sql).to_arrow_table().to_pandas(**to_pandas_options())
+        finally:
+            conn.close()
+
+    with engine.connect() as conn:
+        return pd.read_sql_query(sql, conn, **read_options())
+
+
+def explain_query(engine: Engine, sql: str) -> str:
+    """Returns the query plan of a query: `EXPLAIN QUERY PLAN` for SQLite,
+    `EXPLAIN` (physical plan) for DuckDB
+
+    :param engine: the pipeline SQLite engine, used by the `sqlite` backend
+    """
+    if get_analytics_backend() == "duckdb":
+        conn = connect_duckdb(read_only=True)
+        try:
+            return "\n".join(
+                row[1] for row in conn.execute(f"EXPLAIN {sql}").fetchall()
+            )
+        finally:
+            conn.close()
+
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    # rows are (id, parent id, unused, detail), indent each step under its parent
+    depths = {0: 0}
+    lines = []
+    for step_id, parent_id, _, detail in rows:
+        depths[step_id] = depths.get(parent_id, 0) + 1
+        lines.append("  " * (depths[step_id] - 1) + detail)
+    return "\n".join(lines)
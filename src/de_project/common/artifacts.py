@@ -0,0 +1,122 @@
+"""Versioned columnar artifacts handed over between pipeline tasks (see `main_p4`)
+
+A task publishes its output dataset as an artifact and passes a reference to the next task
+(e.g. as an Airflow XCom), instead of the next task reading the database table back:
+
+{"name": "collisions_clean", "path": "<data>/staging/artifacts/collisions_clean/<hash>.arrow",
+ "hash": "<hash>", "rows": 1000}
+
+Artifacts are Arrow IPC files, uncompressed, so readers memory-map them instead of reading them.
+Each version is named after its content hash (SHA-256 of the file).
+
+A version is kept while it is referenced: the versions published or reused (by a skipped task)
+within the retention period (`ARTIFACT_RETENTION_HOURS`) are kept, so a concurrent or retried
+DAG run can still open the references it holds. The latest version is always kept.
+"""
+
+import pandas as pd
+import pyarrow as pa
+
+from de_project.common.config import get_artifact_retention_hours
+from de_project.common.dtypes import to_pandas_options
+from de_project.common.fingerprint import compute_file_hash
+from de_project.common.staging import get_staging_path
+
+from pathlib import Path
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+_SUFFIX = ".arrow"
+
+
+def get_artifacts_path() -> Path:
+    """Returns the path to the artifacts directory"""
+    return get_staging_path() / "artifacts"
+
+
+def _prune_versions(artifact_dir: Path, latest_path: Path) -> None:
+    """Removes the versions of an artifact last published or reused before the retention period,
+    but the latest version"""
+    expired_before = time.time() - get_artifact_retention_hours() * 3600
+    for path in artifact_dir.glob(f"*{_SUFFIX}"):
+        try:
+            expired = path != latest_path and path.stat().st_mtime < expired_before
+        except FileNotFoundError:
+            # removed by a concurrent publish
+            continue
+        if expired:
+            path.unlink(missing_ok=True)
+            logger.info(f"Removed artifact version {path}")
+
+
+def publish_artifact(df: pd.DataFrame, name: str) -> dict:
+    """Writes the dataset as a new version of an artifact. Returns the artifact reference"""
+    start = time.perf_counter()
+    artifact_dir = get_artifacts_path() / name
+    artifact_dir.mkdir(parents=True, exist_ok=True)
+
+    # write to a temporary file first, readers never see a partial file
+    tmp_path = artifact_dir / f".{os.getpid()}.tmp"
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+        artifact_hash = compute_file_hash(tmp_path)
+        artifact_path = artifact_dir / f"{artifact_hash}{_SUFFIX}"
+        os.replace(tmp_path, artifact_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    _prune_versions(artifact_dir, artifact_path)
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"[METRIC] Published artifact {name} ({len(df)} rows) "
+        f"version {artifact_hash[:12]} in {elapsed:.2f}s"
+    )
+    return {
+        "name": name,
+        "path": str(artifact_path),
+        "hash": artifact_hash,
+        "rows": len(df),
+    }
+
+
+def artifact_exists(artifact: dict) -> bool:
+    """Returns whether the artifact version of a reference still exists"""
+    return Path(artifact["path"]).exists()
+
+
+def retain_artifact(artifact: dict) -> None:
+    """Marks the artifact version of a reference as referenced now (e.g. by a skipped task),
+    it is kept for another retention period"""
+    os.utime(artifact["path"])
+
+
+def open_artifact(artifact: dict, columns: list[str] | None = None) -> pd.DataFrame:
+    """Returns the dataset of an artifact reference.
+
+    The file is memory-mapped, only the columns read are loaded from disk.
+    With the Arrow dtype backend (`ARROW_DTYPES`) the columns are backed by the mapped buffers,
+    with the numpy one they are copied into numpy arrays (`pyarrow.Table.to_pandas`).
+
+    :param columns=None: the subset of columns to read, all columns if None
+    """
+    start = time.perf_counter()
+    with pa.memory_map(artifact["path"]) as source:
+        table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        df = table.to_pandas(**to_pandas_options())
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"[METRIC] Opened artifact {artifact['name']} ({len(df)} rows) "
+        f"version {artifact['hash'][:12]} in {elapsed:.2f}s"
+    )
+    return df
@@ -0,0 +1,296 @@
+"""Bulk loading of datasets into SQLite database tables"""
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Connection, Engine, inspect
+
+from de_project.common.code_lookups import (
+    align_categories,
+    categorical_columns,
+    write_code_lookups,
+)
+from de_project.common.db import create_table_indexes
+from de_project.common.table_versions import record_table_versions
+
+from contextlib import contextmanager
+from typing import Iterator, Literal
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# PRAGMAs applied for the duration of a bulk load, restored afterwards
+LOAD_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "OFF",
+    "cache_size": -256_000,  # negative value: size in KiB, i.e. ~256MB
+    "temp_store": "MEMORY",
+    "mmap_size": 1024 * 1024 * 1024,
+}
+
+BATCH_SIZE = 50_000  # rows sent per `executemany` call
+
+# Same format SQLAlchemy uses to store DateTime values in SQLite
+_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _set_pragmas(conn: Connection, pragmas: dict) -> dict:
+    """Sets connection PRAGMAs. Returns the previous PRAGMA values"""
+    previous = {}
+    for name, value in pragmas.items():
+        previous[name] = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+        conn.exec_driver_sql(f"PRAGMA {name} = {value}")
+    # PRAGMAs are executed outside a transaction, close the one SQLAlchemy began
+    conn.commit()
+    return previous
+
+
+@contextmanager
+def bulk_load_connection(engine: Engine) -> Iterator[Connection]:
+    """Yields a database connection configured for bulk loads.
+
+    `LOAD_PRAGMAS` are applied before the transaction begins and restored afterwards.
+    Everything executed with the connection runs in a single transaction,
+    committed on exit (rolled back on error).
+    """
+    with engine.connect() as conn:
+        previous = _set_pragmas(conn, LOAD_PRAGMAS)
+        try:
+            with conn.begin():
+                yield conn
+        finally:
+            _set_pragmas(conn, previous)
+
+
+def _to_db_values(series: pd.Series) -> list:
+    """Returns the column values as python objects SQLite can store (None for nulls)"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # categorical values are stored as codes, labels in the code lookups
+        codes = series.cat.codes
+        if (codes < 0).any():
+            return codes.astype(object).where(codes >= 0, None).tolist()
+        return codes.tolist()
+
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in "biuf":
+        # numpy bool, int, float: no conversion needed, SQLite stores NaN as NULL
+        return series.tolist()
+
+    if series.dtype.kind == "M":
+        if not isinstance(series.dtype, np.dtype):
+            # Arrow backed timestamps: pyarrow strftime doesn't support `%f`
+            series = series.astype("datetime64[ns]")
+        series = series.dt.strftime(_DATETIME_FORMAT)
+
+    values = series.astype(object)
+    mask = values.isna()
+    if mask.any():
+        values = values.where(~mask, None)
+
+    return values.tolist()
+
+
+def _create_table(conn: Connection, df: pd.DataFrame, table_name: str) -> None:
+    """Creates the table from the dataset columns, categorical columns as integer codes"""
+    schema_df = df.head(0).assign(
+        **{col: pd.Series(dtype="int64") for col in categorical_columns(df)}
+    )
+    conn.exec_driver_sql(pd.io.sql.get_schema(schema_df, table_name, con=conn))
+
+
+def _execute_batches(
+    conn: Connection, df: pd.DataFrame, statement: str, batch_size: int
+) -> None:
+    """Executes the statement with the dataset rows as parameters, one batch at a time"""
+    # the DBAPI cursor runs within the connection transaction,
+    # without SQLAlchemy per-row parameters processing
+    cursor = conn.connection.driver_connection.cursor()
+    try:
+        for offset in range(0, len(df), batch_size):
+            batch = df.iloc[offset : offset + batch_size]
+            values = [_to_db_values(batch[col]) for col in batch.columns]
+            cursor.executemany(statement, zip(*values))
+    finally:
+        cursor.close()
+
+
+def _log_load_metric(action: str, rows: int, table_name: str, start: float) -> None:
+    elapsed = time.perf_counter() - start
+    rows_per_sec = rows / elapsed if elapsed else float("inf")
+    logger.info(
+        f"[METRIC] Bulk {action} {rows} rows into '{table_name}' "
+        f"in {elapsed:.2f}s ({rows_per_sec:.0f} rows/sec)"
+    )
+
+
+def bulk_insert(
+    conn: Connection,
+    df: pd.DataFrame,
+    table_name: str,
+    if_exists: Literal["replace", "append"] = "replace",
+    batch_size: int = BATCH_SIZE,
+    build_indexes: bool = True,
+) -> int:
+    """Inserts the dataset into a table with prepared `executemany` batches.
+
+    :param conn: a connection, usually from `bulk_load_connection`
+    :param if_exists="replace": "replace" drops and recreates the table from the dataset columns,
+        "append" inserts into the existing table (created if missing)
+    :param build_indexes=True: if True, the registered indexes of the table (`db.INDEXES`)
+        are built once the rows are inserted (dropped tables lose their indexes).
+        Loads in several inserts can build them after the last one, with `db.create_table_indexes`
+
+    Categorical columns are stored as integer codes, their categories as code lookups.
+    A new version of the table is recorded (`table_versions`).
+
+    Returns the number of inserted rows.
+    """
+    start = time.perf_counter()
+
+    if if_exists == "replace":
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {_quote(table_name)}")
+    cat_cols = categorical_columns(df)
+    if if_exists == "replace" or not inspect(conn).has_table(table_name):
+        _create_table(conn, df, table_name)
+    elif cat_cols:
+        # codes of the rows already in the table must keep their labels
+        df = align_categories(conn, df, table_name)
+    if if_exists == "replace" or cat_cols:
+        write_code_lookups(conn, df, table_name)
+
+    columns = ", ".join(_quote(col) for col in df.columns)
+    placeholders = ", ".join("?" for _ in df.columns)
+    insert_stmt = (
+        f"INSERT INTO {_quote(table_name)} ({columns}) VALUES ({placeholders})"
+    )
+    _execute_batches(conn, df, insert_stmt, batch_size)
+    if build_indexes:
+        create_table_indexes(conn, table_name)
+    record_table_versions(conn, [table_name])
+
+    _log_load_metric("loaded", len(df), table_name, start)
+    return len(df)
+
+
+def bulk_upsert(
+    conn: Connection,
+    df: pd.DataFrame,
+    table_name: str,
+    key: str,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """Inserts the dataset rows into a table, replacing the stored rows with the same key.
+
+    :param conn: a connection, usually from `bulk_load_connection`
+    :param key: the column identifying rows, a unique index is created on it if missing
+        (the table must not hold duplicate keys)
+
+    The table is created from the dataset columns if missing,
+    with its registered indexes (`db.INDEXES`), before the rows are upserted.
+    Categorical columns are stored as integer codes, their categories as code lookups.
+
+    Returns the number of upserted rows.
+    """
+    start = time.perf_counter()
+
+    if not inspect(conn).has_table(table_name):
+        _create_table(conn, df, table_name)
+    if categorical_columns(df):
+        df = align_categories(conn, df, table_name)
+        write_code_lookups(conn, df, table_name)
+    create_table_indexes(conn, table_name)
+    # no-op for keys registered as unique
+    conn.exec_driver_sql(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {_quote(f'ux_{table_name}_{key}')} "
+        f"ON {_quote(table_name)} ({_quote(key)})"
+    )
+
+    columns = ", ".join(_quote(col) for col in df.columns)
+    placeholders = ", ".join("?" for _ in df.columns)
+    updates = ", ".join(
+        f"{_quote(col)} = excluded.{_quote(col)}" for col in df.columns if col != key
+    )
+    upsert_stmt = (
+        f"INSERT INTO {_quote(table_name)} ({columns}) VALUES ({placeholders}) "
+        f"ON CONFLICT ({_quote(key)}) DO UPDATE SET {updates}"
+    )
+    _execute_batches(conn, df, upsert_stmt, batch_size)
+    record_table_versions(conn, [table_name])
+
+    _log_load_metric("upserted", len(df), table_name, start)
+    return len(df)
+
+
+def bulk_delete(
+    conn: Connection,
+    df: pd.DataFrame,
+    table_name: str,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """Deletes the table rows matching the dataset rows on all the dataset columns
+    (usually the key columns, an index on them keeps each delete a lookup).
+
+    :param conn: a connection, usually from `bulk_load_connection`
+
+    A new version of the table is recorded (`table_versions`).
+
+    Returns the number of dataset rows.
+    """
+    start = time.perf_counter()
+
+    match = " AND ".join(f"{_quote(col)} = ?" for col in df.columns)
+    _execute_batches(
+        conn, df, f"DELETE FROM {_quote(table_name)} WHERE {match}", batch_size
+    )
+    record_table_versions(conn, [table_name])
+
+    _log_load_metric("deleted", len(df), table_name, start)
+    return len(df)
+
+
+def bulk_add_counts(
+    conn: Connection,
+    df: pd.DataFrame,
+    table_name: str,
+    keys: list[str],
+    count_column: str,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """Adds the dataset counts (positive or negative) to the stored counts of the same keys.
+    Rows with a missing key are inserted, stored rows left without a count are deleted.
+
+    :param conn: a connection, usually from `bulk_load_connection`
+    :param keys: the columns identifying rows, the table must hold a unique index on them
+        (see `db.INDEXES`)
+    :param count_column: the count column, the other dataset columns are keys
+
+    A new version of the table is recorded (`table_versions`).
+
+    Returns the number of dataset rows.
+    """
+    start = time.perf_counter()
+
+    df = df[[*keys, count_column]]
+    columns = ", ".join(_quote(col) for col in df.columns)
+    placeholders = ", ".join("?" for _ in df.columns)
+    count = _quote(count_column)
+    upsert_stmt = (
+        f"INSERT INTO {_quote(table_name)} ({columns}) VALUES ({placeholders}) "
+        f"ON CONFLICT ({', '.join(_quote(key) for key in keys)}) "
+        f"DO UPDATE SET {count} = {count} + excluded.{count}"
+    )
+    _execute_batches(conn, df, upsert_stmt, batch_size)
+    match = " AND ".join(f"{_quote(key)} = ?" for key in keys)
+    _execute_batches(
+        conn,
+        df[keys],
+        f"DELETE FROM {_quote(table_name)} WHERE {match} AND {count} <= 0",
+        batch_size,
+    )
+    record_table_versions(conn, [table_name])
+
+    _log_load_metric("merged counts of", len(df), table_name, start)
+    return len(df)
@@ -0,0 +1,93 @@
+"""Code lookups of categorical columns stored in the database
+
+Categorical (dictionary encoded) columns are stored as integer codes,
+the labels are kept once per column in the `code_lookups` table:
+
+table_name       | column_name        | code | label
+collisions_clean | collision_severity | 0    | Fatal
+collisions_clean | collision_severity | 1    | Serious
+"""
+
+import pandas as pd
+from sqlalchemy import Connection, text
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+CODE_LOOKUPS_TABLE = "code_lookups"
+
+
+def categorical_columns(df: pd.DataFrame) -> list[str]:
+    """Returns the names of the categorical columns of the dataset"""
+    return [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+
+
+def write_code_lookups(conn: Connection, df: pd.DataFrame, table_name: str) -> None:
+    """Replaces the code lookups of a table with the categories of the dataset columns"""
+    conn.execute(
+        text(f"DELETE FROM {CODE_LOOKUPS_TABLE} WHERE table_name = :table_name"),
+        {"table_name": table_name},
+    )
+
+    rows = [
+        {"table_name": table_name, "column_name": col, "code": code, "label": label}
+        for col in categorical_columns(df)
+        for code, label in enumerate(df[col].cat.categories)
+    ]
+    if rows:
+        conn.execute(
+            text(
+                f"INSERT INTO {CODE_LOOKUPS_TABLE} (table_name, column_name, code, label) "
+                "VALUES (:table_name, :column_name, :code, :label)"
+            ),
+            rows,
+        )
+    logger.info(f"Stored {len(rows)} code lookups of table '{table_name}'")
+
+
+def read_code_lookups(conn: Connection, table_name: str) -> dict[str, list]:
+    """Returns the categories of a table, by column name, ordered by code"""
+    result = conn.execute(
+        text(
+            f"SELECT column_name, label FROM {CODE_LOOKUPS_TABLE} "
+            "WHERE table_name = :table_name ORDER BY column_name, code"
+        ),
+        {"table_name": table_name},
+    )
+
+    lookups = {}
+    for column_name, label in result:
+        lookups.setdefault(column_name, []).append(label)
+    return lookups
+
+
+def align_categories(
+    conn: Connection, df: pd.DataFrame, table_name: str
+) -> pd.DataFrame:
+    """Returns the dataset with the categories of its categorical columns
+    aligned with the code lookups stored for the table.
+
+    Stored labels keep their codes, new labels are appended after them,
+    so rows already stored in the table keep decoding to the same labels.
+    """
+    lookups = read_code_lookups(conn, table_name)
+    aligned = {}
+    for col in categorical_columns(df):
+        stored = lookups.get(col)
+        if not stored or list(df[col].cat.categories) == stored:
+            continue
+        stored_set = set(stored)
+        new = [label for label in df[col].cat.categories if label not in stored_set]
+        aligned[col] = df[col].cat.set_categories(stored + new)
+    return df.assign(**aligned) if aligned else df
+
+
+def decode_categories(df: pd.DataFrame, lookups: dict[str, list]) -> pd.DataFrame:
+    """Returns the dataset with integer code columns decoded to categorical columns"""
+    for col, categories in lookups.items():
+        if col not in df.columns:
+            continue
+        codes = df[col].fillna(-1).astype("int64")
+        df[col] = pd.Categorical.from_codes(codes, categories=categories)
+    return df
@@ -1,5 +1,7 @@
 # env_vars.py
 from dotenv import load_dotenv
+from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 import os
 import logging
@@ -16,7 +18,10 @@ def is_runtime_local() -> bool:
     return os.environ.get("APP_RUNTIME") == "local"
 
 
+@lru_cache
 def find_project_root(start: Path | None = None) -> Path:
+    """Returns the closest directory with a pyproject.toml file, from `start` upward.
+    Cached: the file system is only walked once per `start` path"""
     current = start or Path(__file__).resolve()
 
     for parent in [current, *current.parents]:
@@ -32,3 +37,108 @@ def get_data_path() -> Path:
         return find_project_root() / "data"
     else:
         return Path(os.environ["PROJECT_DATA_DIR"])
+
+
+def get_ingest_chunk_size() -> int | None:
+    """Returns the number of rows per chunk for streaming ingestion.
+    None if streaming ingestion is disabled (default)"""
+    chunk_size = os.environ.get("INGEST_CHUNK_SIZE")
+    return int(chunk_size) if chunk_size else None
+
+
+def is_arrow_dtypes_enabled() -> bool:
+    """Returns whether datasets use Arrow backed data types instead of numpy ones"""
+    return os.environ.get("ARROW_DTYPES", "").lower() in ("1", "true")
+
+
+def is_copy_free_enabled() -> bool:
+    """Returns whether P2 transformations run copy-free (in place) instead of on copies"""
+    return os.environ.get("COPY_FREE_TRANSFORMS", "").lower() in ("1", "true")
+
+
+def is_incremental_enabled() -> bool:
+    """Returns whether P2 reprocesses only the collision years loaded since its last run
+    (ingestion batches, watermarks) instead of the whole upstream tables"""
+    return os.environ.get("INCREMENTAL_PROCESSING", "").lower() in ("1", "true")
+
+
+def is_partitioned_enabled() -> bool:
+    """Returns whether P2 clean / curate process the dataset per collision month
+    in a process pool, instead of as a whole in the current process"""
+    return os.environ.get("PARTITIONED_PROCESSING", "").lower() in ("1", "true")
+
+
+def get_partition_workers() -> int | None:
+    """Returns the number of P2 partition worker processes.
+    None (default) for the number of CPUs"""
+    workers = os.environ.get("PARTITION_WORKERS")
+    return int(workers) if workers else None
+
+
+def is_staging_enabled() -> bool:
+    """Returns whether datasets are staged as Parquet files between pipeline stages"""
+    return os.environ.get("STAGING_ENABLED", "").lower() in ("1", "true")
+
+
+def get_quality_datetime_range() -> tuple[datetime, datetime]:
+    """Returns the (min, max) collision datetime accepted by the clean layer quality check.
+    Defaults to 2023-01-01 - 2024-01-01, both included"""
+    start = os.environ.get("QUALITY_MIN_DATETIME") or "2023-01-01"
+    end = os.environ.get("QUALITY_MAX_DATETIME") or "2024-01-01"
+    return (datetime.fromisoformat(start), datetime.fromisoformat(end))
+
+
+def get_artifact_retention_hours() -> float:
+    """Returns for how long an artifact version is kept after its last publish or reuse,
+    in hours. Defaults to 24"""
+    retention = os.environ.get("ARTIFACT_RETENTION_HOURS")
+    return float(retention) if retention else 24.0
+
+
+def get_schema_validation_mode() -> str:
+    """Returns the P1 raw dataset validation mode: "full" (default) or "fast"
+    (vectorized coercion and null checks, pandera on a sample)"""
+    mode = os.environ.get("SCHEMA_VALIDATION") or "full"
+    if mode not in ("full", "fast"):
+        raise ValueError(f"Invalid SCHEMA_VALIDATION value: {mode}")
+    return mode
+
+
+def get_schema_sample_size() -> int:
+    """Returns the number of rows validated by pandera in fast validation mode
+    (per chunk when streaming). Defaults to 10000"""
+    sample_size = os.environ.get("SCHEMA_SAMPLE_SIZE")
+    return int(sample_size) if sample_size else 10_000
+
+
+def get_analytics_backend() -> str:
+    """Returns the P3 star schema analytical store: "sqlite" (default, the pipeline database)
+    or "duckdb" (embedded DuckDB database file)"""
+    backend = os.environ.get("ANALYTICS_BACKEND") or "sqlite"
+    if backend not in ("sqlite", "duckdb"):
+        raise ValueError(f"Invalid ANALYTICS_BACKEND value: {backend}")
+    return backend
+
+
+def get_calendar_years() -> tuple[int | None, int | None]:
+    """Returns the (first, last) year of the P3 generated date dimension.
+    None (default) for the first / last year of the collisions"""
+    first_year = os.environ.get("CALENDAR_FIRST_YEAR")
+    last_year = os.environ.get("CALENDAR_LAST_YEAR")
+    return (
+        int(first_year) if first_year else None,
+        int(last_year) if last_year else None,
+    )
+
+
+def get_db_pool_size() -> int:
+    """Returns the number of connections kept in the database engine pool. Defaults to 5"""
+    pool_size = os.environ.get("DB_POOL_SIZE")
+    return int(pool_size) if pool_size else 5
+
+
+def get_db_max_overflow() -> int:
+    """Returns the number of connections the database engine can open
+    beyond its pool size. Defaults to 10"""
+    max_overflow = os.environ.get("DB_MAX_OVERFLOW")
+    return int(max_overflow) if max_overflow else 10
@@ -2,6 +2,8 @@
 
 from sqlalchemy import (
     create_engine,
+    event,
+    Connection,
     Engine,
     MetaData,
     Column,
@@ -13,12 +15,101 @@ from sqlalchemy import (
     Boolean,
 )
 
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Any, Callable
 import logging
+import os
+import threading
+import time
 
 logger = logging.getLogger(__file__)
 
 
+@dataclass(frozen=True)
+class IndexDefinition:
+    """An index of a pipeline table"""
+
+    table_name: str
+    columns: tuple[str, ...]
+    unique: bool = False
+
+    @property
+    def name(self) -> str:
+        prefix = "ux" if self.unique else "ix"
+        return f"{prefix}_{self.table_name}_{'_'.join(self.columns)}"
+
+
+# Indexes of the pipeline tables, built after bulk loads.
+# Tables written with `if_exists="replace"` are recreated from the dataset columns,
+# so indexes are declared here rather than in the table definitions below.
+INDEXES = [
+    # unique keys
+    IndexDefinition("collisions_raw", ("collision_index",), unique=True),
+    IndexDefinition("collisions_clean", ("collision_id",), unique=True),
+    IndexDefinition("collisions_curated", ("collision_id",), unique=True),
+    IndexDefinition("collisions_dim_date", ("date_key",), unique=True),
+    IndexDefinition("collisions_dim_time", ("time_key",), unique=True),
+    IndexDefinition("collisions_dim_severity", ("severity_key",), unique=True),
+    IndexDefinition("collisions_dim_location", ("location_key",), unique=True),
+    IndexDefinition("collisions_fact", ("collision_key",), unique=True),
+    IndexDefinition(
+        "collisions_agg_hourly",
+        ("date_key", "hour", "severity_key", "location_key"),
+        unique=True,
+    ),
+    IndexDefinition("code_lookups", ("table_name", "column_name", "code"), unique=True),
+    # fact foreign keys
+    IndexDefinition("collisions_fact", ("date_key",)),
+    IndexDefinition("collisions_fact", ("time_key",)),
+    IndexDefinition("collisions_fact", ("severity_key",)),
+    IndexDefinition("collisions_fact", ("location_key",)),
+    # filters: replace by year (P1), reprocess by year (P2 incremental), quarantine lookups
+    IndexDefinition("collisions_raw", ("collision_year",)),
+    IndexDefinition("collisions_clean", ("collision_year",)),
+    IndexDefinition("collisions_curated", ("collision_year",)),
+    IndexDefinition("collisions_quarantine", ("run_id",)),
+    IndexDefinition("collisions_quarantine", ("quarantine_rule",)),
+]
+
+
+def get_table_indexes(table_name: str) -> list[IndexDefinition]:
+    """Returns the registered indexes of a table"""
+    return [index for index in INDEXES if index.table_name == table_name]
+
+
+def create_table_indexes(
+    conn: Connection, table_name: str, unique_only: bool = False
+) -> list[str]:
+    """Creates the registered indexes of a table, if missing.
+
+    Returns the names of the created indexes.
+
+    :param unique_only=False: if True, only the unique key indexes are created,
+        e.g. to look up keys while loading, before the other indexes are built
+    """
+    start = time.perf_counter()
+    indexes = [
+        index
+        for index in get_table_indexes(table_name)
+        if index.unique or not unique_only
+    ]
+    for index in indexes:
+        unique = "UNIQUE " if index.unique else ""
+        columns = ", ".join(f'"{col}"' for col in index.columns)
+        conn.exec_driver_sql(
+            f'CREATE {unique}INDEX IF NOT EXISTS "{index.name}" '
+            f'ON "{table_name}" ({columns})'
+        )
+
+    if indexes:
+        logger.info(
+            f"[METRIC] Built {len(indexes)} indexes of '{table_name}' "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+    return [index.name for index in indexes]
+
+
 def _create_collisions_raw_table(metadata: MetaData) -> Table:
     """Returns a new table: collisions_raw"""
     table = Table(
@@ -187,16 +278,102 @@ def _create_ingestion_metadata_table(metadata: MetaData) -> Table:
         "ingestion_metadata",
         metadata,
         Column("dataset_name", String),
-        Column("file_hash", Integer),
+        Column("file_hash", String),
+        # NULL for the plain SHA-256 hashes stored before the column existed
+        Column("hash_algorithm", String),
         Column("ingested_at", DateTime),
     )
     return ingestion_metadata_table
 
 
-from de_project.common.config import is_runtime_local, get_data_path
+def _create_code_lookups_table(metadata: MetaData) -> Table:
+    """Returns a new table: code_lookups"""
+    code_lookups_table = Table(
+        "code_lookups",
+        metadata,
+        Column("table_name", String, nullable=False),
+        Column("column_name", String, nullable=False),
+        Column("code", Integer, nullable=False),
+        Column("label", String),
+    )
+    return code_lookups_table
 
 
-def _create_db_url() -> str:
+def _create_pipeline_watermarks_table(metadata: MetaData) -> Table:
+    """Returns a new table: pipeline_watermarks"""
+    pipeline_watermarks_table = Table(
+        "pipeline_watermarks",
+        metadata,
+        Column("stage", String, primary_key=True),
+        Column("ingest_batch", Integer),
+        Column("updated_at", DateTime),
+    )
+    return pipeline_watermarks_table
+
+
+def _create_ingest_batches_table(metadata: MetaData) -> Table:
+    """Returns a new table: ingest_batches"""
+    ingest_batches_table = Table(
+        "ingest_batches",
+        metadata,
+        Column("batch_id", Integer, primary_key=True),
+        Column("collision_years", String),
+        Column("loaded_at", DateTime),
+        # batch ids are never reused
+        sqlite_autoincrement=True,
+    )
+    return ingest_batches_table
+
+
+def _create_analytics_table_versions_table(metadata: MetaData) -> Table:
+    """Returns a new table: analytics_table_versions"""
+    analytics_table_versions_table = Table(
+        "analytics_table_versions",
+        metadata,
+        Column("table_name", String, primary_key=True),
+        Column("version", String),
+        Column("updated_at", DateTime),
+    )
+    return analytics_table_versions_table
+
+
+def _create_pipeline_task_runs_table(metadata: MetaData) -> Table:
+    """Returns a new table: pipeline_task_runs"""
+    pipeline_task_runs_table = Table(
+        "pipeline_task_runs",
+        metadata,
+        Column("task", String, primary_key=True),
+        Column("input_hash", String),
+        Column("output", String),
+        Column("table_versions", String),
+        Column("updated_at", DateTime),
+    )
+    return pipeline_task_runs_table
+
+
+from de_project.common.config import (
+    is_runtime_local,
+    get_data_path,
+    get_db_max_overflow,
+    get_db_pool_size,
+)
+
+# Version of the tables defined above, stored in the database `PRAGMA user_version`.
+# Increase it when a table definition is added or changed,
+# so existing databases are bootstrapped again (missing tables created).
+SCHEMA_VERSION = 2
+
+# Engines by database URL, shared by the whole process
+_engines: dict[str, Engine] = {}
+_engines_pid = os.getpid()
+_engines_lock = threading.Lock()
+
+# Functions called with every new DBAPI connection, see `add_connect_hook`
+_connect_hooks: list[Callable[[Any], None]] = []
+
+
+def get_db_folder() -> Path:
+    """Returns the directory of the database files, created if missing"""
     # Declaring here for simplicity. Usually these are kept in config files
 
     if is_runtime_local():
@@ -205,32 +382,142 @@ def _create_db_url() -> str:
         db_folder = get_data_path() / "sqlite"
 
     db_folder.mkdir(parents=True, exist_ok=True)
-    db_path = db_folder / "data_engineering.db"
-    db_url = f"sqlite+pysqlite:///{db_path}"
+    return db_folder
+
+
+def _create_db_url() -> str:
+    db_path = get_db_folder() / "data_engineering.db"
+    return f"sqlite+pysqlite:///{db_path}"
+
+
+def add_connect_hook(hook: Callable[[Any], None]) -> None:
+    """Registers a function called with every new DBAPI connection of the engines,
+    before its first use, e.g. to set connection PRAGMAs.
 
-    logger.info(f"Using SQLite database at: {db_url}")
-    return db_url
+    Connections already in the engines pools are not affected.
+    """
+    _connect_hooks.append(hook)
+
+
+def _on_connect(dbapi_connection, connection_record) -> None:
+    for hook in _connect_hooks:
+        hook(dbapi_connection)
+
+
+def _create_metadata() -> MetaData:
+    """Returns the metadata of the pipeline tables"""
+    metadata = MetaData()
+    _create_collisions_raw_table(metadata)
+    _create_ingestion_metadata_table(metadata)
+    _create_collisions_clean_table(metadata)
+    _create_collisions_curated_table(metadata)
+    _create_code_lookups_table(metadata)
+    _create_pipeline_watermarks_table(metadata)
+    _create_ingest_batches_table(metadata)
+    _create_analytics_table_versions_table(metadata)
+    _create_pipeline_task_runs_table(metadata)
+    return metadata
+
+
+def _migrate_ingestion_metadata(conn: Connection, metadata: MetaData) -> None:
+    """Rebuilds the `ingestion_metadata` table of a database created before its `file_hash`
+    column was a string (declared `Integer`) and its `hash_algorithm` column existed.
+    The stored rows are kept, their hash algorithm is the plain SHA-256 one"""
+    rows = conn.exec_driver_sql("PRAGMA table_info(ingestion_metadata)").fetchall()
+    column_types = {row[1]: row[2].upper() for row in rows}
+    if column_types.get("file_hash") != "INTEGER" and "hash_algorithm" in column_types:
+        return
+
+    conn.exec_driver_sql(
+        "ALTER TABLE ingestion_metadata RENAME TO _ingestion_metadata_previous"
+    )
+    metadata.tables["ingestion_metadata"].create(conn)
+    conn.exec_driver_sql(
+        "INSERT INTO ingestion_metadata "
+        "(dataset_name, file_hash, hash_algorithm, ingested_at) "
+        "SELECT dataset_name, CAST(file_hash AS TEXT), 'sha256', ingested_at "
+        "FROM _ingestion_metadata_previous"
+    )
+    conn.exec_driver_sql("DROP TABLE _ingestion_metadata_previous")
+    logger.info(
+        "Migrated table ingestion_metadata: file_hash as string, hash_algorithm"
+    )
+
+
+def _bootstrap_schema(engine: Engine) -> None:
+    """Creates the missing pipeline tables, unless the database schema is up to date"""
+    with engine.begin() as conn:
+        user_version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        if user_version >= SCHEMA_VERSION:
+            logger.info(f"Database schema version {user_version} is up to date")
+            return
+
+        metadata = _create_metadata()
+        metadata.create_all(conn)
+        _migrate_ingestion_metadata(conn, metadata)
+        create_table_indexes(conn, "code_lookups")
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    logger.info(
+        f"Bootstrapped database schema from version {user_version} to {SCHEMA_VERSION}"
+    )
+
+
+def _new_engine(db_url: str, echo: bool) -> Engine:
+    engine = create_engine(
+        db_url,
+        echo=echo,
+        pool_size=get_db_pool_size(),
+        max_overflow=get_db_max_overflow(),
+    )
+    event.listen(engine, "connect", _on_connect)
+    _bootstrap_schema(engine)
+    return engine
 
 
 def create_db_engine(echo: bool = False) -> Engine:
-    """Creates a new database engine instance.
+    """Returns the database engine, created on the first call of the process.
+
+    The engine is shared by the process (one connection pool per database URL),
+    the schema is bootstrapped once per schema version (`SCHEMA_VERSION`).
+    Pool sizes are set with `DB_POOL_SIZE` / `DB_MAX_OVERFLOW`, see `add_connect_hook`
+    to configure the new connections.
 
     :param echo=False: if True, the Engine will log all statements
+        (applies when the engine is created)
     """
+    global _engines_pid
     db_url = _create_db_url()
 
-    try:
-        logging.info("Creating SQL engine")
-        metadata = MetaData()
-        _create_collisions_raw_table(metadata)
-        _create_ingestion_metadata_table(metadata)
-        _create_collisions_clean_table(metadata)
-        _create_collisions_curated_table(metadata)
-        engine = create_engine(db_url, echo=echo)
-        metadata.create_all(engine)
-    except Exception:
-        logging.error("Failed to create SQL engine")
-        raise
+    with _engines_lock:
+        if _engines_pid != os.getpid():
+            # forked process: the parent pooled connections must not be used
+            for engine in _engines.values():
+                engine.dispose(close=False)
+            _engines.clear()
+            _engines_pid = os.getpid()
+
+        engine = _engines.get(db_url)
+        if engine is not None:
+            return engine
+
+        try:
+            logging.info("Creating SQL engine")
+            logger.info(f"Using SQLite database at: {db_url}")
+            engine = _new_engine(db_url, echo)
+        except Exception:
+            logging.error("Failed to create SQL engine")
+            raise
+
+        _engines[db_url] = engine
 
     logging.info("Successfully created SQL engine")
     return engine
+
+
+def dispose_engines() -> None:
+    """Closes the connections of the process engines and forgets them"""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
@@ -0,0 +1,43 @@
+"""Pandas data types for the configured dtype backend (numpy or Arrow)
+
+By default datasets use numpy backed data types, as pandas does.
+With `ARROW_DTYPES=true`, datasets are read and kept with Arrow backed data types,
+which store strings (e.g. code labels) in compact Arrow buffers instead of python objects.
+"""
+
+import pandas as pd
+import pyarrow as pa
+
+from de_project.common.config import is_arrow_dtypes_enabled
+
+
+def read_options() -> dict:
+    """Returns the options of pandas read functions for the configured dtype backend"""
+    return {"dtype_backend": "pyarrow"} if is_arrow_dtypes_enabled() else {}
+
+
+def _arrow_types_mapper(pa_type: pa.DataType) -> pd.ArrowDtype | None:
+    # dictionary encoded columns are kept as pandas categorical columns
+    if pa.types.is_dictionary(pa_type):
+        return None
+    return pd.ArrowDtype(pa_type)
+
+
+def to_pandas_options() -> dict:
+    """Returns the options of `pyarrow.Table.to_pandas` for the configured dtype backend"""
+    return {"types_mapper": _arrow_types_mapper} if is_arrow_dtypes_enabled() else {}
+
+
+def string_dtype() -> str:
+    """Returns the string data type for the configured dtype backend"""
+    return "string[pyarrow]" if is_arrow_dtypes_enabled() else "string"
+
+
+def narrow_dtypes() -> dict[str, tuple[str, str]]:
+    """Returns the (wide, narrow) numeric data types for the configured dtype backend"""
+    if is_arrow_dtypes_enabled():
+        return {
+            "int": ("int64[pyarrow]", "int32[pyarrow]"),
+            "float": ("double[pyarrow]", "float[pyarrow]"),
+        }
+    return {"int": ("int64", "int32"), "float": ("float64", "float32")}
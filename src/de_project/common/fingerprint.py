@@ -0,0 +1,152 @@
+"""File content hashing with a fingerprint cache
+
+Files are hashed with a SHA-256 tree hash (`HASH_ALGORITHM`), stored along with its algorithm
+name, so hashes of another algorithm (e.g. the plain SHA-256 of `LEGACY_HASH_ALGORITHM`)
+are never compared with it.
+"""
+
+from de_project.common.config import get_data_path
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+import fcntl
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 64 * 1024 * 1024  # bytes hashed by a single worker (tree leaf)
+_READ_BLOCK_SIZE = 1024 * 1024
+
+# the tree hash depends on the chunk size, named after it
+HASH_ALGORITHM = "sha256-tree-64m"
+# plain SHA-256 of the whole file, stored by the ingestions before the tree hash
+LEGACY_HASH_ALGORITHM = "sha256"
+
+
+def _get_cache_path() -> Path:
+    """Returns the path to the fingerprint cache file"""
+    return get_data_path() / "cache" / "file-fingerprints.json"
+
+
+def _load_cache() -> dict:
+    cache_path = _get_cache_path()
+    try:
+        return json.loads(cache_path.read_text())
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        logger.warning(f"Ignoring corrupted fingerprint cache {cache_path}")
+        return {}
+
+
+@contextmanager
+def _cache_lock() -> Iterator[None]:
+    """Holds an exclusive lock on the fingerprint cache, across processes (`flock`).
+    Updates read, modify and write the cache under the lock, so none is lost"""
+    lock_path = _get_cache_path().with_suffix(".lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _save_cache(cache: dict) -> None:
+    # write to a temporary file first, so concurrent readers never see a partial file
+    cache_path = _get_cache_path()
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(cache, indent=2))
+    os.replace(tmp_path, cache_path)
+
+
+def _get_fingerprint(file_path: Path) -> dict:
+    """Returns the file fingerprint: size, modification time and inode"""
+    stat = file_path.stat()
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "inode": stat.st_ino,
+    }
+
+
+def _hash_chunk(file_path: Path, offset: int, size: int) -> bytes:
+    """Returns the SHA-256 digest of `size` bytes of a file starting at `offset`"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        file.seek(offset)
+        remaining = size
+        while remaining > 0:
+            block = file.read(min(_READ_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.digest()
+
+
+def compute_file_hash(file_path: Path, max_workers: int | None = None) -> str:
+    """Returns the SHA-256 tree hash of a file.
+
+    The file is split in chunks of `HASH_CHUNK_SIZE` bytes, hashed in parallel.
+    The result is the SHA-256 of the concatenated chunk digests.
+
+    :param max_workers=None: number of hashing threads, defaults to ThreadPoolExecutor default
+    """
+    size = file_path.stat().st_size
+    offsets = range(0, max(size, 1), HASH_CHUNK_SIZE)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        digests = executor.map(
+            lambda offset: _hash_chunk(file_path, offset, HASH_CHUNK_SIZE), offsets
+        )
+        return hashlib.sha256(b"".join(digests)).hexdigest()
+
+
+def compute_legacy_file_hash(file_path: Path) -> str:
+    """Returns the plain SHA-256 of a file (`LEGACY_HASH_ALGORITHM`), read sequentially"""
+    with open(file_path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def get_file_hash(file_path: Path) -> str:
+    """Returns the file hash (`HASH_ALGORITHM`), computed only if the file changed
+    since the last call.
+
+    Hashes are cached by file path and fingerprint (size, modification time and inode).
+    An unchanged file is not read at all.
+    """
+    file_path = file_path.resolve()
+    fingerprint = _get_fingerprint(file_path)
+
+    cache = _load_cache()
+    cached = cache.get(str(file_path))
+    if (
+        cached
+        and cached["fingerprint"] == fingerprint
+        and cached.get("hash_algorithm") == HASH_ALGORITHM
+    ):
+        logger.info(f"File unchanged since last hash, using cached hash: {file_path}")
+        return cached["file_hash"]
+
+    logger.info(f"Computing file hash: {file_path}")
+    file_hash = compute_file_hash(file_path)
+
+    # reload under the lock, entries may have been added by other processes meanwhile
+    with _cache_lock():
+        cache = _load_cache()
+        cache[str(file_path)] = {
+            "fingerprint": fingerprint,
+            "file_hash": file_hash,
+            "hash_algorithm": HASH_ALGORITHM,
+        }
+        _save_cache(cache)
+
+    return file_hash
@@ -0,0 +1,55 @@
+"""Quarantine of dataset rows rejected by quality checks
+
+Rejected rows are appended to a quarantine table with the rule they failed,
+the pipeline run id and the quarantine date:
+
+... dataset columns | quarantine_rule   | run_id   | quarantined_at
+...                 | in_range:latitude | 3f2a...  | 2024-05-01 10:00:00
+
+Categorical columns are stored as labels, not codes:
+the table accumulates rows of every run, whatever the categories of each run.
+"""
+
+import pandas as pd
+from sqlalchemy import Connection
+
+from de_project.common.bulk_load import bulk_insert
+from de_project.common.code_lookups import categorical_columns
+from de_project.common.dtypes import string_dtype
+
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+QUARANTINE_TABLE = "collisions_quarantine"
+
+
+def write_quarantine(
+    conn: Connection,
+    df_rejected: pd.DataFrame,
+    run_id: str,
+    table_name: str = QUARANTINE_TABLE,
+) -> int:
+    """Appends the rejected rows to the quarantine table, indexed by run id and rule.
+
+    :param conn: a connection, usually from `bulk_load_connection`,
+        so the rejected rows are written in the same transaction as the valid ones
+    :param df_rejected: the rejected rows, with a `quarantine_rule` column
+
+    Returns the number of quarantined rows.
+    """
+    df_rejected = df_rejected.assign(
+        **{
+            col: df_rejected[col].astype(string_dtype())
+            for col in categorical_columns(df_rejected)
+        },
+        run_id=run_id,
+        quarantined_at=pd.Timestamp(datetime.now()),
+    )
+    # the table is created on the first write, even without rejected rows,
+    # its `run_id` and `quarantine_rule` indexes are registered in `db.INDEXES`
+    rows = bulk_insert(conn, df_rejected, table_name, if_exists="append")
+
+    logger.info(f"[METRIC] Quarantined {rows} rows into '{table_name}' (run {run_id})")
+    return rows
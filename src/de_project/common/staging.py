@@ -0,0 +1,147 @@
+"""Columnar (Parquet) staging area for datasets handed over between pipeline stages.
+
+Each staged dataset mirrors a database table and is named after it,
+e.g. `collisions_clean` -> `<data>/staging/collisions_clean.parquet`.
+SQLite remains the serving store, the staging area only speeds up the reads of the next stage.
+"""
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Engine, MetaData, Table, select
+
+from de_project.common.config import get_data_path, is_staging_enabled
+from de_project.common.code_lookups import decode_categories, read_code_lookups
+from de_project.common.dtypes import read_options, to_pandas_options
+
+from pathlib import Path
+from typing import Iterable, Iterator
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION = "zstd"
+
+
+def get_staging_path() -> Path:
+    """Returns the path to the staging directory"""
+    return get_data_path() / "staging"
+
+
+def _get_stage_path(table_name: str) -> Path:
+    return get_staging_path() / f"{table_name}.parquet"
+
+
+def drop_stage(table_name: str) -> None:
+    """Removes the staged dataset, if any, so readers fall back to the database table"""
+    stage_path = _get_stage_path(table_name)
+    if stage_path.exists():
+        stage_path.unlink()
+        logger.info(f"Removed staged dataset {stage_path}")
+
+
+def write_stage(df: pd.DataFrame, table_name: str) -> None:
+    """Writes the dataset to the staging area.
+
+    If staging is disabled, the staged dataset is removed instead,
+    as it no longer matches the database table.
+    """
+    if not is_staging_enabled():
+        drop_stage(table_name)
+        return
+
+    stage_path = _get_stage_path(table_name)
+    stage_path.parent.mkdir(parents=True, exist_ok=True)
+    # write to a temporary file first, readers never see a partial file
+    tmp_path = stage_path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        df.to_parquet(tmp_path, index=False, compression=COMPRESSION)
+        os.replace(tmp_path, stage_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    logger.info(f"Staged dataset {table_name} ({len(df)} rows) at {stage_path}")
+
+
+def write_stage_chunks(
+    chunks: Iterable[pd.DataFrame], table_name: str
+) -> Iterator[pd.DataFrame]:
+    """Writes the dataset chunks to the staging area while passing them through.
+
+    The staged dataset is replaced once all chunks are written.
+    If staging is disabled, the staged dataset is removed instead.
+    """
+    if not is_staging_enabled():
+        drop_stage(table_name)
+        yield from chunks
+        return
+
+    stage_path = _get_stage_path(table_name)
+    stage_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = stage_path.with_suffix(f".{os.getpid()}.tmp")
+
+    writer = None
+    row_count = 0
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(
+                    tmp_path, table.schema, compression=COMPRESSION
+                )
+            writer.write_table(table.cast(writer.schema))
+            row_count += len(chunk)
+            yield chunk
+
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(tmp_path, stage_path)
+            logger.info(
+                f"Staged dataset {table_name} ({row_count} rows) at {stage_path}"
+            )
+    finally:
+        if writer is not None:
+            writer.close()
+        tmp_path.unlink(missing_ok=True)
+
+
+def read_dataset(
+    engine: Engine,
+    table_name: str,
+    columns: list[str] | None = None,
+    where_in: tuple[str, list] | None = None,
+) -> pd.DataFrame:
+    """Returns the dataset of a table.
+
+    Reads the staged dataset if staging is enabled and the dataset is staged,
+    the database table otherwise.
+    Categorical columns are categorical in both cases
+    (Parquet dictionary encoding or database code lookups).
+
+    :param columns=None: the subset of columns to read, all columns if None
+    :param where_in=None: a (column, values) pair, to read only the rows where column is in values
+    """
+    stage_path = _get_stage_path(table_name)
+    if is_staging_enabled() and stage_path.exists():
+        logger.info(f"Reading dataset {table_name} from staging area")
+        filters = None
+        if where_in is not None:
+            where_column, where_values = where_in
+            filters = [(where_column, "in", list(where_values))]
+        table = pq.read_table(stage_path, columns=columns, filters=filters)
+        return table.to_pandas(**to_pandas_options())
+
+    logger.info(f"Reading dataset from DB table '{table_name}'")
+    with engine.connect() as conn:
+        if where_in is None:
+            df = pd.read_sql_table(table_name, conn, columns=columns, **read_options())
+        else:
+            # the table definition types the values, as `read_sql_table` does
+            where_column, where_values = where_in
+            table = Table(table_name, MetaData(), autoload_with=conn)
+            selected = [table.c[col] for col in columns] if columns else [table]
+            query = select(*selected).where(table.c[where_column].in_(where_values))
+            df = pd.read_sql_query(query, conn, **read_options())
+        return decode_categories(df, read_code_lookups(conn, table_name))
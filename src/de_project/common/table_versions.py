@@ -0,0 +1,51 @@
+"""Versions of the database tables
+
+Every write of a table records a new version of the table in `analytics_table_versions`,
+in the same transaction (`bulk_load` for the SQLite tables, `analytics` for DuckDB):
+
+table_name       | version  | updated_at
+collisions_clean | 9c50a... | 2024-05-01 10:05:00.000000
+
+Readers compare versions to tell whether a table changed since they last read it,
+e.g. to serve cached query results or skip pipeline tasks.
+"""
+
+from sqlalchemy import Connection, Engine
+
+from datetime import datetime
+from typing import Iterable
+import uuid
+
+TABLE_VERSIONS_TABLE = "analytics_table_versions"
+
+UPSERT_VERSION = (
+    f"INSERT INTO {TABLE_VERSIONS_TABLE} (table_name, version, updated_at) "
+    "VALUES (?, ?, ?) "
+    "ON CONFLICT (table_name) DO UPDATE SET "
+    "version = excluded.version, updated_at = excluded.updated_at"
+)
+
+
+def new_versions(table_names: Iterable[str]) -> list[tuple[str, str, str]]:
+    """Returns new (table_name, version, updated_at) rows of the tables, a random version each"""
+    # same format SQLAlchemy uses to store DateTime values in SQLite
+    updated_at = datetime.now().isoformat(sep=" ", timespec="microseconds")
+    return [(name, uuid.uuid4().hex, updated_at) for name in table_names]
+
+
+def record_table_versions(conn: Connection, table_names: Iterable[str]) -> None:
+    """Records a new version of the SQLite tables, in the connection transaction"""
+    conn.exec_driver_sql(UPSERT_VERSION, new_versions(table_names))
+
+
+def read_table_versions(engine: Engine, table_names: list[str]) -> dict[str, str]:
+    """Returns the current version of the SQLite tables, by table name.
+    Tables never written with a version are missing"""
+    if not table_names:
+        return {}
+    query = (
+        f"SELECT table_name, version FROM {TABLE_VERSIONS_TABLE} "
+        f"WHERE table_name IN ({', '.join('?' for _ in table_names)})"
+    )
+    with engine.connect() as conn:
+        return dict(conn.exec_driver_sql(query, tuple(table_names)).fetchall())
@@ -0,0 +1,148 @@
+"""Last successful run of the pipeline tasks
+
+Each task records in the `pipeline_task_runs` table the input it processed last and its output:
+
+task  | input_hash | output                                    | table_versions                 | updated_at
+clean | 3f2a...    | {"name": "collisions_clean", "hash": ...} | {"collisions_clean": "9c5..."} | 2024-05-01 10:05:00.000000
+
+- input_hash: the hash of the task input, see `task_input_hash`: the upstream artifact hash,
+  the settings that change the task output and the task code version (`TASK_CODE_VERSION`)
+- output: the artifact reference the task returned (JSON), see `common.artifacts`
+- table_versions: the versions of the tables the task wrote (JSON), see `common.table_versions`
+
+A task run with the same input hash as the last successful run is skipped,
+its previous output is returned instead, unless its output artifact is missing
+or its tables were written since (e.g. by a manual pipeline run), see `run_task`.
+"""
+
+from sqlalchemy import Connection, Engine, text
+
+from de_project.common.artifacts import artifact_exists, retain_artifact
+
+from datetime import datetime
+from typing import Callable
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+TASK_RUNS_TABLE = "pipeline_task_runs"
+
+# version of the task code and table schemas, bump it when a change of the code
+# changes the task outputs, so the next runs don't skip the tasks
+TASK_CODE_VERSION = 1
+
+
+def task_input_hash(
+    upstream_hash: str | None, settings: dict | None = None
+) -> str | None:
+    """Returns the hash of a task input: the upstream hash, the task settings
+    and the task code version. None if the upstream hash is None (the task always runs)
+
+    :param upstream_hash: the content hash of the task input (e.g. the upstream artifact hash)
+    :param settings=None: the settings that change the task output, JSON serializable
+    """
+    if upstream_hash is None:
+        return None
+    task_input = {
+        "input": upstream_hash,
+        "settings": settings or {},
+        "code_version": TASK_CODE_VERSION,
+    }
+    encoded = json.dumps(task_input, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def get_task_run(conn: Connection, task: str) -> dict:
+    """Returns the last successful run of a task, an empty dictionary if the task never ran"""
+    row = conn.execute(
+        text(
+            f"SELECT input_hash, output, table_versions FROM {TASK_RUNS_TABLE} "
+            "WHERE task = :task"
+        ),
+        {"task": task},
+    ).first()
+
+    if row is None:
+        return {}
+    return {
+        "task": task,
+        "input_hash": row.input_hash,
+        "output": json.loads(row.output) if row.output else None,
+        "table_versions": json.loads(row.table_versions) if row.table_versions else {},
+    }
+
+
+def set_task_run(
+    conn: Connection,
+    task: str,
+    input_hash: str | None,
+    output: dict | None,
+    table_versions: dict[str, str] | None = None,
+) -> None:
+    """Inserts or replaces the last successful run of a task"""
+    conn.execute(
+        text(
+            f"INSERT INTO {TASK_RUNS_TABLE} "
+            "(task, input_hash, output, table_versions, updated_at) "
+            "VALUES (:task, :input_hash, :output, :table_versions, :updated_at) "
+            "ON CONFLICT (task) DO UPDATE SET "
+            "input_hash = excluded.input_hash, "
+            "output = excluded.output, "
+            "table_versions = excluded.table_versions, "
+            "updated_at = excluded.updated_at"
+        ),
+        {
+            "task": task,
+            "input_hash": input_hash,
+            "output": json.dumps(output) if output is not None else None,
+            "table_versions": json.dumps(table_versions or {}),
+            # same format SQLAlchemy uses to store DateTime values in SQLite
+            "updated_at": datetime.now().isoformat(sep=" ", timespec="microseconds"),
+        },
+    )
+
+
+def run_task(
+    engine: Engine,
+    task: str,
+    input_hash: str | None,
+    run: Callable[[], dict | None],
+    table_versions: Callable[[], dict[str, str]] | None = None,
+) -> dict | None:
+    """Runs a task, unless its input is the same as in its last successful run.
+    Returns the task output (an artifact reference or None)
+
+    A skipped task returns the output of its last successful run,
+    it runs anyway if that output artifact no longer exists
+    or its tables changed since its last run.
+
+    :param input_hash: the hash of the task input (`task_input_hash`), if None the task always runs
+    :param run: the task function, returns the task output
+    :param table_versions=None: returns the current versions of the tables the task writes
+    """
+    read_versions = table_versions or dict
+    with engine.connect() as conn:
+        last_run = get_task_run(conn, task)
+
+    if input_hash is not None and last_run.get("input_hash") == input_hash:
+        output = last_run["output"]
+        if output is not None and not artifact_exists(output):
+            logger.info(f"Task '{task}' output artifact is missing, running it again")
+        elif read_versions() != last_run["table_versions"]:
+            logger.info(
+                f"Task '{task}' tables changed since its last run, running it again"
+            )
+        else:
+            logger.info(f"Skip task '{task}': input unchanged since its last run")
+            if output is not None:
+                # referenced again, e.g. by the next tasks of this run
+                retain_artifact(output)
+            return output
+
+    output = run()
+    with engine.begin() as conn:
+        set_task_run(conn, task, input_hash, output, read_versions())
+    logger.info(f"[METRIC] Task '{task}' ran on input {str(input_hash)[:12]}")
+    return output
@@ -0,0 +1,99 @@
+"""Ingestion batches and watermarks of incremental pipeline stages
+
+Each load of `collisions_raw` records an ingestion batch in the `ingest_batches` table,
+in the load transaction. A load replaces all the rows of its collision years:
+
+batch_id | collision_years | loaded_at
+12       | [2022]          | 2024-05-01 10:00:00.123456
+
+Batch ids only increase, in ingestion order (not collision datetime order).
+Each stage records in the `pipeline_watermarks` table the last batch it processed:
+
+stage | ingest_batch | updated_at
+clean | 12           | 2024-05-01 10:05:00.000000
+
+The next run of the stage reprocesses the collision years of the later batches:
+late or corrected files (e.g. an older year loaded after a newer one) included,
+and the rows removed upstream are removed downstream as well.
+"""
+
+from sqlalchemy import Connection, text
+
+from datetime import datetime
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+INGEST_BATCHES_TABLE = "ingest_batches"
+WATERMARKS_TABLE = "pipeline_watermarks"
+
+
+def _format_datetime(value: datetime) -> str:
+    # same format SQLAlchemy uses to store DateTime values in SQLite
+    return value.isoformat(sep=" ", timespec="microseconds")
+
+
+def record_ingest_batch(conn: Connection, collision_years: list[int]) -> int:
+    """Records a load of `collisions_raw` replacing the collision years. Returns the batch id"""
+    batch_id = conn.execute(
+        text(
+            f"INSERT INTO {INGEST_BATCHES_TABLE} (collision_years, loaded_at) "
+            "VALUES (:collision_years, :loaded_at) RETURNING batch_id"
+        ),
+        {
+            "collision_years": json.dumps(
+                sorted(int(year) for year in collision_years)
+            ),
+            "loaded_at": _format_datetime(datetime.now()),
+        },
+    ).scalar_one()
+    logger.info(f"[METRIC] Ingest batch {batch_id}: collision years {collision_years}")
+    return batch_id
+
+
+def get_last_ingest_batch(conn: Connection) -> int | None:
+    """Returns the id of the last ingestion batch, None if none"""
+    return conn.execute(
+        text(f"SELECT MAX(batch_id) FROM {INGEST_BATCHES_TABLE}")
+    ).scalar()
+
+
+def get_batch_years(conn: Connection, after: int | None, until: int) -> list[int]:
+    """Returns the collision years loaded by the ingestion batches after `after`
+    (all batches if None), up to `until` included"""
+    rows = conn.execute(
+        text(
+            f"SELECT collision_years FROM {INGEST_BATCHES_TABLE} "
+            "WHERE batch_id > :after AND batch_id <= :until"
+        ),
+        {"after": after if after is not None else 0, "until": until},
+    ).scalars()
+    return sorted({year for years in rows for year in json.loads(years)})
+
+
+def get_watermark(conn: Connection, stage: str) -> int | None:
+    """Returns the last ingestion batch processed by a stage, None if the stage never ran"""
+    return conn.execute(
+        text(f"SELECT ingest_batch FROM {WATERMARKS_TABLE} WHERE stage = :stage"),
+        {"stage": stage},
+    ).scalar()
+
+
+def set_watermark(conn: Connection, stage: str, ingest_batch: int | None) -> None:
+    """Inserts or replaces the watermark of a stage"""
+    conn.execute(
+        text(
+            f"INSERT INTO {WATERMARKS_TABLE} (stage, ingest_batch, updated_at) "
+            "VALUES (:stage, :ingest_batch, :updated_at) "
+            "ON CONFLICT (stage) DO UPDATE SET "
+            "ingest_batch = excluded.ingest_batch, "
+            "updated_at = excluded.updated_at"
+        ),
+        {
+            "stage": stage,
+            "ingest_batch": ingest_batch,
+            "updated_at": _format_datetime(datetime.now()),
+        },
+    )
+    logger.info(f"[METRIC] Watermark of stage '{stage}': ingest batch {ingest_batch}")
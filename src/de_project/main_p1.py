@@ -1,40 +1,130 @@
 """ETL pipeline - local file batch ingestion"""
 
 from de_project.common.logging_config import setup_logging
-from de_project.project_p1_p2.ingest.extract import read_csv_file
-from de_project.project_p1_p2.ingest.load import load_csv_file, load_data
-from de_project.project_p1_p2.ingest.transform import transform
+from de_project.project_p1_p2.ingest.extract import read_csv_file, read_csv_file_chunks
+from de_project.project_p1_p2.ingest.load import (
+    count_loaded_rows,
+    iter_load_data_chunks,
+    load_csv_file,
+    load_csv_file_chunks,
+    load_data_by_year,
+)
+from de_project.project_p1_p2.ingest.transform import transform, transform_chunk
 from de_project.project_p1_p2.ingest.metadata import (
     create_ingestion_metadata,
     get_ingested_metadata,
     load_metadata,
     validate_metadata,
 )
+from de_project.common.artifacts import publish_artifact
 from de_project.common.db import create_db_engine
-from de_project.common.config import get_data_path, load_env
+from de_project.common.fingerprint import get_file_hash
+from de_project.common.staging import (
+    drop_stage,
+    read_dataset,
+    write_stage,
+    write_stage_chunks,
+)
+from de_project.common.table_versions import read_table_versions
+from de_project.common.task_runs import run_task, task_input_hash
+from de_project.common.config import (
+    get_data_path,
+    get_ingest_chunk_size,
+    is_arrow_dtypes_enabled,
+    load_env,
+)
 
+import pandas as pd
+from sqlalchemy import Engine
 
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Iterator
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
 load_env()
 
+RAW_DATA_FILE_PATTERN = "dft-road-casualty-statistics-collision-*.csv"
+
+
+def _ingest(
+    engine: Engine, raw_file_path: Path, clean_file_path: Path
+) -> pd.DataFrame | None:
+    """Reads, transforms and loads the whole raw file at once, replacing the rows
+    of its collision years. Returns the loaded dataset, None if the table holds other years too
+    """
+    raw_df = read_csv_file(raw_file_path)
+    df = transform(raw_df)
+    load_data_by_year(df, engine)
+    load_csv_file(clean_file_path, df)
+    if count_loaded_rows(engine) != len(df):
+        # the dataset is not the whole table (e.g. other files ingested by `main_all`)
+        drop_stage("collisions_raw")
+        return None
+    write_stage(df, "collisions_raw")
+    return df
+
+
+def _ingest_streaming(
+    engine: Engine, raw_file_path: Path, clean_file_path: Path, chunk_size: int
+) -> None:
+    """Reads, transforms and loads the raw file one chunk at a time,
+    replacing the rows of its collision years.
+
+    Only one chunk is kept in memory, so peak memory does not depend on the file size.
+    Duplicates across chunks are dropped by the database load, before the chunk is staged
+    and written to the clean file. Both are replaced once the load is committed.
+    """
+    row_count = 0
+
+    def counted(chunks: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        nonlocal row_count
+        for chunk in chunks:
+            row_count += len(chunk)
+            yield chunk
+
+    transformed_chunks = (
+        transform_chunk(raw_chunk)
+        for raw_chunk in read_csv_file_chunks(raw_file_path, chunk_size)
+    )
+    loaded_chunks = counted(iter_load_data_chunks(transformed_chunks, engine))
+    load_csv_file_chunks(
+        clean_file_path, write_stage_chunks(loaded_chunks, "collisions_raw")
+    )
+    if count_loaded_rows(engine) != row_count:
+        # the staged file is not the whole table (e.g. other files ingested by `main_all`)
+        drop_stage("collisions_raw")
+
 
-def main() -> None:
+def get_raw_file_path() -> Path:
+    """Returns the path to the raw file ingested by `ingest`"""
+    RAW_DATA_FILE = "dft-road-casualty-statistics-collision-2023.csv"
+    return get_data_path() / "raw" / RAW_DATA_FILE
+
+
+def ingest(chunk_size: int | None = None) -> pd.DataFrame | None:
     """ETL pipeline
     - Read a local CSV file
     - Transform, Validate the data
     - Load the clean data info a CSV file
-    - Load the data into a local SQLite DB
+    - Load the data into a local SQLite DB, replacing only the rows of the file collision years
+      (the rows of other years, e.g. ingested by `main_all`, are kept)
+
+    Returns the loaded dataset, None if the file was streamed, the ingestion skipped
+    or the table holds other collision years too.
+
+    :param chunk_size=None: if set, the CSV file is streamed in chunks of `chunk_size` rows.
+        Defaults to `INGEST_CHUNK_SIZE` env var. If none is set, the file is read at once.
     """
 
+    chunk_size = chunk_size or get_ingest_chunk_size()
+
     DATA_PATH = get_data_path()
 
-    RAW_DATA_FILE = "dft-road-casualty-statistics-collision-2023.csv"
-    RAW_DATA_FILE_PATH = DATA_PATH / "raw" / RAW_DATA_FILE
+    RAW_DATA_FILE_PATH = get_raw_file_path()
 
     CLEAN_DATA_FILE = "dft-road-casualty-statistics-collision-2023-clean.csv"
     CLEAN_DATA_FILE_PATH = DATA_PATH / "processed" / CLEAN_DATA_FILE
@@ -50,21 +140,26 @@ def main() -> None:
         new_metadata = create_ingestion_metadata(RAW_DATA_FILE_PATH)
 
         current_metadata = get_ingested_metadata(engine, RAW_DATA_FILE_PATH)
-        (valid_metadata, need_replacement) = validate_metadata(
+        valid_metadata, need_replacement = validate_metadata(
             new_metadata, current_metadata
         )
 
         if valid_metadata and need_replacement:
-            raw_df = read_csv_file(RAW_DATA_FILE_PATH)
-            df = transform(raw_df)
-            load_data(df, engine)
+            df = None
+            if chunk_size:
+                _ingest_streaming(
+                    engine, RAW_DATA_FILE_PATH, CLEAN_DATA_FILE_PATH, chunk_size
+                )
+            else:
+                df = _ingest(engine, RAW_DATA_FILE_PATH, CLEAN_DATA_FILE_PATH)
             load_metadata(engine, new_metadata)
-            load_csv_file(CLEAN_DATA_FILE_PATH, df)
             logger.info("ETL pipeline finished successfully")
+            return df
         elif valid_metadata and not need_replacement:
             logger.info(
                 f"Skip ETL pipeline. The dataset already exists {valid_metadata}"
             )
+            return None
         else:
             logger.error("Failed to validate ingestion metadata")
             raise Exception("Invalid ingestion metadata")
@@ -73,5 +168,118 @@ def main() -> None:
         raise
 
 
+def main(chunk_size: int | None = None) -> None:
+    """ETL pipeline for the raw file, see `ingest`"""
+    ingest(chunk_size)
+
+
+def ingest_artifact() -> dict:
+    """Runs `ingest` and publishes the raw dataset as an artifact (see `main_p4`).
+    Returns the artifact reference
+
+    Skipped if the raw file, the dtype backend and the `collisions_raw` table
+    are unchanged since the last successful run.
+    """
+    engine = create_db_engine(echo=False)
+
+    def run() -> dict:
+        df = ingest()
+        if df is None:
+            # streamed, already ingested or not the whole table: read the table
+            df = read_dataset(engine, "collisions_raw")
+        return publish_artifact(df, "collisions_raw")
+
+    input_hash = task_input_hash(
+        get_file_hash(get_raw_file_path()),
+        {"arrow_dtypes": is_arrow_dtypes_enabled()},
+    )
+    return run_task(
+        engine,
+        "ingest",
+        input_hash,
+        run,
+        lambda: read_table_versions(engine, ["collisions_raw"]),
+    )
+
+
+def _read_and_transform(raw_file_path: Path) -> pd.DataFrame:
+    """Reads and transforms a raw file. Executed in a worker process"""
+    raw_df = read_csv_file(raw_file_path)
+    return transform(raw_df)
+
+
+def main_all(max_workers: int | None = None) -> None:
+    """ETL pipeline for all raw files (e.g. one file per collision year)
+    - Find every raw CSV file in /data/raw
+    - Hash the files in parallel, keep only the new or changed ones
+    - Read, transform and validate the changed files in parallel
+    - Load each dataset into a local SQLite DB, one file at a time
+    - Load the clean data into a CSV file per raw file
+
+    :param max_workers=None: number of worker processes, defaults to the number of CPUs
+    """
+
+    DATA_PATH = get_data_path()
+    RAW_DATA_FILE_PATHS = sorted((DATA_PATH / "raw").glob(RAW_DATA_FILE_PATTERN))
+
+    logger.info(f"Multi-file ETL pipeline started for {len(RAW_DATA_FILE_PATHS)} files")
+
+    try:
+        engine = create_db_engine(echo=False)
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            new_metadata_list = executor.map(
+                create_ingestion_metadata, RAW_DATA_FILE_PATHS
+            )
+
+            changed_files = {}
+            for raw_file_path, new_metadata in zip(
+                RAW_DATA_FILE_PATHS, new_metadata_list
+            ):
+                current_metadata = get_ingested_metadata(engine, raw_file_path)
+                valid_metadata, need_replacement = validate_metadata(
+                    new_metadata, current_metadata
+                )
+
+                if valid_metadata and need_replacement:
+                    changed_files[raw_file_path] = new_metadata
+                elif valid_metadata and not need_replacement:
+                    logger.info(
+                        f"Skip file. The dataset already exists {valid_metadata}"
+                    )
+                else:
+                    logger.error(
+                        f"Failed to validate ingestion metadata {raw_file_path}"
+                    )
+                    raise Exception("Invalid ingestion metadata")
+
+            futures = {
+                executor.submit(_read_and_transform, raw_file_path): raw_file_path
+                for raw_file_path in changed_files
+            }
+
+            # The staged raw dataset would miss the rows of the other files
+            if futures:
+                drop_stage("collisions_raw")
+
+            # Only the database writes are serialized, in the order the files are ready
+            for future in as_completed(futures):
+                # the future holds the transformed dataset, released once loaded
+                raw_file_path = futures.pop(future)
+                df = future.result()
+                load_data_by_year(df, engine)
+                load_metadata(engine, changed_files[raw_file_path])
+                load_csv_file(
+                    DATA_PATH / "processed" / f"{raw_file_path.stem}-clean.csv", df
+                )
+                logger.info(f"Ingested file {raw_file_path.name}")
+                del df, future
+
+        logger.info("Multi-file ETL pipeline finished successfully")
+    except Exception:
+        logger.exception("Multi-file ETL pipeline failed")
+        raise
+
+
 if __name__ == "__main__":
     main()
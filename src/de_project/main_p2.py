@@ -1,80 +1,321 @@
 """Batch Transformation and Data Quality Pipeline"""
 
 import pandas as pd
-from sqlalchemy import Engine
+from sqlalchemy import Connection, Engine, bindparam, text
 
 from de_project.common.logging_config import setup_logging
+from de_project.common.config import (
+    get_partition_workers,
+    get_quality_datetime_range,
+    is_arrow_dtypes_enabled,
+    is_copy_free_enabled,
+    is_incremental_enabled,
+    is_partitioned_enabled,
+    load_env,
+)
+from de_project.common.artifacts import open_artifact, publish_artifact
+from de_project.common.bulk_load import bulk_insert, bulk_load_connection, bulk_upsert
 from de_project.common.db import create_db_engine
-from de_project.project_p1_p2.transform.clean import clean
+from de_project.common.quarantine import write_quarantine
+from de_project.common.staging import drop_stage, read_dataset, write_stage
+from de_project.common.table_versions import read_table_versions
+from de_project.common.task_runs import run_task, task_input_hash
+from de_project.common.watermarks import (
+    get_batch_years,
+    get_last_ingest_batch,
+    get_watermark,
+    set_watermark,
+)
+from de_project.project_p1_p2.transform.clean import clean_with_rejected
 from de_project.project_p1_p2.transform.curated import curate
+from de_project.project_p1_p2.transform.partitioned import (
+    clean_partitioned,
+    curate_partitioned,
+)
 
+from typing import Callable
 import logging
+import uuid
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
+load_env()
 
-def clean_dataset(engine: Engine) -> None:
+UPSERT_KEY = "collision_id"
+# upstream loads replace whole collision years, the stages reprocess them by year
+REPROCESS_COLUMN = "collision_year"
+
+
+def _plan_stage(
+    engine: Engine, stage: str, upstream_batch: int | None
+) -> tuple[bool, list[int] | None]:
+    """Returns whether the stage has to run, and the collision years to reprocess.
+
+    The years are None when the stage processes all rows and replaces its table:
+    incremental processing disabled or the stage never ran.
+    In incremental mode, the years are the ones loaded by the ingestion batches
+    after the stage watermark, up to `upstream_batch`: the stage is skipped if there are none.
+    """
+    if not is_incremental_enabled():
+        return (True, None)
+
+    with engine.connect() as conn:
+        watermark = get_watermark(conn, stage)
+        if watermark is None:
+            logger.info(f"No watermark for stage '{stage}', processing all rows")
+            return (True, None)
+        if upstream_batch is None or upstream_batch <= watermark:
+            return (False, None)
+        years = get_batch_years(conn, watermark, upstream_batch)
+
+    logger.info(
+        f"Incremental stage '{stage}': reprocessing collision years {years} "
+        f"of ingest batches {watermark + 1} to {upstream_batch}"
+    )
+    return (True, years)
+
+
+def _read_upstream(
+    engine: Engine, table_name: str, years: list[int] | None
+) -> pd.DataFrame:
+    """Returns the upstream table rows of the collision years, all rows if None"""
+    if years is None:
+        return read_dataset(engine, table_name)
+    df = read_dataset(engine, table_name, where_in=(REPROCESS_COLUMN, years))
+    logger.info(f"[METRIC] Read {len(df)} rows from '{table_name}' of years {years}")
+    return df
+
+
+def _delete_years(conn: Connection, table_name: str, years: list[int]) -> None:
+    """Deletes the table rows of the collision years, before they are reprocessed"""
+    delete_years = text(
+        f"DELETE FROM {table_name} WHERE {REPROCESS_COLUMN} IN :years"
+    ).bindparams(bindparam("years", years, expanding=True))
+    deleted = conn.execute(delete_years).rowcount
+    logger.info(f"- Deleted {deleted} rows of years {years} from '{table_name}'")
+
+
+def clean_dataset(
+    engine: Engine, df_raw: pd.DataFrame | None = None
+) -> pd.DataFrame | None:
     """ETL clean pipeline.
 
     Reads dataset from `collisions_raw` table.
     Cleans the dataset.
-    Writes cleaned dataset to `collisions_clean` table.
+    Writes cleaned dataset to `collisions_clean` table
+    and the rejected rows to `collisions_quarantine` table, in a single transaction.
+
+    In incremental mode, only the collision years loaded into `collisions_raw` since the last run
+    (ingestion batches after the `clean` watermark) are cleaned: their rows in `collisions_clean`
+    are deleted and the cleaned rows upserted. Skipped if nothing was ingested since the last run.
+
+    Returns the cleaned dataset if it replaced the table, None otherwise.
+
+    :param df_raw=None: the raw dataset, if already in memory. Not read from the table then,
+        unless only some collision years are cleaned
     """
 
     logger.info("Start ETL pipeline clean phase...")
     try:
         with engine.connect() as conn:
-            logger.info("Reading dataset from DB table 'collisions_raw'")
-            df = pd.read_sql_table("collisions_raw", conn)
+            ingest_batch = get_last_ingest_batch(conn)
+        run, years = _plan_stage(engine, "clean", ingest_batch)
+        if not run:
+            logger.info("Skip ETL pipeline clean phase: no new ingested dataset")
+            return None
+
+        run_id = uuid.uuid4().hex
+        logger.info(f"ETL pipeline clean phase run id: {run_id}")
+        if years is None and df_raw is not None:
+            df = df_raw
+        else:
+            df = _read_upstream(engine, "collisions_raw", years)
+
+        if years is not None and df.empty:
+            # the years have no rows left upstream
+            with engine.begin() as conn:
+                _delete_years(conn, "collisions_clean", years)
+                set_watermark(conn, "clean", ingest_batch)
+            drop_stage("collisions_clean")
+            logger.info("No rows to clean")
+            return None
+
+        if is_partitioned_enabled():
+            df, df_rejected = clean_partitioned(df, get_partition_workers())
+        else:
+            # the dataset read is not used afterwards, it can be cleaned in place
+            df, df_rejected = clean_with_rejected(df, copy=not is_copy_free_enabled())
 
-            df = clean(df)
+        logger.info(
+            "Loading cleaned dataset into 'collisions_clean' DB table "
+            "and rejected rows into 'collisions_quarantine' DB table"
+        )
+        with bulk_load_connection(engine) as conn:
+            if years is None:
+                bulk_insert(conn, df, "collisions_clean", if_exists="replace")
+            else:
+                _delete_years(conn, "collisions_clean", years)
+                bulk_upsert(conn, df, "collisions_clean", key=UPSERT_KEY)
+            write_quarantine(conn, df_rejected, run_id)
+            set_watermark(conn, "clean", ingest_batch)
 
-            logger.info("Loading cleaned dataset into 'collisions_clean' DB table")
-            df.to_sql(
-                "collisions_clean",
-                conn,
-                if_exists="replace",
-                index=False,
-            )
+        if years is None:
+            write_stage(df, "collisions_clean")
+        else:
+            # the staged dataset would miss the reprocessed years
+            drop_stage("collisions_clean")
 
     except Exception:
         logger.error("ETL clean pipeline phase failed")
         raise
 
     logger.info("Successfully executed ETL pipeline clean phase")
+    return df if years is None else None
 
 
-def curate_dataset(engine: Engine) -> None:
+def curate_dataset(
+    engine: Engine, df_clean: pd.DataFrame | None = None
+) -> pd.DataFrame | None:
     """ETL curated pipeline.
 
     Reads dataset from `collisions_clean` table.
     Derives business data.
     Writes cleaned dataset to `collisions_curated` table.
+
+    In incremental mode, only the collision years cleaned since the last run
+    (ingestion batches after the `curate` watermark, up to the `clean` one) are curated:
+    their rows in `collisions_curated` are deleted and the curated rows upserted.
+    Skipped if the clean phase processed nothing new.
+
+    Returns the curated dataset if it replaced the table, None otherwise.
+
+    :param df_clean=None: the clean dataset, if already in memory. Not read from the table then,
+        unless only some collision years are curated
     """
 
     logger.info("Start ETL pipeline curated phase...")
 
     try:
         with engine.connect() as conn:
-            logger.info("Reading dataset from DB table 'collisions_clean'")
-            df_clean = pd.read_sql_table(table_name="collisions_clean", con=conn)
+            ingest_batch = get_watermark(conn, "clean")
+        run, years = _plan_stage(engine, "curate", ingest_batch)
+        if not run:
+            logger.info("Skip ETL pipeline curated phase: no new cleaned dataset")
+            return None
+
+        if years is not None or df_clean is None:
+            df_clean = _read_upstream(engine, "collisions_clean", years)
+
+        if years is not None and df_clean.empty:
+            with engine.begin() as conn:
+                _delete_years(conn, "collisions_curated", years)
+                set_watermark(conn, "curate", ingest_batch)
+            drop_stage("collisions_curated")
+            logger.info("No rows to curate")
+            return None
 
-            df_curated = curate(df_clean)
+        if is_partitioned_enabled():
+            df_curated = curate_partitioned(df_clean, get_partition_workers())
+        else:
+            df_curated = curate(df_clean, copy=not is_copy_free_enabled())
 
-            logger.info("Loading cleaned dataset into 'collisions_curated' DB table")
-            df_curated.to_sql(
-                "collisions_curated",
-                conn,
-                if_exists="replace",
-                index=False,
-            )
+        logger.info("Loading cleaned dataset into 'collisions_curated' DB table")
+        with bulk_load_connection(engine) as conn:
+            if years is None:
+                bulk_insert(conn, df_curated, "collisions_curated", if_exists="replace")
+            else:
+                _delete_years(conn, "collisions_curated", years)
+                bulk_upsert(conn, df_curated, "collisions_curated", key=UPSERT_KEY)
+            set_watermark(conn, "curate", ingest_batch)
+
+        if years is None:
+            write_stage(df_curated, "collisions_curated")
+        else:
+            # the staged dataset would miss the reprocessed years
+            drop_stage("collisions_curated")
 
     except Exception:
         logger.error("ETL curated pipeline phase failed")
         raise
 
     logger.info("Successfully executed ETL pipeline curated phase")
+    return df_curated if years is None else None
+
+
+# The same phases as `main`, as separate tasks (see `main_p4`),
+# the datasets are handed over as artifacts, by reference
+
+
+def _publish(df: pd.DataFrame | None, name: str) -> dict | None:
+    # in incremental mode the phases hand over nothing, the next one reads its table
+    return publish_artifact(df, name) if df is not None else None
+
+
+def _task_settings() -> dict:
+    # the settings that change the clean and curated datasets
+    return {
+        "incremental": is_incremental_enabled(),
+        "partitioned": is_partitioned_enabled(),
+        "arrow_dtypes": is_arrow_dtypes_enabled(),
+    }
+
+
+def _run_phase_task(
+    engine: Engine,
+    task: str,
+    artifact: dict | None,
+    settings: dict,
+    run: Callable[[], dict | None],
+    table: str,
+) -> dict | None:
+    # skipped unless the upstream artifact, the settings or the phase table changed
+    input_hash = task_input_hash(
+        artifact["hash"] if artifact is not None else None, settings
+    )
+    return run_task(
+        engine, task, input_hash, run, lambda: read_table_versions(engine, [table])
+    )
+
+
+def clean_artifact(artifact: dict | None) -> dict | None:
+    """Runs the clean phase on the raw artifact, publishes the cleaned dataset as an artifact.
+    Returns the artifact reference, None in incremental mode (see `clean_dataset`)
+
+    Skipped if the raw artifact, the clean settings (e.g. the quality datetime range)
+    and the `collisions_clean` table are unchanged since the last successful run.
+    """
+    engine = create_db_engine(echo=False)
+
+    def run() -> dict | None:
+        df_raw = open_artifact(artifact) if artifact is not None else None
+        return _publish(clean_dataset(engine, df_raw), "collisions_clean")
+
+    min_datetime, max_datetime = get_quality_datetime_range()
+    settings = {
+        **_task_settings(),
+        "min_datetime": min_datetime.isoformat(),
+        "max_datetime": max_datetime.isoformat(),
+    }
+    return _run_phase_task(engine, "clean", artifact, settings, run, "collisions_clean")
+
+
+def curate_artifact(artifact: dict | None) -> dict | None:
+    """Runs the curated phase on the clean artifact, publishes the curated dataset
+    as an artifact. Returns the artifact reference, None in incremental mode
+
+    Skipped if the clean artifact, the curated settings
+    and the `collisions_curated` table are unchanged since the last successful run.
+    """
+    engine = create_db_engine(echo=False)
+
+    def run() -> dict | None:
+        df_clean = open_artifact(artifact) if artifact is not None else None
+        return _publish(curate_dataset(engine, df_clean), "collisions_curated")
+
+    return _run_phase_task(
+        engine, "curate", artifact, _task_settings(), run, "collisions_curated"
+    )
 
 
 def main():
@@ -82,10 +323,16 @@ def main():
 
     - Reads dataset from collisions_raw table
     - Applies `clean` transformation
-    - Writes dataset to collisions_clean table
+    - Writes dataset to collisions_clean table, rejected rows to collisions_quarantine table
     - Reads dataset from collisions_clean table
     - Applies `curated` transformation
     - Writes dataset to collisions_curated table
+
+    With `INCREMENTAL_PROCESSING=true`, each phase reprocesses only the collision years
+    loaded since its last run (ingestion batches, watermarks in pipeline_watermarks table)
+
+    With `PARTITIONED_PROCESSING=true`, each phase processes the collision months
+    in parallel worker processes (`PARTITION_WORKERS`)
     """
 
     engine = create_db_engine(echo=False)  # True = display sqlalchemy logs
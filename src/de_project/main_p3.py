@@ -1,4 +1,13 @@
-"""Main entry point to analytical data modeling"""
+"""Main entry point to analytical data modeling
+
+Reads `collisions_curated`, models it as a star schema (fact, dimensions and hourly aggregate),
+validates the datasets (not null, unique keys), loads them into the analytical store
+and runs the analytical queries, logging their results in a Q/A manner.
+
+- `main`: all the steps in a single run
+- `stage_model_input`, `stage_dimension`, `load_model_artifacts`: the same steps as tasks (see `main_p4`)
+- `main_queries`: only the analytical queries, against the loaded tables
+"""
 
 # 0. define collision grain:
 # collision grain (raw definition, see final definition below) -> a single collision, on a certain date and time, on a location and with a severity
@@ -16,129 +25,399 @@
 # dim_severity: describes the severity levels - granularity ??? is granularity applicable here?
 # dim_location: latitude, longitude, geo_bucket - has a granularity at the lat/lon level
 
-# TODO: implement the following flow (review after)
-# 1. read collisions_curated
-# 2. do your modeling thing
-# 3. validate all : not_null, unique (choose the right place to do it)
-# 4. create a dwh db schema
-# 5. insert tables into dwh
-# 6. run your queries -> log to terminal: Q/A manner
-
 
 import pandas as pd
+from sqlalchemy import Engine
 
 import logging
 from de_project.common.logging_config import setup_logging
 
+from de_project.common.analytics import (
+    TableDelta,
+    apply_deltas,
+    get_table_versions,
+    has_table,
+    read_table,
+    run_query,
+    write_tables,
+)
+from de_project.common.artifacts import open_artifact, publish_artifact
+from de_project.common.config import (
+    get_analytics_backend,
+    get_calendar_years,
+    is_arrow_dtypes_enabled,
+    load_env,
+)
 from de_project.common.db import create_db_engine
+from de_project.common.staging import read_dataset
+from de_project.common.task_runs import run_task, task_input_hash
+from de_project.project_p3 import query_runner
 from de_project.project_p3.modeling import (
+    build_agg_hourly,
+    build_features,
     build_dim_date,
     build_dim_time,
     build_dim_severity,
     build_dim_location,
     build_fact_collisions,
 )
+from de_project.project_p3.modeling.build_features import MINUTES_PER_DAY
 from de_project.project_p3.utils import utils
 
+from datetime import date
+
 setup_logging()
 logger = logging.getLogger(__name__)
 
+load_env()
+
+# The curated columns the features (fact and dimension keys and attributes) are built from
+CURATED_COLUMNS = [
+    "collision_id",
+    "collision_datetime",
+    "collision_severity",
+    "longitude",
+    "latitude",
+]
+
+# dimension name: (dataset builder, key column, table name)
+DIMENSIONS = {
+    "dim_severity": (
+        build_dim_severity.build_dim_severity,
+        "severity_key",
+        "collisions_dim_severity",
+    ),
+    "dim_location": (
+        build_dim_location.build_dim_location,
+        "location_key",
+        "collisions_dim_location",
+    ),
+}
+
+# generated dimension name: table name. Their members don't depend on the collisions,
+# they are stored once and kept across runs, see `_maintain_calendar_dimensions`
+CALENDAR_DIMENSIONS = {
+    "dim_date": "collisions_dim_date",
+    "dim_time": "collisions_dim_time",
+}
+
+
+def _stored_calendar_years(engine: Engine) -> tuple[int, int, bool] | None:
+    """Returns the (first, last) year of the stored date dimension and whether it holds
+    every day of these years (not if built from collision dates). None if missing or empty
+    """
+    table = CALENDAR_DIMENSIONS["dim_date"]
+    if not has_table(engine, table):
+        return None
+
+    stored = run_query(
+        engine,
+        f"SELECT MIN(year) AS first_year, MAX(year) AS last_year, COUNT(*) AS days "
+        f"FROM {table}",
+    ).iloc[0]
+    if pd.isna(stored["first_year"]):
+        return None
+
+    first_year, last_year = int(stored["first_year"]), int(stored["last_year"])
+    days = build_dim_date.count_calendar_days(first_year, last_year)
+    return (first_year, last_year, stored["days"] == days)
+
+
+def _has_stored_time_dimension(engine: Engine) -> bool:
+    """Returns whether the stored time dimension holds every minute of the day"""
+    table = CALENDAR_DIMENSIONS["dim_time"]
+    if not has_table(engine, table):
+        return False
+
+    stored = run_query(engine, f"SELECT COUNT(*) AS minutes FROM {table}")
+    return stored["minutes"].iloc[0] == MINUTES_PER_DAY
+
+
+def _maintain_calendar_dimensions(
+    engine: Engine, features: pd.DataFrame
+) -> dict[str, pd.DataFrame]:
+    """Returns the generated date and time dimension datasets to write, by table name.
+    None of them while the stored ones are complete and cover the collision years.
+
+    The date dimension covers the configured years (`CALENDAR_FIRST_YEAR`, `CALENDAR_LAST_YEAR`),
+    the collision years and the years already stored: it is only extended, when new years appear.
+    """
+    tables = {}
+
+    stored_years = _stored_calendar_years(engine)
+    years = [year for year in get_calendar_years() if year is not None]
+    if not features.empty:
+        collision_years = features["date_key"] // 10_000
+        years += [int(collision_years.min()), int(collision_years.max())]
+    if stored_years is not None:
+        years += stored_years[:2]
+    # nothing to cover yet, the date dimension starts with the current year
+    years = years or [date.today().year]
+
+    table = CALENDAR_DIMENSIONS["dim_date"]
+    if stored_years == (min(years), max(years), True):
+        logger.info(f"- Keeping '{table}', stored years cover the collisions")
+    else:
+        logger.info(f"- Generating '{table}' for years {min(years)}-{max(years)}")
+        df = build_dim_date.build_dim_date(min(years), max(years))
+        tables[table] = utils.validate_dataset(df, "date_key")
+
+    table = CALENDAR_DIMENSIONS["dim_time"]
+    if _has_stored_time_dimension(engine):
+        logger.info(f"- Keeping '{table}', stored")
+    else:
+        logger.info(f"- Generating '{table}'")
+        tables[table] = utils.validate_dataset(
+            build_dim_time.build_dim_time(), "time_key"
+        )
+
+    return tables
+
+
+def _run_queries(engine: Engine) -> None:
+    """Runs the analytical queries and logs their results, in a Q/A manner"""
+    logger.info("Running analytical queries")
+    for query_result in query_runner.run_queries(engine):
+        source = "cache" if query_result.cached else f"{query_result.elapsed:.3f}s"
+        logger.info(
+            f"Q: {query_result.name} ({source})\n"
+            f"A:\n{query_result.result.to_string(index=False)}"
+        )
+
+
+def build_dimension(features: pd.DataFrame, dimension: str) -> pd.DataFrame:
+    """Returns the validated dimension dataset (a `DIMENSIONS` name) of the collisions features"""
+    builder, key, _ = DIMENSIONS[dimension]
+    return utils.validate_dataset(builder(features), key)
+
+
+def _merge_fact(engine: Engine, fact_df: pd.DataFrame) -> None:
+    """Merges the changes of the fact dataset into the stored fact and aggregate tables:
+    only the rows of new, changed or removed collisions are written,
+    their counts are added to (or removed from) the aggregate rows of their keys"""
+    stored = read_table(
+        engine, build_fact_collisions.FACT_TABLE, columns=list(fact_df.columns)
+    )
+    deleted, inserted = build_fact_collisions.diff_fact_collisions(stored, fact_df)
+    logger.info(
+        f"[METRIC] Fact changes: {len(deleted)} rows deleted, {len(inserted)} rows inserted "
+        f"({len(stored)} rows stored)"
+    )
+    if deleted.empty and inserted.empty:
+        logger.info("- Keeping fact and aggregate tables, unchanged")
+        return
+
+    logger.info("- Merging fact changes into the fact and aggregate tables")
+    # applied together, the aggregate always matches the fact
+    apply_deltas(
+        engine,
+        [
+            TableDelta(
+                build_fact_collisions.FACT_TABLE,
+                deleted=deleted[["collision_key"]],
+                inserted=inserted,
+            ),
+            TableDelta(
+                build_agg_hourly.AGG_HOURLY_TABLE,
+                counts=build_agg_hourly.build_agg_hourly_delta(deleted, inserted),
+                count_column="collision_count",
+            ),
+        ],
+    )
+
+
+def load_model(
+    engine: Engine, features: pd.DataFrame, dimensions: dict[str, pd.DataFrame]
+) -> None:
+    """Loads the dimension datasets and the generated date and time dimensions
+    (when missing or extended), then creates the fact dataset and loads it with its aggregate.
+
+    The fact and aggregate tables are built whole on the first load,
+    later loads merge the fact changes into them, see `_merge_fact`.
+
+    :param features: the collisions features, see `build_features`
+    :param dimensions: the dimension datasets by `DIMENSIONS` name
+    """
+    calendar_tables = _maintain_calendar_dimensions(engine, features)
+
+    logger.info("- Writing dimension dataset into database")
+    write_tables(
+        engine,
+        {
+            **{DIMENSIONS[name][2]: dimensions[name] for name in DIMENSIONS},
+            **calendar_tables,
+        },
+    )
+
+    logger.info("- Creating fact dataset")
+    fact_df = build_fact_collisions.build_fact_collisions(features)
+    fact_df = utils.validate_dataset(fact_df, "collision_key")
+
+    if has_table(engine, build_fact_collisions.FACT_TABLE) and has_table(
+        engine, build_agg_hourly.AGG_HOURLY_TABLE
+    ):
+        _merge_fact(engine, fact_df)
+        return
+
+    logger.info("- Creating hourly aggregate dataset")
+    agg_hourly = build_agg_hourly.build_agg_hourly(fact_df)
+
+    logger.info("- Writing fact and aggregate datasets into database")
+    # written together, the aggregate always matches the fact
+    write_tables(
+        engine,
+        {
+            build_fact_collisions.FACT_TABLE: fact_df,
+            build_agg_hourly.AGG_HOURLY_TABLE: agg_hourly,
+        },
+    )
+
 
 def main():
     """Pipeline orchestration script that:
 
-    - Reads dataset from collisions_raw table
+    - Reads dataset from collisions_curated table
+    - Derives the dimension keys and attributes of every collision, once (features)
     - Creates dimension datasets
     - Validates dimension datasets
+    - Generates the date and time dimensions, if missing or not covering the collision years
     - Loads dimension datasets into DB
-    - Reads dimension datasets from DB
     - Creates fact dataset
     - Validates fact dataset
-    - Loads fact dataset
-    - Creates fact dataset
-    - Loads fact dataset into DB
+    - Loads fact dataset and its hourly aggregate into DB: built whole on the first load,
+      later loads merge the new, changed or removed fact rows into them
+    - Runs the analytical queries, logs their results
+
+    The fact and dimension tables are written to the SQLite database,
+    or to an embedded DuckDB database with `ANALYTICS_BACKEND=duckdb`
     """
 
     engine = create_db_engine(echo=False)
 
     logger.info("Starting create fact and dimensions tables")
     try:
-        with engine.connect() as conn:
-            logger.info("- Reading collisions_curated dataset from database")
-            df = pd.read_sql_table("collisions_curated", conn)
-
-            logger.info("- Creating dimension datasets")
-            dim_date = utils.validate_dataset(
-                build_dim_date.build_dim_date(df), "date_key"
-            )
-            dim_time = utils.validate_dataset(
-                build_dim_time.build_dim_time(df), "time_key"
-            )
-            dim_severity = utils.validate_dataset(
-                build_dim_severity.build_dim_severity(df), "severity_key"
-            )
-            dim_location = utils.validate_dataset(
-                build_dim_location.build_dim_location(df), "location_key"
-            )
-
-            logger.info("- Writing dimension dataset into database")
-            dim_date.to_sql(
-                "collisions_dim_date",
-                conn,
-                if_exists="replace",
-                index=False,
-            )
-
-            dim_time.to_sql(
-                "collisions_dim_time",
-                conn,
-                if_exists="replace",
-                index=False,
-            )
-
-            dim_severity.to_sql(
-                "collisions_dim_severity",
-                conn,
-                if_exists="replace",
-                index=False,
-            )
-
-            dim_location.to_sql(
-                "collisions_dim_location",
-                conn,
-                if_exists="replace",
-                index=False,
-            )
-
-            logger.info("- Reading dimension tables from database")
-            dimensions = {}
-            dimensions["dim_date"] = pd.read_sql_table("collisions_dim_date", conn)
-            dimensions["dim_time"] = pd.read_sql_table("collisions_dim_time", conn)
-            dimensions["dim_severity"] = pd.read_sql_table(
-                "collisions_dim_severity", conn
-            )
-            dimensions["dim_location"] = pd.read_sql_table(
-                "collisions_dim_location", conn
-            )
-
-            logger.info("- Creating fact dataset")
-            fact_df = build_fact_collisions.build_fact_collisions(df, dimensions)
-            fact_df = utils.validate_dataset(fact_df, "collision_key")
-
-            logger.info("- Writing fact dataset into database")
-            fact_df.to_sql(
-                "collisions_fact",
-                conn,
-                if_exists="replace",
-                index=False,
-            )
+        logger.info("- Reading collisions_curated dataset")
+        df = read_dataset(engine, "collisions_curated", columns=CURATED_COLUMNS)
 
-            logger.info("Successfully created fact and dimension tables")
+        logger.info("- Creating features dataset")
+        features = build_features.build_features(df)
+
+        logger.info("- Creating dimension datasets")
+        dimensions = {name: build_dimension(features, name) for name in DIMENSIONS}
+
+        load_model(engine, features, dimensions)
+
+        logger.info("Successfully created fact and dimension tables")
 
     except Exception:
         logger.error("Failed to create fact and dimensions tables")
         raise
 
+    _run_queries(engine)
+
+
+# The same steps as `main`, as separate tasks (see `main_p4`),
+# the datasets are handed over as artifacts, by reference
+
+
+def stage_model_input(artifact: dict | None) -> dict:
+    """Derives the features of the curated artifact, publishes them as the input artifact
+    of the modeling tasks. Returns the artifact reference
+
+    In incremental mode (no artifact), the curated dataset is read once from the database.
+    Skipped if the curated artifact is unchanged since the last successful run.
+    """
+    engine = create_db_engine(echo=False)
+
+    def run() -> dict:
+        if artifact is None:
+            logger.info("- Reading collisions_curated dataset")
+            df = read_dataset(engine, "collisions_curated", columns=CURATED_COLUMNS)
+        else:
+            df = open_artifact(artifact, columns=CURATED_COLUMNS)
+        logger.info("- Creating features dataset")
+        return publish_artifact(build_features.build_features(df), "model_features")
+
+    input_hash = task_input_hash(
+        artifact["hash"] if artifact is not None else None,
+        {"arrow_dtypes": is_arrow_dtypes_enabled()},
+    )
+    return run_task(engine, "model_features", input_hash, run)
+
+
+def stage_dimension(dimension: str, input_artifact: dict) -> dict:
+    """Creates a dimension dataset from the features artifact, publishes it as an artifact.
+    Returns the artifact reference
+
+    Skipped if the input artifact is unchanged since the last successful run.
+    """
+    engine = create_db_engine(echo=False)
+
+    def run() -> dict:
+        logger.info(f"- Creating {dimension} dataset")
+        features = open_artifact(input_artifact)
+        return publish_artifact(build_dimension(features, dimension), dimension)
+
+    input_hash = task_input_hash(
+        input_artifact["hash"], {"arrow_dtypes": is_arrow_dtypes_enabled()}
+    )
+    return run_task(engine, f"model_{dimension}", input_hash, run)
+
+
+def load_model_artifacts(input_artifact: dict, dimension_artifacts: list[dict]) -> None:
+    """Loads the dimension artifacts, creates and loads the fact and aggregate datasets
+    from the features artifact, runs the analytical queries
+
+    The tables are not loaded again if the artifacts, the analytical backend,
+    the calendar years and the model tables are unchanged since the last successful run.
+    """
+    engine = create_db_engine(echo=False)
+
+    def run() -> None:
+        logger.info("Starting create fact and dimensions tables")
+        try:
+            # artifacts are named after their dimension, see `stage_dimension`
+            dimensions = {
+                artifact["name"]: open_artifact(artifact)
+                for artifact in dimension_artifacts
+            }
+            load_model(engine, open_artifact(input_artifact), dimensions)
+
+            logger.info("Successfully created fact and dimension tables")
+
+        except Exception:
+            logger.error("Failed to create fact and dimensions tables")
+            raise
+
+    settings = {
+        "dimensions": sorted(artifact["hash"] for artifact in dimension_artifacts),
+        "backend": get_analytics_backend(),
+        "calendar_years": get_calendar_years(),
+    }
+    input_hash = task_input_hash(input_artifact["hash"], settings)
+    tables = [
+        build_fact_collisions.FACT_TABLE,
+        build_agg_hourly.AGG_HOURLY_TABLE,
+        *(DIMENSIONS[artifact["name"]][2] for artifact in dimension_artifacts),
+    ]
+    run_task(
+        engine,
+        "model_fact",
+        input_hash,
+        run,
+        lambda: get_table_versions(engine, tables),
+    )
+
+    _run_queries(engine)
+
+
+def main_queries():
+    """Runs the analytical queries against the existing fact and dimension tables.
+    Results are served from cache while the tables are unchanged"""
+
+    engine = create_db_engine(echo=False)
+    _run_queries(engine)
+
 
 if __name__ == "__main__":
     main()
@@ -12,7 +12,6 @@
 # Find: main
 
 from de_project import main_p1, main_p2, main_p3
-from de_project.common.db import create_db_engine
 
 from airflow.sdk import dag, task
 from datetime import timedelta
@@ -38,52 +37,84 @@ def main():
     - ingest raw data
     - transform raw to clean data
     - transform clean to curated data
-    - model data for analytics
+    - model data for analytics: the dimensions in parallel, then the fact
     """
 
     @task()
-    def ingest_raw():
+    def ingest_raw() -> dict:
         """### ETL extract step.
 
         Reads a external CSV file and load it into database with minimal changes.
+        Publishes the raw dataset as an artifact, returns its reference.
+        Skipped if the file is unchanged since the last successful run.
         """
-        main_p1.main()
+        return main_p1.ingest_artifact()
 
     @task()
-    def transform_clean():
+    def transform_clean(raw_artifact: dict) -> dict | None:
         """### ETL transform, load step.
 
-        Reads an existing raw dataset from database,
+        Opens the raw artifact of the previous task (see `open_artifact`),
         cleans the data by normalizing data types, column names.
         Do data validation for resulting dataset.
-        Loads it as a clean dataset into DB.
+        Loads it as a clean dataset into DB, publishes it as an artifact.
+        Skipped if the raw artifact is unchanged since the last successful run.
         """
-        engine = create_db_engine()
-        main_p2.clean_dataset(engine)
+        return main_p2.clean_artifact(raw_artifact)
 
     @task()
-    def transform_curated():
+    def transform_curated(clean_artifact: dict | None) -> dict | None:
         """### ETL transform, load step.
 
-        Reads an existing clean dataset from database.
+        Opens the clean artifact of the previous task
+        (reads the clean dataset from DB in incremental mode).
         Replaces codes to their meaningful names.
         Validates the resulting dataset.
-        Loads it as a curated dataset into DB.
+        Loads it as a curated dataset into DB, publishes it as an artifact.
+        Skipped if the clean artifact is unchanged since the last successful run.
         """
-        engine = create_db_engine()
-        main_p2.curate_dataset(engine)
+        return main_p2.curate_artifact(clean_artifact)
 
     @task()
-    def model_analytics():
-        """### Modeling step.
+    def stage_model_input(curated_artifact: dict | None) -> dict:
+        """### Modeling step: input.
 
-        Reads a curated dataset from database.
-        Models the fact and dimension datasets.
-        Loads resulting datasets into fact and dimension tables.
+        Opens the curated artifact.
+        Derives the dimension keys and attributes of every collision (features) once.
+        Publishes them as the input artifact of the modeling tasks.
+        In incremental mode, reads the curated dataset from database once.
         """
-        main_p3.main()
+        return main_p3.stage_model_input(curated_artifact)
 
-    (ingest_raw() >> transform_clean() >> transform_curated() >> model_analytics())
+    @task()
+    def model_dimension(dimension: str, input_artifact: dict) -> dict:
+        """### Modeling step: dimension (mapped, one task per dimension).
+
+        Opens the features artifact.
+        Models and validates the dimension dataset.
+        Publishes it as an artifact, returns its reference.
+        """
+        return main_p3.stage_dimension(dimension, input_artifact)
+
+    @task()
+    def model_fact(input_artifact: dict, dimension_artifacts: list[dict]):
+        """### Modeling step: fact.
+
+        Opens the input and dimension artifacts.
+        Loads the dimension datasets into dimension tables.
+        Models the fact dataset and its hourly aggregate, loads them into tables.
+        Runs the analytical queries.
+        """
+        main_p3.load_model_artifacts(input_artifact, list(dimension_artifacts))
+
+    # each task hands over its output to the next one as an artifact reference (XCom)
+    input_artifact = stage_model_input(transform_curated(transform_clean(ingest_raw())))
+    # dimension tasks run in parallel, on any worker
+    dimension_artifacts = model_dimension.partial(input_artifact=input_artifact).expand(
+        dimension=list(main_p3.DIMENSIONS)
+    )
+
+    model_fact(input_artifact, dimension_artifacts)
 
 
 # DAG object for Airflow to load it.
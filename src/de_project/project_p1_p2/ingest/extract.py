@@ -2,7 +2,10 @@
 
 import pandas as pd
 
+from de_project.common.dtypes import read_options
+
 from pathlib import Path
+from typing import Iterator
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,7 +14,7 @@ logger = logging.getLogger(__name__)
 def read_csv_file(file_path: Path) -> pd.DataFrame:
     """Returns a dataset from a CSV file"""
     try:
-        df = pd.read_csv(file_path)
+        df = pd.read_csv(file_path, **read_options())
         logger.info(f"Reading raw dataset CSV file: {file_path}")
         return df
     except FileNotFoundError as exc:
@@ -20,3 +23,19 @@ def read_csv_file(file_path: Path) -> pd.DataFrame:
     except Exception as exc:
         logger.error(f"Could not create DataFrame, because of {exc}")
         raise
+
+
+def read_csv_file_chunks(file_path: Path, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Returns an iterator over a CSV file dataset, one chunk of `chunk_size` rows at a time"""
+    try:
+        logger.info(
+            f"Reading raw dataset CSV file in chunks of {chunk_size} rows: {file_path}"
+        )
+        with pd.read_csv(file_path, chunksize=chunk_size, **read_options()) as reader:
+            yield from reader
+    except FileNotFoundError as exc:
+        logger.error(f"File not found {file_path}")
+        raise
+    except Exception as exc:
+        logger.error(f"Could not read DataFrame chunk, because of {exc}")
+        raise
@@ -1,27 +1,64 @@
 """ETL load"""
 
 import pandas as pd
-from sqlalchemy import Engine, Connection, text
+from sqlalchemy import Engine, Connection, bindparam, text
+
+from de_project.common.bulk_load import bulk_insert, bulk_load_connection
+from de_project.common.db import create_table_indexes
+from de_project.common.watermarks import record_ingest_batch
 
 from pathlib import Path
+from typing import Iterable, Iterator
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 
-def load_csv_file(file_path: Path, df: pd.DataFrame) -> None:
-    """Loads dataset into a file"""
+def load_csv_file(file_path: Path, df: pd.DataFrame, append: bool = False) -> None:
+    """Loads dataset into a file
+
+    :param append=False: if True, the dataset is appended to the file without header
+    """
     logger.info(f"Loading dataset into CSV file")
     try:
-        df.to_csv(path_or_buf=file_path, index=False)
+        df.to_csv(
+            path_or_buf=file_path,
+            index=False,
+            mode="a" if append else "w",
+            header=not append,
+        )
         logger.info(f"Successfully loaded dataset to {file_path}")
     except Exception as exc:
         logger.error(f"Failed to load dataset to CSV file, because of: {exc}")
         raise
 
 
-def _data_quality_check(con: Connection, df_row_count: int) -> None:
-    """Validates the inserted database rows versus dataset rows"""
+def load_csv_file_chunks(file_path: Path, chunks: Iterable[pd.DataFrame]) -> None:
+    """Loads the dataset chunks into a file, one chunk at a time.
+
+    The chunks are written to a temporary file, renamed once the last chunk is written:
+    a failed load leaves the previous file unchanged, never a partial one.
+    """
+    logger.info(f"Loading dataset chunks into CSV file")
+    tmp_path = file_path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        for i, chunk in enumerate(chunks):
+            load_csv_file(tmp_path, chunk, append=i > 0)
+        if tmp_path.exists():
+            os.replace(tmp_path, file_path)
+        logger.info(f"Successfully loaded dataset chunks to {file_path}")
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _data_quality_check(
+    con: Connection, df_row_count: int, collision_years: list[int] | None = None
+) -> None:
+    """Validates the inserted database rows versus dataset rows
+
+    :param collision_years=None: if set, only the rows of these collision years are counted
+    """
 
     logger.info("Performing data quality check...")
     select_duplicates = text(
@@ -34,6 +71,13 @@ def _data_quality_check(con: Connection, df_row_count: int) -> None:
     )
 
     count_all = text("SELECT COUNT(*) AS db_rows_count FROM collisions_raw;")
+    if collision_years is not None:
+        count_all = text(
+            (
+                "SELECT COUNT(*) AS db_rows_count FROM collisions_raw "
+                "WHERE collision_year IN :collision_years;"
+            )
+        ).bindparams(bindparam("collision_years", collision_years, expanding=True))
 
     try:
         sql_result = con.execute(select_duplicates)
@@ -59,22 +103,140 @@ def _data_quality_check(con: Connection, df_row_count: int) -> None:
 
 
 def load_data(df: pd.DataFrame, engine: Engine) -> None:
-    """Loads the dataset to database"""
+    """Loads the dataset to database, replacing the whole table"""
     logger.info("Loading dataset to database...")
 
+    with bulk_load_connection(engine) as conn:
+        try:
+            # the replaced years: the years of the table and of the dataset
+            collision_years = conn.execute(
+                text("SELECT DISTINCT collision_year FROM collisions_raw")
+            ).scalars()
+            record_ingest_batch(
+                conn, sorted({*collision_years, *df["collision_year"].unique()})
+            )
+            bulk_insert(conn, df, "collisions_raw", if_exists="replace")
+
+            _data_quality_check(con=conn, df_row_count=len(df))
+
+            logger.info(f"Successfully loaded data into DB")
+        except Exception:
+            logger.error("Failed to load data into DB")
+            raise
+
+
+def _drop_loaded_rows(conn: Connection, chunk: pd.DataFrame) -> pd.DataFrame:
+    """Returns the chunk without the rows of a `collision_index` already in `collisions_raw`.
+
+    The chunk keys are looked up in the table unique index, through a temporary table
+    holding only the keys of the chunk, so memory does not grow with the loaded rows.
+    """
+    ids = chunk["collision_index"].astype(str)
+    conn.exec_driver_sql(
+        "CREATE TEMP TABLE IF NOT EXISTS _chunk_keys (collision_index TEXT)"
+    )
+    conn.exec_driver_sql("DELETE FROM _chunk_keys")
+    conn.exec_driver_sql(
+        "INSERT INTO _chunk_keys (collision_index) VALUES (?)",
+        [(value,) for value in ids],
+    )
+    loaded_ids = conn.exec_driver_sql(
+        "SELECT k.collision_index FROM _chunk_keys k "
+        "JOIN collisions_raw r ON r.collision_index = k.collision_index"
+    ).scalars()
+    loaded_mask = ids.isin(list(loaded_ids))
+    logger.info(f"- Removed {loaded_mask.sum()} rows loaded by previous chunks")
+    return chunk[~loaded_mask.to_numpy()].reset_index(drop=True)
+
+
+def _delete_years(conn: Connection, collision_years: list[int]) -> None:
+    """Deletes the `collisions_raw` rows of the collision years"""
+    delete_years = text(
+        "DELETE FROM collisions_raw WHERE collision_year IN :collision_years;"
+    ).bindparams(bindparam("collision_years", collision_years, expanding=True))
+    conn.execute(delete_years)
+
+
+def count_loaded_rows(engine: Engine) -> int:
+    """Returns the number of `collisions_raw` rows, of all collision years"""
     with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM collisions_raw")).scalar()
+
+
+def iter_load_data_chunks(
+    chunks: Iterable[pd.DataFrame], engine: Engine
+) -> Iterator[pd.DataFrame]:
+    """Loads the dataset chunks to database within a single transaction,
+    yields each chunk once loaded, committed after the last chunk.
+
+    As `load_data_by_year`, only the rows of the dataset collision years are replaced:
+    the rows of a collision year are deleted before the first chunk holding it is appended.
+    Rows of a `collision_index` loaded by a previous chunk are dropped (and not yielded),
+    looked up in the unique index. The other table indexes are built after the last chunk.
+    """
+    logger.info("Loading dataset chunks to database...")
+
+    row_count = 0
+    collision_years = set()
+    with bulk_load_connection(engine) as conn:
         try:
-            df.to_sql(
-                name="collisions_raw",
+            create_table_indexes(conn, "collisions_raw", unique_only=True)
+            for i, chunk in enumerate(chunks):
+                new_years = {int(year) for year in chunk["collision_year"].unique()}
+                new_years -= collision_years
+                if new_years:
+                    logger.info(f"- Replacing collision years {sorted(new_years)}")
+                    _delete_years(conn, sorted(new_years))
+                    collision_years |= new_years
+                if i > 0:
+                    chunk = _drop_loaded_rows(conn, chunk)
+                bulk_insert(
+                    conn,
+                    chunk,
+                    "collisions_raw",
+                    if_exists="append",
+                    build_indexes=False,
+                )
+                row_count += len(chunk)
+                logger.info(f"- Loaded chunk {i} with {len(chunk)} rows")
+                yield chunk
+            conn.exec_driver_sql("DROP TABLE IF EXISTS _chunk_keys")
+            # indexes are built once, after the last chunk
+            create_table_indexes(conn, "collisions_raw")
+            record_ingest_batch(conn, sorted(collision_years))
+
+            _data_quality_check(
                 con=conn,
-                if_exists="replace",
-                index=False,
+                df_row_count=row_count,
+                collision_years=sorted(collision_years),
             )
+        except Exception:
+            logger.error("Failed to load data chunks into DB")
+            raise
 
-            _data_quality_check(con=conn, df_row_count=len(df))
+    logger.info(f"Successfully loaded {row_count} rows into DB")
+
+
+def load_data_by_year(df: pd.DataFrame, engine: Engine) -> None:
+    """Loads the dataset to database, replacing only the rows of its collision years.
+
+    Rows of other collision years (e.g. ingested from other files) are kept.
+    The load is recorded as an ingestion batch of its collision years (`watermarks`).
+    """
+    collision_years = sorted(int(year) for year in df["collision_year"].unique())
+    logger.info(f"Loading dataset to database for collision years {collision_years}...")
+
+    with bulk_load_connection(engine) as conn:
+        try:
+            _delete_years(conn, collision_years)
+            bulk_insert(conn, df, "collisions_raw", if_exists="append")
+            record_ingest_batch(conn, collision_years)
+
+            _data_quality_check(
+                con=conn, df_row_count=len(df), collision_years=collision_years
+            )
 
             logger.info(f"Successfully loaded data into DB")
-            conn.commit()
         except Exception:
             logger.error("Failed to load data into DB")
             raise
@@ -2,12 +2,17 @@
 
 from sqlalchemy import Engine, text
 
+from de_project.common.fingerprint import (
+    HASH_ALGORITHM,
+    LEGACY_HASH_ALGORITHM,
+    compute_legacy_file_hash,
+    get_file_hash,
+)
+
 import logging
 from pathlib import Path
-import hashlib
 from datetime import datetime
 
-
 logger = logging.getLogger(__name__)
 
 
@@ -50,6 +55,11 @@ def _do_validate_metadata(new_metadata, current_metadata) -> tuple[dict, bool]:
         logger.warning("Metadata invalid, because of ingestion date inconsistency")
         return ({}, False)
 
+    if new_metadata["hash_algorithm"] != current_metadata["hash_algorithm"]:
+        # hashes of different algorithms are not comparable
+        logger.info("Metadata valid, file hashed with another algorithm.")
+        return (new_metadata, True)
+
     if new_metadata["file_hash"] == current_metadata["file_hash"]:
         logger.info("Metadata valid and unchanged.")
         return (new_metadata, False)
@@ -65,22 +75,22 @@ def create_ingestion_metadata(file_path: Path) -> dict:
     file_name = file_path.name
 
     logger.info(f"Creating metadata for file {file_name}")
-    with open(file_path, "rb") as file:
-        digest = hashlib.file_digest(file, "sha256")
-        try:
-            result = {
-                "dataset_name": file_name,
-                "file_hash": digest.hexdigest(),
-                "ingested_at": str(datetime.now()),
-            }
-            logger.info(f"Successfully created metadata from file")
-            return result
-        except FileNotFoundError:
-            logger.error("File not found")
-            raise
-        except Exception:
-            logger.error("Could not create metadata from file")
-            raise
+    try:
+        # the full file hash is computed only if the file changed since the last run
+        result = {
+            "dataset_name": file_name,
+            "file_hash": get_file_hash(file_path),
+            "hash_algorithm": HASH_ALGORITHM,
+            "ingested_at": str(datetime.now()),
+        }
+        logger.info(f"Successfully created metadata from file")
+        return result
+    except FileNotFoundError:
+        logger.error("File not found")
+        raise
+    except Exception:
+        logger.error("Could not create metadata from file")
+        raise
 
 
 # Get existing ingestion metadata from database
@@ -109,16 +119,51 @@ def get_ingested_metadata(engine: Engine, dataset_path: Path) -> dict:
                 result = {
                     "dataset_name": sql_result.dataset_name,
                     "file_hash": sql_result.file_hash,
+                    "hash_algorithm": sql_result.hash_algorithm
+                    or LEGACY_HASH_ALGORITHM,
                     "ingested_at": str(sql_result.ingested_at),
                 }
-            return result
-
         except Exception:
             logger.error(
                 f"Could not find ingestion metadata for {dataset_name} dataset"
             )
             raise
 
+    if result and result["hash_algorithm"] == LEGACY_HASH_ALGORITHM:
+        result = _migrate_legacy_hash(engine, dataset_path, result)
+    return result
+
+
+def _migrate_legacy_hash(engine: Engine, dataset_path: Path, metadata: dict) -> dict:
+    """Rehashes the ingestion metadata row of a file with `HASH_ALGORITHM`,
+    if the file is unchanged since its ingestion (same legacy SHA-256 hash).
+    Returns the current metadata, the legacy one if the file changed
+
+    Done once per file, so an unchanged file is not ingested again after the algorithm change.
+    """
+    if not dataset_path.exists():
+        return metadata
+    if compute_legacy_file_hash(dataset_path) != metadata["file_hash"]:
+        logger.info(f"File changed since its ingestion: {dataset_path.name}")
+        return metadata
+
+    migrated = {
+        **metadata,
+        "file_hash": get_file_hash(dataset_path),
+        "hash_algorithm": HASH_ALGORITHM,
+    }
+    update_stmt = text(
+        (
+            "UPDATE ingestion_metadata "
+            "SET file_hash = :file_hash, hash_algorithm = :hash_algorithm "
+            "WHERE dataset_name = :dataset_name AND file_hash = :legacy_hash"
+        )
+    )
+    with engine.begin() as conn:
+        conn.execute(update_stmt, {**migrated, "legacy_hash": metadata["file_hash"]})
+    logger.info(f"Migrated ingestion metadata file hash to {HASH_ALGORITHM}")
+    return migrated
+
 
 # Load ingestion metadata into database
 def load_metadata(engine: Engine, metadata: dict) -> None:
@@ -126,8 +171,9 @@ def load_metadata(engine: Engine, metadata: dict) -> None:
 
     insert_stmt = text(
         (
-            "INSERT INTO ingestion_metadata(dataset_name, file_hash, ingested_at) "
-            f"VALUES(:dataset_name, :file_hash, :ingested_at)"
+            "INSERT INTO ingestion_metadata"
+            "(dataset_name, file_hash, hash_algorithm, ingested_at) "
+            "VALUES(:dataset_name, :file_hash, :hash_algorithm, :ingested_at)"
         )
     )
 
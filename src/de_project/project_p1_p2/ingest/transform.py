@@ -1,18 +1,16 @@
 """Transformation ETL step"""
 
 import pandas as pd
-import pandera.pandas as pa
 
-from de_project.project_p1_p2.ingest.schema import CollisionsRawSchema
+from de_project.project_p1_p2.ingest.validation import validate_raw
 import logging
 
 logger = logging.getLogger(__name__)
 
+DATE_FORMAT = "%d/%m/%Y"
+TIME_FORMAT = "%H:%M"
+
 
-@pa.check_output(
-    schema=CollisionsRawSchema.to_schema(),
-    lazy=True,
-)
 def transform(df: pd.DataFrame) -> pd.DataFrame:
     """Returns a transformed and validated dataset"""
     logger.info("Starting dataset transformation...")
@@ -22,24 +20,77 @@ def transform(df: pd.DataFrame) -> pd.DataFrame:
         df = _transform(df)
         df = df.reset_index(drop=True)
         logger.info("Finished dataset transformation")
-        logger.info("Successfully validated the dataset")
-        return df
     except Exception:
         logger.error("Could not transform the dataset")
         raise
 
+    df = validate_raw(df)
+    logger.info("Successfully validated the dataset")
+    return df
+
+
+def transform_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns a transformed and validated dataset chunk
+
+    Duplicates are dropped within the chunk only, the rows already loaded
+    by previous chunks are dropped at load (see `load.iter_load_data_chunks`).
+    """
+    df = df.copy()
+
+    try:
+        df = _transform(df)
+        df = df.reset_index(drop=True)
+    except Exception:
+        logger.error("Could not transform the dataset chunk")
+        raise
+
+    return validate_raw(df)
+
+
+def _parse_datetime_strings(dates: pd.Series, times: pd.Series) -> pd.Series:
+    """Returns the datetimes parsed from the concatenated date and time strings"""
+    dt_str = dates.astype(str) + "T" + times.astype(str)
+    return pd.to_datetime(
+        arg=dt_str,
+        format=f"{DATE_FORMAT}T{TIME_FORMAT}",
+        cache=True,
+    )
+
+
+def _build_datetime(dates: pd.Series, times: pd.Series) -> pd.Series:
+    """Returns the datetimes of the date and time strings (e.g. `31/12/2023`, `23:59`)
+
+    The distinct dates and times are parsed once each (~365 dates, ~1440 times a year),
+    then combined per row as int64 nanoseconds.
+    With null or malformed values, falls back to parsing the concatenated strings,
+    which fails the same way as it always did.
+    """
+    date_codes, date_uniques = pd.factorize(dates)
+    time_codes, time_uniques = pd.factorize(times)
+    if (date_codes < 0).any() or (time_codes < 0).any():
+        return _parse_datetime_strings(dates, times)
+
+    try:
+        date_ns = pd.to_datetime(
+            pd.Index(date_uniques).astype(str), format=DATE_FORMAT
+        ).as_unit("ns")
+        # times are parsed as datetimes of 1900-01-01
+        time_ns = pd.to_datetime(
+            pd.Index(time_uniques).astype(str), format=TIME_FORMAT
+        ).as_unit("ns") - pd.Timestamp("1900-01-01")
+    except ValueError:
+        return _parse_datetime_strings(dates, times)
+
+    values = date_ns.asi8[date_codes] + time_ns.as_unit("ns").asi8[time_codes]
+    return pd.Series(values.view("datetime64[ns]"), index=dates.index)
+
 
 def _transform(df: pd.DataFrame) -> pd.DataFrame:
     """Transform dataset"""
 
     # Convert date type from string to datetime
     if {"date", "time"}.issubset(df.columns):
-        dt_str = df["date"].astype(str) + "T" + df["time"].astype(str)
-        df["collision_datetime"] = pd.to_datetime(
-            arg=dt_str,
-            format="%d/%m/%YT%H:%M",
-            cache=True,
-        )
+        df["collision_datetime"] = _build_datetime(df["date"], df["time"])
         logger.info(f"- Created new column collision_datetime")
 
     # Drop rows containing null values
@@ -0,0 +1,101 @@
+"""Raw dataset validation against `CollisionsRawSchema`
+
+Two modes, selected with the `SCHEMA_VALIDATION` env var:
+- full (default): pandera validates the whole dataset (coercion, dtypes, nulls, ...)
+- fast: coercion and null checks run as vectorized per column operations on the whole dataset,
+  pandera validates a random sample of `SCHEMA_SAMPLE_SIZE` rows only
+  (its element-wise checks, e.g. `str` values, are the expensive ones).
+  If any check fails, the whole dataset is validated again in full mode,
+  so failures are reported with the same pandera error report.
+"""
+
+import numpy as np
+import pandas as pd
+import pandera.pandas as pa
+from pandera.engines.pandas_engine import Engine
+
+from de_project.common.config import get_schema_sample_size, get_schema_validation_mode
+from de_project.project_p1_p2.ingest.schema import CollisionsRawSchema
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _has_schema_dtype(series: pd.Series, column: pa.Column) -> bool:
+    """Returns whether the series already has the column data type (coercion is a no-op)"""
+    # Arrow backed columns pass the data type check, but are coerced to numpy ones
+    if not isinstance(series.dtype, np.dtype):
+        return False
+    if not column.dtype.check(Engine.dtype(series.dtype)):
+        return False
+    if series.dtype == object:
+        # `str` columns: every value must be a string, checked in a single pass
+        return pd.api.types.infer_dtype(series, skipna=True) in ("string", "empty")
+    return True
+
+
+def _coerce_columns(
+    df: pd.DataFrame, schema: pa.DataFrameSchema
+) -> pd.DataFrame | None:
+    """Returns the dataset with the schema columns coerced and checked,
+    None if any column, data type or null check fails"""
+    if df.columns.has_duplicates or set(df.columns) != set(schema.columns):
+        return None
+
+    # coerced columns replace the input ones, the others are shared with the input dataset
+    result = df.copy(deep=False)
+    for name in df.columns:
+        column = schema.columns[name]
+        series = df[name]
+        if not _has_schema_dtype(series, column):
+            try:
+                series = column.dtype.try_coerce(series)
+            except (pa.errors.ParserError, TypeError, ValueError):
+                return None
+            if not column.dtype.check(Engine.dtype(series.dtype)):
+                return None
+            result[name] = series
+        # numpy integer and bool columns can't hold nulls
+        if series.dtype.kind not in "iub" and not column.nullable:
+            if series.isna().any():
+                return None
+
+    return result
+
+
+def _validate_fast(
+    df: pd.DataFrame, schema: pa.DataFrameSchema, sample_size: int
+) -> pd.DataFrame:
+    """Returns the validated dataset, checked in fast mode"""
+    result = _coerce_columns(df, schema)
+
+    if result is not None and sample_size > 0:
+        sample = result
+        if len(result) > sample_size:
+            sample = result.sample(n=sample_size, random_state=0)
+        try:
+            schema.validate(sample, lazy=True)
+        except pa.errors.SchemaErrors:
+            result = None
+
+    if result is None:
+        logger.warning("Fast schema validation failed, validating the full dataset")
+        return schema.validate(df, lazy=True)
+
+    logger.info(
+        f"[METRIC] Fast schema validation: {len(df)} rows coerced and checked, "
+        f"{min(len(df), sample_size)} rows sampled"
+    )
+    return result
+
+
+def validate_raw(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns the dataset validated (and coerced) with `CollisionsRawSchema`.
+
+    Raises `pandera.errors.SchemaErrors` with every failure found (lazy validation).
+    """
+    schema = CollisionsRawSchema.to_schema()
+    if get_schema_validation_mode() == "fast":
+        return _validate_fast(df, schema, get_schema_sample_size())
+    return schema.validate(df, lazy=True)
@@ -2,12 +2,20 @@
 
 import pandas as pd
 
-from de_project.project_p1_p2.transform.code_mappings import get_mappings
-from de_project.project_p1_p2.transform.rules import quality_check
+from de_project.common.dtypes import narrow_dtypes, string_dtype
+from de_project.project_p1_p2.transform.mapping_engine import (
+    compile_mapping,
+    get_compiled_mappings,
+    map_codes,
+    map_special_codes,
+)
+from de_project.project_p1_p2.transform.rules import (
+    Rule,
+    quality_check_with_rejected,
+)
 
 import logging
 
-
 # NOTE: !!! IMPORTANT
 # Even if the DataFrame doesn't need some of transformations,
 # I do those on purpose and for several reasons:
@@ -20,14 +28,17 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-def _rename_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """Returns a new dataset with renamed columns"""
+def _rename_columns(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+    """Returns a new dataset with renamed columns
+
+    :param copy=True: if False, the renamed dataset shares the data of the input dataset
+    """
     logger.info("- Start rename dataset columns...")
 
     df = (
-        df.rename(columns=str.strip)
-        .rename(columns=str.lower)
-        .rename(columns={"collision_index": "collision_id"})
+        df.rename(columns=str.strip, copy=copy)
+        .rename(columns=str.lower, copy=copy)
+        .rename(columns={"collision_index": "collision_id"}, copy=copy)
     )
 
     logger.info("- Finish renaming dataset columns")
@@ -37,22 +48,28 @@ def _rename_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def _cast_values(df: pd.DataFrame) -> pd.DataFrame:
-    """Returns a new dataset with cast data types"""
+def _cast_values(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+    """Returns a new dataset with cast data types
+
+    :param copy=True: if False, the input dataset columns are cast in place
+    """
     logger.info("- Start cast dataset values")
 
-    df = df.copy()
+    if copy:
+        df = df.copy()
     # cast values: object to string
     obj_cols = df.select_dtypes(include="object").columns
-    df[obj_cols] = df[obj_cols].astype("string")
+    df[obj_cols] = df[obj_cols].astype(string_dtype())
 
-    # cast values: int64 to int32
-    int_cols = df.select_dtypes(include="int64").columns
-    df[int_cols] = df[int_cols].astype("int32")
+    # cast values: int64 to int32 (numpy or Arrow backed)
+    wide, narrow = narrow_dtypes()["int"]
+    int_cols = df.columns[df.dtypes.astype(str) == wide]
+    df[int_cols] = df[int_cols].astype(narrow)
 
-    # cast values: float64 to float 32
-    float_cols = df.select_dtypes(include="float64").columns
-    df[float_cols] = df[float_cols].astype("float32")
+    # cast values: float64 to float 32 (numpy or Arrow backed)
+    wide, narrow = narrow_dtypes()["float"]
+    float_cols = df.columns[df.dtypes.astype(str) == wide]
+    df[float_cols] = df[float_cols].astype(narrow)
 
     logger.info("- Finish cast dataset columns")
     logger.info(
@@ -71,28 +88,36 @@ def _cast_values(df: pd.DataFrame) -> pd.DataFrame:
 
 
 # Handle columns mapping
-def _normalize_column_codes(df: pd.DataFrame) -> pd.DataFrame:
+def _normalize_column_codes(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
     """Normalize categorical code columns using predefined value mappings,
-    failing on unmapped values."""
+    failing on unmapped values.
 
-    df = df.copy()
-    for col, mapping in get_mappings().items():
+    Mapped columns are categorical, the categories are the mapping values,
+    so each label is stored once per column instead of once per row.
+
+    :param copy=True: if False, the input dataset columns are replaced in place
+    """
+
+    if copy:
+        df = df.copy()
+    compiled_mappings = get_compiled_mappings()
+    for col in compiled_mappings:
         if col not in df.columns:
             logger.warning(f"Trying to transform non-existing column: {col}")
-            continue
 
-        s = df[col]
-        mapped = s.map(mapping)
+    mapped, unmapped = map_codes(df, compiled_mappings)
 
-        # validate coverage (ignore NaN in source)
-        mask_unmapped = mapped.isna() & s.notna()
-        if mask_unmapped.any():
-            missing = s[mask_unmapped].unique()
-            raise ValueError(
-                f"Unmapped values in column {col} while transforming: {missing}"
-            )
+    # validate coverage (ignore NaN in source)
+    for col, missing in unmapped.items():
+        logger.error(f"Unmapped values in column {col}: {missing}")
+    if unmapped:
+        col, missing = next(iter(unmapped.items()))
+        raise ValueError(
+            f"Unmapped values in column {col} while transforming: {missing}"
+        )
 
-        df[col] = mapped
+    for col, values in mapped.items():
+        df[col] = values
 
     return df
 
@@ -104,9 +129,7 @@ def _normalize_int_special_codes(
     """Returns the value in the mapping if exists
     or the unchanged value in the series cast to string"""
 
-    result = series.astype("Int64").astype("string")
-    for code, value in mapping.items():
-        result = result.mask(series == code, value)
+    result = map_special_codes(series, compile_mapping(mapping))
 
     if result.isna().any():
         raise ValueError(
@@ -117,12 +140,15 @@ def _normalize_int_special_codes(
 
 
 # Normalize column values
-def _normalize_values(df: pd.DataFrame) -> pd.DataFrame:
-    """Returns a new dataset with normalized values"""
+def _normalize_values(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+    """Returns a new dataset with normalized values
+
+    :param copy=True: if False, the input dataset columns are replaced in place
+    """
     logger.info("- Start normalize dataset values")
 
     # Map categorical values
-    df = _normalize_column_codes(df)
+    df = _normalize_column_codes(df, copy=copy)
 
     # Map categorical values special cases
     df["first_road_number"] = _normalize_int_special_codes(
@@ -146,31 +172,70 @@ def _normalize_values(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def _apply_quality_check(df: pd.DataFrame) -> pd.DataFrame:
-    """Returns a valid dataset
+def _apply_quality_check(
+    df: pd.DataFrame, rules: list[Rule] | None = None
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Returns a valid dataset and the rejected rows
 
     Applies validation rules to the dataset.
     Make decision whether to drop, fix or quarantine
     values failing the validation.
+    Both datasets are new ones (rules are applied with a single filter),
+    rejected rows have a `quarantine_rule` column (the first rule they fail).
     """
 
     logger.info("- Start dataset validation...")
-    df = df.copy()
-    df = quality_check(df)
+    df, df_rejected = quality_check_with_rejected(df, rules)
     logger.info("- End dataset validation")
-    return df
+    return (df, df_rejected)
+
+
+def clean_with_rejected(
+    df: pd.DataFrame,
+    copy: bool = True,
+    rules: list[Rule] | None = None,
+    keep_index: bool = False,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Returns a cleaned dataset and the rows rejected by the verification rules
 
+    The rejected rows have the cleaned dataset columns
+    and a `quarantine_rule` column (the first rule they fail).
 
-def clean(df: pd.DataFrame) -> pd.DataFrame:
-    """Returns a cleaned dataset by applying transformations and verification rules"""
+    :param copy=True: if False, runs copy-free: the transformations are applied in place,
+        so the input dataset is modified and must not be used afterwards
+    :param rules=None: the quality check rules, defaults to `rules.get_default_rules()`
+    :param keep_index=False: if True, both datasets keep the input dataset index labels
+        (e.g. to merge cleaned partitions back in order), otherwise they are reset
+    """
     logger.info("Start cleaning dataset...")
 
-    df = df.copy()
-    df = _rename_columns(df)
-    df = _normalize_values(df)
-    df = _apply_quality_check(df)
-    df = _cast_values(df)
-    df = df.reset_index(drop=True)
+    if copy:
+        df = df.copy()
+    df = _rename_columns(df, copy=copy)
+    df = _normalize_values(df, copy=copy)
+    df, df_rejected = _apply_quality_check(df, rules)
+    df = _cast_values(df, copy=copy)
+    # the rejected rows are a new dataset, cast in place
+    df_rejected = _cast_values(df_rejected, copy=False)
+    if keep_index:
+        logger.info("Successfully cleaned dataset")
+        return (df, df_rejected)
+
+    df_rejected.reset_index(drop=True, inplace=True)
+    if copy:
+        df = df.reset_index(drop=True)
+    else:
+        df.reset_index(drop=True, inplace=True)
 
     logger.info("Successfully cleaned dataset")
+    return (df, df_rejected)
+
+
+def clean(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+    """Returns a cleaned dataset by applying transformations and verification rules
+
+    :param copy=True: if False, runs copy-free: the transformations are applied in place,
+        so the input dataset is modified and must not be used afterwards
+    """
+    df, _ = clean_with_rejected(df, copy=copy)
     return df
@@ -1,6 +1,11 @@
-"""Dataset column mappings from code to text values"""
+"""Dataset column mappings from code to text values
 
-import pandas as pd
+A mapping is either a dictionary (code -> text value), or, for the code files,
+a `CodeTable`: the (codes, names) arrays memory mapped from the reference tables cache.
+Code tables are not turned into dictionaries, see `mapping_engine.compile_mapping`.
+"""
+
+import numpy as np
 
 from pathlib import Path
 
@@ -235,27 +240,32 @@ _collision_injury_based_map = {
 }
 
 # File based mappings
-from de_project.common.config import get_data_path, load_env
+from de_project.common.config import get_data_path
+from de_project.project_p1_p2.transform.reference_tables import load_reference_table
+
+from functools import lru_cache
 
-load_env()
+# (codes, names) arrays of a code file, the name of `codes[i]` is `names[i]`
+CodeTable = tuple[np.ndarray, np.ndarray]
 
+UK_LA_CODES_FILE = "uk-la-codes.csv"
+UK_LSOA_CODES_FILE = "uk-lsoa-codes.csv"
+UK_POLICE_FORCE_CODES_FILE = "uk-police-force-codes.csv"
+UK_LAD_CODES_FILE = "uk-lad-codes.csv"
 
-DATA_PATH = get_data_path()
-BASE_PATH_DATA_CODES = DATA_PATH / "codes"
 
-UK_LA_CODES_PATH = BASE_PATH_DATA_CODES / "uk-la-codes.csv"
-UK_LSOA_CODES_PATH = BASE_PATH_DATA_CODES / "uk-lsoa-codes.csv"
-UK_POLICE_FORCE_CODES_PATH = BASE_PATH_DATA_CODES / "uk-police-force-codes.csv"
-UK_LAD_CODES_PATH = BASE_PATH_DATA_CODES / "uk-lad-codes.csv"
+def _get_codes_path() -> Path:
+    """Returns the path to the code files directory"""
+    return get_data_path() / "codes"
 
 
-def _create_code_to_name_map(
+def _load_code_table(
     file_path: Path, key_col: str = "Code", value_col: str = "Name"
-) -> dict:
-    """Given a dataset file creates a dictionary with code as key and name as value.
+) -> CodeTable:
+    """Given a dataset file returns its (codes, names) arrays, memory mapped from the cache.
 
-    :param: key_col - the column serving as a key
-    :parma: value_col - the column serving as a value
+    :param: key_col - the column serving as a code
+    :parma: value_col - the column serving as a name
 
     :Example:
     CSV file:
@@ -263,32 +273,42 @@ def _create_code_to_name_map(
     Code1,CodeName1,anything_else
     Code2,CodeName2,anything_else
 
-    dict = _create_code_to_name_map(file_path, "key_col", "value_col")
-    {"Code1": "CodeName1", "Code2": "CodeName2"}
+    codes, names = _load_code_table(file_path, "key_col", "value_col")
+    codes: ["Code1", "Code2"], names: ["CodeName1", "CodeName2"]
     """
-    df = pd.read_csv(file_path)
-    df = df[[key_col, value_col]]
+    return load_reference_table(file_path, key_col, value_col)
 
-    return df.set_index(key_col, verify_integrity=True)[value_col].to_dict()
 
+@lru_cache(maxsize=None)
+def _get_code_table(file_name: str) -> CodeTable:
+    """Returns the code table of a code file, loaded on first use"""
+    return _load_code_table(_get_codes_path() / file_name)
 
-_police_force_map = _create_code_to_name_map(UK_POLICE_FORCE_CODES_PATH)
-_local_authority_district_map = _create_code_to_name_map(UK_LAD_CODES_PATH)
-_uk_la_map = _create_code_to_name_map(UK_LA_CODES_PATH)
-_uk_lsoa_map = _create_code_to_name_map(UK_LSOA_CODES_PATH)
+
+def mapping_to_dict(mapping: dict | CodeTable) -> dict:
+    """Returns the mapping as a code -> text value dictionary.
+    Builds a python object per code for code tables, use only where a dictionary is needed
+    """
+    if isinstance(mapping, dict):
+        return mapping
+    codes, names = mapping
+    return dict(zip(codes.tolist(), names.tolist()))
 
 
 # Column mappings code to name
-def get_mappings() -> dict[str, dict]:
+def get_mappings() -> dict[str, dict | CodeTable]:
     """Returns a specification for categorical mapping,
     where the key is the column name and
-    the value is a dictionary of value-to-value transformation
+    the value is a dictionary of value-to-value transformation,
+    or the code table of a code file
+
+    The file based mappings are loaded on the first call (from the reference tables cache)
     """
     return {
-        "police_force": _police_force_map,
+        "police_force": _get_code_table(UK_POLICE_FORCE_CODES_FILE),
         "collision_severity": _collision_severity_map,
         "day_of_week": _day_of_week_map,
-        "local_authority_district": _local_authority_district_map,
+        "local_authority_district": _get_code_table(UK_LAD_CODES_FILE),
         "first_road_class": _first_road_class_map,
         "road_type": _road_type_map,
         "junction_detail_historic": _junction_detail_historic_map,
@@ -309,8 +329,8 @@ def get_mappings() -> dict[str, dict]:
         "trunk_road_flag": _trunk_road_flag_map,
         "enhanced_severity_collision": _enhanced_severity_collision_map,
         "collision_injury_based": _collision_injury_based_map,
-        "local_authority_ons_district": _uk_la_map,
-        "local_authority_highway": _uk_la_map,
-        "local_authority_highway_current": _uk_la_map,
-        "lsoa_of_accident_location": _uk_lsoa_map,
+        "local_authority_ons_district": _get_code_table(UK_LA_CODES_FILE),
+        "local_authority_highway": _get_code_table(UK_LA_CODES_FILE),
+        "local_authority_highway_current": _get_code_table(UK_LA_CODES_FILE),
+        "lsoa_of_accident_location": _get_code_table(UK_LSOA_CODES_FILE),
     }
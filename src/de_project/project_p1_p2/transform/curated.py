@@ -2,66 +2,64 @@
 
 import pandas as pd
 
+from de_project.common.dtypes import string_dtype
+
 import logging
 
 logger = logging.getLogger(__name__)
 
+SEVERITY_GROUPS = {"Slight": "low", "Serious": "medium", "Fatal": "high"}
+
+# fixed categories (not inferred from the rows), so datasets missing a severity,
+# e.g. a month partition, get the same categories and codes as the whole dataset
+SEVERITY_GROUP_DTYPE = pd.CategoricalDtype(sorted(set(SEVERITY_GROUPS.values())))
+
 # Curated transformations
 
 
 def _curate_dataset(df: pd.DataFrame) -> pd.DataFrame:
     """Returns a new dataset with derived data"""
-    df_in = df.copy()
+    # input shape and columns, for metrics only (no need to copy the dataset)
+    in_shape, in_columns = df.shape, df.columns
 
     # Derive is weekend day
     weekend_days = ["Sunday", "Saturday"]
-    df["is_weekend_day"] = (
-        df["day_of_week"]
-        .case_when(
-            caselist=[
-                (df["day_of_week"].isin(weekend_days), True),
-                (~df["day_of_week"].isin(weekend_days), False),
-            ]
-        )
-        .astype("bool")
-    )
+    df["is_weekend_day"] = df["day_of_week"].isin(weekend_days).astype("bool")
 
     # Derive collision hour:minutes
     df["collision_time"] = df["collision_datetime"].dt.strftime("%H:%M")
-    df["collision_time"] = df["collision_time"].astype("string")
+    df["collision_time"] = df["collision_time"].astype(string_dtype())
 
     # Derive collision year:month
     df["collision_year_month"] = df["collision_datetime"].dt.strftime("%Y-%m")
-    df["collision_year_month"] = df["collision_year_month"].astype("string")
+    df["collision_year_month"] = df["collision_year_month"].astype(string_dtype())
 
     # Derive severity group
+    # (mapping a categorical column maps its categories only)
     df["severity_group"] = (
-        df["collision_severity"]
-        .case_when(
-            [
-                (df["collision_severity"] == "Slight", "low"),
-                (df["collision_severity"] == "Serious", "medium"),
-                (df["collision_severity"] == "Fatal", "high"),
-            ]
-        )
-        .astype("string")
+        df["collision_severity"].map(SEVERITY_GROUPS).astype(SEVERITY_GROUP_DTYPE)
     )
 
     logger.info(
-        f"[METRIC] Derive dataset columns: IN shape {df_in.shape} - OUT shape {df.shape}"
+        f"[METRIC] Derive dataset columns: IN shape {in_shape} - OUT shape {df.shape}"
     )
-    new_columns = list(set(df.columns).difference(df_in.columns))
+    new_columns = list(set(df.columns).difference(in_columns))
     logger.info(f"[METRIC] Created new dataset columns: {new_columns}")
 
     return df
 
 
-def curate(df: pd.DataFrame) -> pd.DataFrame:
-    """Returns a new dataframe with derived data for business needs"""
+def curate(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+    """Returns a new dataframe with derived data for business needs
+
+    :param copy=True: if False, runs copy-free: the derived columns are added in place,
+        so the input dataset is modified
+    """
 
     logger.info("Start derive business data...")
     try:
-        df = df.copy()
+        if copy:
+            df = df.copy()
         df = _curate_dataset(df)
     except Exception:
         logger.error("Failed to derive business data")
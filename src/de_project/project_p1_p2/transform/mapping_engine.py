@@ -0,0 +1,218 @@
+"""Code to label mapping engine
+
+Each mapping from `code_mappings` is compiled once into:
+- a categorical data type, the categories being the mapping labels
+- a hashed index of the codes (any code type, e.g. LA / LSOA string codes)
+- a dense lookup array for integer codes: `lookup[code - offset]` is the label position,
+  so negative codes (e.g. -1 "Unknown") are supported
+
+Code tables (the code files) are compiled from their memory mapped arrays,
+without a python object per code.
+
+Integer code columns are mapped together with a single gather
+over the concatenated lookup arrays of all columns.
+Special codes (e.g. `speed_limit` -1 / 99 "Unknown") are resolved once per distinct value.
+"""
+
+import numpy as np
+import pandas as pd
+
+from de_project.common.dtypes import string_dtype
+from de_project.project_p1_p2.transform.code_mappings import CodeTable, get_mappings
+
+from dataclasses import dataclass
+from functools import lru_cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_DENSE_LOOKUP_SIZE = 1 << 20  # larger integer code ranges use the hashed index
+UNMAPPED = -1  # position of codes missing in the mapping (and nulls)
+
+
+@dataclass(frozen=True)
+class CompiledMapping:
+    """A code to label mapping compiled for vectorized lookups"""
+
+    dtype: pd.CategoricalDtype
+    codes: pd.Index
+    positions: np.ndarray  # label position of each code in `codes`
+    lookup: np.ndarray | None = (
+        None  # dense label positions, None for non integer codes
+    )
+    offset: int = 0  # smallest integer code
+
+
+def _is_int_code(code) -> bool:
+    return isinstance(code, (int, np.integer)) and not isinstance(code, bool)
+
+
+def _compile_code_table(codes: np.ndarray, names: np.ndarray) -> CompiledMapping:
+    """Returns the compiled code table, built from its arrays with vectorized operations"""
+    # labels in first occurrence order, as for dictionaries
+    positions, labels = pd.factorize(names)
+    positions = positions.astype(np.int32)
+
+    lookup = None
+    offset = 0
+    if len(codes) and np.issubdtype(codes.dtype, np.integer):
+        offset = int(codes.min())
+        size = int(codes.max()) - offset + 1
+        if size <= MAX_DENSE_LOOKUP_SIZE:
+            lookup = np.full(size, UNMAPPED, dtype=np.int32)
+            lookup[codes.astype(np.int64) - offset] = positions
+
+    return CompiledMapping(
+        dtype=pd.CategoricalDtype(labels),
+        codes=pd.Index(codes),
+        positions=positions,
+        lookup=lookup,
+        offset=offset,
+    )
+
+
+def compile_mapping(mapping: dict | CodeTable) -> CompiledMapping:
+    """Returns the compiled code to label mapping (a dictionary or a code table)"""
+    if not isinstance(mapping, dict):
+        return _compile_code_table(*mapping)
+
+    labels = list(dict.fromkeys(mapping.values()))
+    label_positions = {label: position for position, label in enumerate(labels)}
+
+    codes = list(mapping.keys())
+    positions = np.array(
+        [label_positions[mapping[code]] for code in codes], dtype=np.int32
+    )
+
+    lookup = None
+    offset = 0
+    if codes and all(_is_int_code(code) for code in codes):
+        offset = int(min(codes))
+        size = int(max(codes)) - offset + 1
+        if size <= MAX_DENSE_LOOKUP_SIZE:
+            lookup = np.full(size, UNMAPPED, dtype=np.int32)
+            lookup[np.array(codes, dtype=np.int64) - offset] = positions
+
+    return CompiledMapping(
+        dtype=pd.CategoricalDtype(labels),
+        codes=pd.Index(codes),
+        positions=positions,
+        lookup=lookup,
+        offset=offset,
+    )
+
+
+def compile_mappings(
+    mappings: dict[str, dict | CodeTable],
+) -> dict[str, CompiledMapping]:
+    """Returns the compiled mappings by column name"""
+    compiled = {}
+    for col, mapping in mappings.items():
+        compiled[col] = compile_mapping(mapping)
+    return compiled
+
+
+@lru_cache(maxsize=1)
+def get_compiled_mappings() -> dict[str, CompiledMapping]:
+    """Returns the compiled `code_mappings.get_mappings()`, compiled once per process"""
+    return compile_mappings(get_mappings())
+
+
+def _hashed_positions(compiled: CompiledMapping, series: pd.Series) -> np.ndarray:
+    """Returns the label positions of the series values, looked up in the hashed index"""
+    indexer = compiled.codes.get_indexer(series)
+    return np.where(indexer >= 0, compiled.positions[indexer], UNMAPPED)
+
+
+def _dense_positions(
+    df: pd.DataFrame, compiled: dict[str, CompiledMapping]
+) -> np.ndarray:
+    """Returns the label positions of the integer code columns (rows x columns),
+    looked up with a single gather over the concatenated dense lookup arrays"""
+    lookups = [compiled[col].lookup for col in df.columns]
+    sizes = np.array([len(lookup) for lookup in lookups], dtype=np.int64)
+    offsets = np.array([compiled[col].offset for col in df.columns])
+    bases = np.cumsum(sizes) - sizes
+    # the last element: the position of codes outside the lookup ranges
+    combined = np.concatenate(lookups + [np.array([UNMAPPED], dtype=np.int32)])
+
+    # indexes into the combined lookup array, computed in place (on a copy)
+    indexes = df.to_numpy(dtype=np.int64, na_value=0, copy=True)
+    indexes -= offsets
+    # negative values are out of range too, as unsigned integers
+    out_of_range = indexes.view(np.uint64) >= sizes.astype(np.uint64)
+    indexes += bases
+    indexes[out_of_range] = len(combined) - 1
+    positions = combined[indexes]
+
+    # numpy integer columns have no nulls
+    if not all(isinstance(dtype, np.dtype) for dtype in df.dtypes):
+        positions[df.isna().to_numpy()] = UNMAPPED
+    return positions
+
+
+def map_codes(
+    df: pd.DataFrame, compiled: dict[str, CompiledMapping]
+) -> tuple[dict[str, pd.Categorical], dict[str, np.ndarray]]:
+    """Maps the code columns of the dataset to their labels.
+
+    Columns of the mappings missing in the dataset are ignored.
+
+    Returns a two elements tuple:
+    - first: the categorical columns of labels by column name
+    - second: the unmapped values (non null values missing in the mapping) by column name,
+        only columns with unmapped values are included
+    """
+    columns = [col for col in compiled if col in df.columns]
+    dense_cols = [
+        col
+        for col in columns
+        if compiled[col].lookup is not None
+        and pd.api.types.is_integer_dtype(df[col].dtype)
+    ]
+
+    positions = {}
+    if dense_cols:
+        dense_positions = _dense_positions(df[dense_cols], compiled)
+        for i, col in enumerate(dense_cols):
+            positions[col] = dense_positions[:, i]
+    for col in columns:
+        if col not in positions:
+            positions[col] = _hashed_positions(compiled[col], df[col])
+
+    mapped = {}
+    unmapped = {}
+    for col in columns:
+        col_positions = positions[col]
+        mapped[col] = pd.Categorical.from_codes(
+            col_positions, dtype=compiled[col].dtype, validate=False
+        )
+
+        mask_unmapped = col_positions == UNMAPPED
+        if mask_unmapped.any():
+            mask_unmapped &= df[col].notna().to_numpy()
+        if mask_unmapped.any():
+            unmapped[col] = df[col][mask_unmapped].unique()
+
+    logger.info(
+        f"[METRIC] Mapped {len(columns)} code columns "
+        f"({len(dense_cols)} dense lookups, {len(columns) - len(dense_cols)} hashed)"
+    )
+    return (mapped, unmapped)
+
+
+def map_special_codes(series: pd.Series, compiled: CompiledMapping) -> pd.Series:
+    """Returns the series values cast to string, special codes replaced by their labels"""
+    # labels are computed once per distinct value, then gathered for all rows
+    inverse, uniques = pd.factorize(series)
+    labels = pd.Index(uniques).astype("Int64").astype(str).to_numpy(dtype=object)
+
+    positions = _hashed_positions(compiled, pd.Series(uniques))
+    special = positions != UNMAPPED
+    labels[special] = compiled.dtype.categories.to_numpy()[positions[special]]
+
+    # the last label: nulls (factorize code -1)
+    values = np.append(labels, None)[inverse]
+    return pd.Series(
+        pd.array(values, dtype=string_dtype()), index=series.index, name=series.name
+    )
@@ -0,0 +1,215 @@
+"""Partitioned execution of the clean and curated layer transformations
+
+The dataset is split by collision month (`collision_year_month` of the curated layer),
+each month is transformed in a worker process, at most one month per worker at a time.
+The transformed months are merged back in the input rows order,
+so the result is the same as transforming the whole dataset at once.
+
+Row level rules (not null, in range) are evaluated per month.
+Rules across rows (`NotDuplicateRule`, a `collision_id` can appear in different months)
+are evaluated once on the merged months, only on their subset columns.
+
+Reference code tables are loaded before the workers start: forked workers share them,
+the cached arrays being memory mapped read-only (see `reference_tables`).
+"""
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from de_project.common.dtypes import string_dtype
+from de_project.project_p1_p2.transform.clean import clean_with_rejected
+from de_project.project_p1_p2.transform.curated import curate
+from de_project.project_p1_p2.transform.mapping_engine import get_compiled_mappings
+from de_project.project_p1_p2.transform.rules import (
+    NotDuplicateRule,
+    Rule,
+    get_default_rules,
+)
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+from typing import Callable
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+PARTITION_COLUMN = "collision_datetime"
+
+
+def month_partitions(df: pd.DataFrame) -> list[np.ndarray]:
+    """Returns the row positions of each collision month of the dataset, in month order.
+    Rows without a collision datetime are a partition of their own"""
+    datetimes = df[PARTITION_COLUMN].dt
+    months = datetimes.year * 100 + datetimes.month
+    indices = months.groupby(months, dropna=False, sort=True).indices
+    return list(indices.values())
+
+
+def _map_partitions(func: Callable, df: pd.DataFrame, max_workers: int | None) -> list:
+    """Returns the results of the function for each month partition of the dataset.
+
+    Partitions are sent to the workers as they free up,
+    so at most `max_workers` partitions are in flight.
+    """
+    start = time.perf_counter()
+    partitions = month_partitions(df) if not df.empty else []
+    max_workers = max_workers or os.cpu_count() or 1
+
+    if len(partitions) <= 1 or max_workers == 1:
+        results = [func(df.take(positions)) for positions in partitions]
+    else:
+        results = []
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            pending = set()
+            for positions in partitions:
+                if len(pending) >= max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    results += [future.result() for future in done]
+                pending.add(executor.submit(func, df.take(positions)))
+            results += [future.result() for future in wait(pending).done]
+
+    elapsed = time.perf_counter() - start
+    largest = max((len(positions) for positions in partitions), default=0)
+    logger.info(
+        f"[METRIC] Processed {len(partitions)} month partitions "
+        f"(largest {largest} rows) with {max_workers} workers in {elapsed:.2f}s"
+    )
+    return results
+
+
+def _in_input_order(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns the merged partitions rows in the input rows order (index order)"""
+    return df.sort_index().reset_index(drop=True)
+
+
+def _clean_partition(
+    df: pd.DataFrame, rules: list[Rule]
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    # the partition is a copy of the input rows, cleaned in place
+    return clean_with_rejected(df, copy=False, rules=rules, keep_index=True)
+
+
+def _apply_cross_partition_rules(
+    df: pd.DataFrame, df_rejected: pd.DataFrame, rules: list[Rule]
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Applies the `NotDuplicateRule` rules to the merged cleaned and rejected rows,
+    as the whole dataset quality check does: a rejected row is attributed
+    to the first rule it fails, in rules order"""
+    rule_positions = {rule.name: position for position, rule in enumerate(rules)}
+
+    for position, rule in enumerate(rules):
+        if not isinstance(rule, NotDuplicateRule):
+            continue
+
+        subset = list(rule.subset)
+        rows = pd.concat([df[subset], df_rejected[subset]]).sort_index()
+        failed = rows.index[rule.evaluate(rows)]
+
+        # rows rejected by a later rule are attributed to this one
+        rejected_positions = (
+            df_rejected["quarantine_rule"].map(rule_positions).to_numpy(dtype=int)
+        )
+        attributed = df_rejected.index.isin(failed) & (rejected_positions > position)
+        df_rejected.loc[attributed, "quarantine_rule"] = rule.name
+
+        # kept rows failing the rule are rejected
+        moved = df.index.isin(failed)
+        moved_rows = df[moved].assign(
+            quarantine_rule=pd.array([rule.name] * moved.sum(), dtype=string_dtype())
+        )
+        df_rejected = pd.concat([df_rejected, moved_rows])
+        df = df[~moved]
+
+        metric = {
+            "rule": rule.name,
+            "failed": len(failed),
+            "rejected": int(moved.sum() + attributed.sum()),
+        }
+        logger.info(
+            f"[METRIC] Cross-partition quality check rule: {json.dumps(metric)}"
+        )
+
+    return (df, df_rejected)
+
+
+def _concat_partitions(results: list[pd.DataFrame]) -> pd.DataFrame:
+    """Returns the concatenated partition datasets.
+
+    `pd.concat` turns categorical columns into object columns when the partitions
+    have different categories (e.g. inferred from months missing a label):
+    these columns get the union of the categories, sorted as inferred from the whole dataset.
+    """
+    df = pd.concat(results)
+    for col in results[0].columns:
+        dtypes = [result[col].dtype for result in results]
+        if all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes) and any(
+            dtype != dtypes[0] for dtype in dtypes
+        ):
+            df[col] = union_categoricals(
+                [result[col] for result in results], sort_categories=True
+            )
+    return df
+
+
+def clean_partitioned(
+    df: pd.DataFrame, max_workers: int | None = None
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Returns a cleaned dataset and the rows rejected by the verification rules,
+    see `clean.clean_with_rejected`. Each collision month is cleaned in a worker process.
+
+    The input dataset is not modified.
+
+    :param max_workers=None: number of worker processes, defaults to the number of CPUs
+    """
+    logger.info("Start cleaning dataset per collision month...")
+    if not (df.index.is_unique and df.index.is_monotonic_increasing):
+        df = df.reset_index(drop=True)
+
+    rules = get_default_rules()
+    row_rules = [rule for rule in rules if not isinstance(rule, NotDuplicateRule)]
+    # loaded once, before the workers are forked
+    get_compiled_mappings()
+
+    results = _map_partitions(
+        partial(_clean_partition, rules=row_rules), df, max_workers
+    )
+    if not results:
+        return clean_with_rejected(df, copy=True)
+
+    df_clean = _concat_partitions([clean for clean, _ in results])
+    df_rejected = _concat_partitions([rejected for _, rejected in results])
+    df_clean, df_rejected = _apply_cross_partition_rules(df_clean, df_rejected, rules)
+
+    logger.info("Successfully cleaned dataset per collision month")
+    return (_in_input_order(df_clean), _in_input_order(df_rejected))
+
+
+def _curate_partition(df: pd.DataFrame) -> pd.DataFrame:
+    # the partition is a copy of the input rows, curated in place
+    return curate(df, copy=False)
+
+
+def curate_partitioned(
+    df: pd.DataFrame, max_workers: int | None = None
+) -> pd.DataFrame:
+    """Returns a new dataframe with derived data for business needs, see `curated.curate`.
+    Each collision month is curated in a worker process.
+
+    The input dataset is not modified.
+
+    :param max_workers=None: number of worker processes, defaults to the number of CPUs
+    """
+    logger.info("Start derive business data per collision month...")
+    if not (df.index.is_unique and df.index.is_monotonic_increasing):
+        df = df.reset_index(drop=True)
+
+    results = _map_partitions(_curate_partition, df, max_workers)
+    if not results:
+        return curate(df, copy=True)
+
+    logger.info("Successfully derived business data per collision month")
+    return _in_input_order(_concat_partitions(results))
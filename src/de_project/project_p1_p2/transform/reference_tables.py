@@ -0,0 +1,89 @@
+"""Reference code tables (code -> name CSV files) with an on-disk cache
+
+Each table is cached as two numpy arrays (codes and names) in `<data>/cache/codes`,
+named after the CSV file and its content hash, e.g.
+`uk-lsoa-codes-<hash>.codes.npy` and `uk-lsoa-codes-<hash>.names.npy`.
+Cached arrays are memory mapped, the CSV file is parsed again only when its content changes.
+"""
+
+import numpy as np
+
+from de_project.common.config import get_data_path
+from de_project.common.fingerprint import get_file_hash
+
+from pathlib import Path
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def get_reference_cache_path() -> Path:
+    """Returns the path to the reference tables cache directory"""
+    return get_data_path() / "cache" / "codes"
+
+
+def _save_array(array: np.ndarray, file_path: Path) -> None:
+    # write to a temporary file first, so concurrent readers never see a partial file
+    tmp_path = file_path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as file:
+            np.save(file, array)
+        os.replace(tmp_path, file_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _build_cache(
+    file_path: Path,
+    codes_path: Path,
+    names_path: Path,
+    key_col: str,
+    value_col: str,
+) -> None:
+    """Parses the CSV file and caches its codes and names arrays"""
+    # imported here: loading cached tables doesn't need pandas
+    import pandas as pd
+
+    logger.info(f"Building reference table cache from {file_path}")
+    df = pd.read_csv(file_path)
+    df = df[[key_col, value_col]]
+    # fails on duplicate codes
+    df = df.set_index(key_col, verify_integrity=True)
+
+    codes = df.index.to_numpy()
+    if not np.issubdtype(codes.dtype, np.integer):
+        codes = codes.astype(str)  # fixed width strings, no python objects to mmap
+    names = df[value_col].to_numpy().astype(str)
+
+    # remove the cached arrays of previous versions of the file
+    for stale_path in codes_path.parent.glob(f"{file_path.stem}-*.npy"):
+        stale_path.unlink(missing_ok=True)
+
+    codes_path.parent.mkdir(parents=True, exist_ok=True)
+    _save_array(codes, codes_path)
+    _save_array(names, names_path)
+
+
+def load_reference_table(
+    file_path: Path, key_col: str = "Code", value_col: str = "Name"
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the (codes, names) arrays of a reference code table.
+
+    The arrays are memory mapped from the cache, built first if the CSV file changed.
+
+    :param key_col="Code": the column serving as a code
+    :param value_col="Name": the column serving as a name
+    """
+    file_hash = get_file_hash(file_path)
+    prefix = f"{file_path.stem}-{file_hash[:16]}"
+    codes_path = get_reference_cache_path() / f"{prefix}.codes.npy"
+    names_path = get_reference_cache_path() / f"{prefix}.names.npy"
+
+    if not (codes_path.exists() and names_path.exists()):
+        _build_cache(file_path, codes_path, names_path, key_col, value_col)
+
+    return (
+        np.load(codes_path, mmap_mode="r"),
+        np.load(names_path, mmap_mode="r"),
+    )
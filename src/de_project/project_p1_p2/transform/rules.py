@@ -1,112 +1,167 @@
-"""Data quality check rules"""
+"""Data quality check rules
 
+Rules are declared as data (see `get_default_rules`) and evaluated in a single pass:
+each rule returns a failure mask, the masks are combined into one keep mask
+and the dataset is filtered once.
+A rejected row is attributed to the first rule it fails, in rules order,
+rejected rows are returned with that rule name by `quality_check_with_rejected`.
+"""
+
+import numpy as np
 import pandas as pd
 
-import logging
+from de_project.common.config import get_quality_datetime_range
+from de_project.common.dtypes import string_dtype
+
+from dataclasses import dataclass
 from datetime import datetime
+import json
+import logging
 
 logger = logging.getLogger(__name__)
 
+KEPT = -1  # rejecting rule position of kept rows
 
-def _apply_not_null_rule(
-    df: pd.DataFrame,
-    subset: list[str],
-) -> tuple[pd.DataFrame, str]:
-    """Applies null quality check rule.
 
-    Returns a two elements tuple:
-    - first: the filtered dataset without rows containing null values
-    - second: a metric describing the number of affected rows
-    """
+@dataclass(frozen=True)
+class NotNullRule:
+    """Rows with a null value in any of the subset columns fail the rule"""
 
-    df = df.copy()
-    # mask: False = row to keep
-    mask = df[subset].isna().any(axis=1)
-    removed = (mask).sum()
-    df = df[~mask]
+    subset: tuple[str, ...]
 
-    message = (
-        f"{removed} rows where removed after 'null' quality check for columns {subset}"
-    )
+    @property
+    def name(self) -> str:
+        return f"not_null:{','.join(self.subset)}"
 
-    return (df, message)
+    def evaluate(self, df: pd.DataFrame) -> np.ndarray:
+        """Returns the failure mask of the rule (True = row fails)"""
+        return df[list(self.subset)].isna().any(axis=1).to_numpy(dtype=bool)
 
 
-def _apply_not_duplicate_rule(
-    df: pd.DataFrame,
-    subset: list[str],
-    keep="last",
-) -> tuple[pd.DataFrame, str]:
-    """Applies duplicate quality check rule.
+@dataclass(frozen=True)
+class NotDuplicateRule:
+    """Rows duplicating the subset columns values of another row fail the rule"""
 
-    Returns a two elements tuple:
-    - first: the filtered dataset without rows containing duplicate values
-    - second: a metric describing the number of affected rows
-    """
+    subset: tuple[str, ...]
+    keep: str = "last"
 
-    df = df.copy()
-    # mask: False = keep row
-    mask = df.duplicated(subset=subset, keep=keep)
-    removed = (mask).sum()
-    df = df[~mask]
-    message = f"{removed} rows where removed after 'duplicate' quality check for columns {subset}"
+    @property
+    def name(self) -> str:
+        return f"not_duplicate:{','.join(self.subset)}"
 
-    return (df, message)
+    def evaluate(self, df: pd.DataFrame) -> np.ndarray:
+        """Returns the failure mask of the rule (True = row fails)"""
+        return df.duplicated(subset=list(self.subset), keep=self.keep).to_numpy(
+            dtype=bool
+        )
 
 
-def _apply_in_range_rule(
-    df: pd.DataFrame,
-    col: str,
-    min: int | float | datetime,
-    max: int | float | datetime,
-) -> tuple[pd.DataFrame, str]:
-    """Applies range quality check rule.
+@dataclass(frozen=True)
+class InRangeRule:
+    """Rows with a column value outside [min, max] (or null) fail the rule"""
 
-    Returns a two elements tuple:
-    - first: the filtered dataset with rows fixed or dropped outside range
-    - second: a metric describing the number of affected rows
-    """
+    column: str
+    min: int | float | datetime
+    max: int | float | datetime
 
-    df = df.copy()
-    # mask: False = keep row
-    mask = ~((df[col] >= min) & (df[col] <= max))
-    removed = (mask).sum()
-    df = df[~mask]
-    message = (
-        f"{removed} rows where removed after 'in range' quality check for column {col}"
-    )
+    @property
+    def name(self) -> str:
+        return f"in_range:{self.column}"
 
-    return (df, message)
+    def evaluate(self, df: pd.DataFrame) -> np.ndarray:
+        """Returns the failure mask of the rule (True = row fails)"""
+        s = df[self.column]
+        in_range = ((s >= self.min) & (s <= self.max)).to_numpy(
+            dtype=bool, na_value=False
+        )
+        return ~in_range
 
 
-def quality_check(df: pd.DataFrame) -> pd.DataFrame:
-    """Returns a validated dataset after applying quality check rules"""
-    df = df.copy()
+Rule = NotNullRule | NotDuplicateRule | InRangeRule
 
-    # apply not null rule
-    cols = ["collision_id"]
-    df, message = _apply_not_null_rule(df, cols)
-    logger.info(f"[METRIC] {message}")
 
-    # apply not duplicate rule
-    cols = ["collision_id"]
-    df, message = _apply_not_duplicate_rule(df, cols)
-    logger.info(f"[METRIC] {message}")
+def get_default_rules() -> list[Rule]:
+    """Returns the quality check rules of the clean layer, in evaluation order"""
+    start, end = get_quality_datetime_range()
+    return [
+        NotNullRule(("collision_id",)),
+        NotDuplicateRule(("collision_id",), keep="last"),
+        InRangeRule("latitude", -90, 90),
+        InRangeRule("longitude", -180, 180),
+        InRangeRule("collision_datetime", start, end),
+    ]
 
-    # apply range rule
-    col = "latitude"
-    df, message = _apply_in_range_rule(df, col, -90, 90)
-    logger.info(f"[METRIC] {message}")
 
-    # apply range rule
-    col = "longitude"
-    df, message = _apply_in_range_rule(df, col, -180, 180)
-    logger.info(f"[METRIC] {message}")
+def evaluate_rules(
+    df: pd.DataFrame, rules: list[Rule]
+) -> tuple[np.ndarray, list[dict]]:
+    """Evaluates the rules on the dataset in a single pass.
 
-    col = "collision_datetime"
-    jan_1_2023 = datetime(2023, 1, 1)
-    jan_1_2024 = datetime(2024, 1, 1)
-    df, message = _apply_in_range_rule(df, col, jan_1_2023, jan_1_2024)
-    logger.info(f"[METRIC] {message}")
+    Returns a two elements tuple:
+    - first: the position in `rules` of the first rule failed by each row,
+        `KEPT` (-1) for rows passing all rules
+    - second: a metric per rule (rule name, failed and rejected rows count),
+        rejected rows being the rows failing the rule but none of the previous ones
+    """
+    rejected_by = np.full(len(df), KEPT, dtype=np.int16)
+    metrics = []
+    for position, rule in enumerate(rules):
+        failed = rule.evaluate(df)
+        rejected = failed & (rejected_by == KEPT)
+        rejected_by[rejected] = position
+        metrics.append(
+            {
+                "rule": rule.name,
+                "failed": int(failed.sum()),
+                "rejected": int(rejected.sum()),
+            }
+        )
+    return (rejected_by, metrics)
+
+
+def quality_check_with_rejected(
+    df: pd.DataFrame, rules: list[Rule] | None = None
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Applies the quality check rules to the dataset.
+
+    The input dataset is not modified, both returned datasets are new ones.
+
+    Returns a two elements tuple:
+    - first: the validated dataset, without the rows failing any rule
+    - second: the rejected rows, with a `quarantine_rule` column:
+        the name of the first rule each row fails
+
+    :param rules=None: the rules to apply, defaults to `get_default_rules()`
+    """
+    if rules is None:
+        rules = get_default_rules()
+
+    rejected_by, metrics = evaluate_rules(df, rules)
+    # positional take: the results are not flagged as copies of the input dataset,
+    # so they can be modified in place afterwards
+    valid = df.take(np.flatnonzero(rejected_by == KEPT))
+    rejected_positions = np.flatnonzero(rejected_by != KEPT)
+    rejected = df.take(rejected_positions)
+    rule_names = np.array([rule.name for rule in rules], dtype=object)
+    rejected["quarantine_rule"] = pd.array(
+        rule_names[rejected_by[rejected_positions]], dtype=string_dtype()
+    )
 
-    return df
+    for metric in metrics:
+        logger.info(f"[METRIC] Quality check rule: {json.dumps(metric)}")
+    logger.info(
+        f"[METRIC] Quality check: {len(rejected)} rows removed "
+        f"by {len(rules)} rules: IN shape {df.shape} - OUT shape {valid.shape}"
+    )
+    return (valid, rejected)
+
+
+def quality_check(df: pd.DataFrame, rules: list[Rule] | None = None) -> pd.DataFrame:
+    """Returns a validated dataset, without the rows failing any quality check rule.
+
+    The input dataset is not modified, the validated dataset is a new one.
+
+    :param rules=None: the rules to apply, defaults to `get_default_rules()`
+    """
+    valid, _ = quality_check_with_rejected(df, rules)
+    return valid
@@ -0,0 +1,48 @@
+"""Builds a dataset representing the hourly collisions aggregate table
+
+Grain: date x hour x severity x location, the standard analytical queries group by
+a subset of it (collisions per month, severity distribution, weekday vs weekend, peak hours).
+
+Built from the whole fact dataset on the first load, then maintained with the changes
+of the fact rows: see `build_agg_hourly_delta`.
+"""
+
+import pandas as pd
+
+AGG_HOURLY_TABLE = "collisions_agg_hourly"
+
+AGG_KEYS = ["date_key", "hour", "severity_key", "location_key"]
+
+# the fact columns an aggregate row is derived from
+FACT_COLUMNS = [
+    "date_key",
+    "time_key",
+    "severity_key",
+    "location_key",
+    "collision_count",
+]
+
+
+def build_agg_hourly(fact_df: pd.DataFrame) -> pd.DataFrame:
+    """Returns a dataset representing the hourly collisions aggregate of the fact dataset,
+    the collision count per aggregate keys, sorted by keys"""
+    df = fact_df[FACT_COLUMNS]
+    # time_key is hour * 100 + minute, see `build_features`
+    df = df.assign(hour=df["time_key"] // 100)
+    return df.groupby(AGG_KEYS, as_index=False, sort=True)["collision_count"].sum()
+
+
+def build_agg_hourly_delta(
+    deleted: pd.DataFrame, inserted: pd.DataFrame
+) -> pd.DataFrame:
+    """Returns the collision count changes per aggregate keys of fact row changes,
+    negative where rows are deleted. Keys without change are left out
+
+    :param deleted: the deleted fact rows
+    :param inserted: the inserted fact rows
+    """
+    removed = build_agg_hourly(deleted)
+    removed["collision_count"] = -removed["collision_count"]
+    df = pd.concat([build_agg_hourly(inserted), removed], ignore_index=True)
+    df = df.groupby(AGG_KEYS, as_index=False, sort=True)["collision_count"].sum()
+    return df[df["collision_count"] != 0].reset_index(drop=True)
@@ -2,35 +2,41 @@
 
 import pandas as pd
 
+from datetime import date
 import logging
 
-from de_project.project_p3.utils.utils import extract_date_key
-
 logger = logging.getLogger(__name__)
 
 
-def _extract_date_dedup(df: pd.DataFrame) -> pd.DataFrame:
-    """Returns a dataset including the date column normalized and deduplicated"""
-    return df.drop_duplicates("date").sort_values("date")
+def count_calendar_days(first_year: int, last_year: int) -> int:
+    """Returns the number of days from January 1st of the first year
+    to December 31st of the last year"""
+    return (date(last_year + 1, 1, 1) - date(first_year, 1, 1)).days
+
 
+def build_dim_date(first_year: int, last_year: int) -> pd.DataFrame:
+    """Returns a dataset representing a date dimension in star schema,
+    generated: every calendar day of the years, collisions or not
 
-def build_dim_date(df: pd.DataFrame) -> pd.DataFrame:
-    """Returns a dataset representing a date dimension in star schema"""
+    :param first_year: the first year of the calendar, from January 1st
+    :param last_year: the last year of the calendar, to December 31st
+    """
 
-    df = df.copy()
+    # create dimension dataset
+    df = pd.DataFrame(
+        {"date": pd.date_range(f"{first_year}-01-01", f"{last_year}-12-31", freq="D")}
+    )
 
     # derive dimension columns
-    df["date_key"] = extract_date_key(df)
-    df["date"] = df["collision_datetime"].dt.normalize()
     df["year"] = df["date"].dt.year
     df["month"] = df["date"].dt.month
     df["day"] = df["date"].dt.day
+    # date to int: 2024-01-01 -> 20240101, same key as `build_features`
+    df["date_key"] = df["year"] * 10_000 + df["month"] * 100 + df["day"]
     df["day_of_week"] = df["date"].dt.day_name().astype("string")
     df["is_weekend"] = df["date"].dt.day_of_week >= 5
 
-    # create dimension dataset
-    df = _extract_date_dedup(df)
-
+    logger.info(f"Generated date dimension {first_year}-{last_year}: {len(df)} days")
     return df[
         [
             "date_key",
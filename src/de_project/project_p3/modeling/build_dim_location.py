@@ -2,28 +2,22 @@
 
 import pandas as pd
 
-from de_project.project_p3.utils.utils import extract_location_key
 
-
-def _extract_location_dedup(df: pd.DataFrame) -> pd.DataFrame:
-    """Returns a dataset including the location columns deduplicated"""
+def _extract_location_dedup(features: pd.DataFrame) -> pd.DataFrame:
+    """Returns a dataset including the location columns deduplicated,
+    one row per grid cell (`location_key`)"""
     cols = ["lon_bucket", "lat_bucket"]
-    return df.drop_duplicates(cols).sort_values(cols)
-
+    return features.drop_duplicates("location_key").sort_values(cols)
 
-def build_dim_location(df: pd.DataFrame) -> pd.DataFrame:
-    """Returns a dataset representing a location dimension in star schema"""
 
-    df: pd.DataFrame = df.copy()
+def build_dim_location(features: pd.DataFrame) -> pd.DataFrame:
+    """Returns a dataset representing a location dimension in star schema
 
-    # derive dimension columns
-    BUCKET_PRECISION = 2  # grid size 1 square kilometer
-    df["lon_bucket"] = df["longitude"].astype("float").round(BUCKET_PRECISION)
-    df["lat_bucket"] = df["latitude"].astype("float").round(BUCKET_PRECISION)
-    df["location_key"] = extract_location_key(df)
+    :param features: the collisions features, see `build_features`
+    """
 
     # create dimension dataset
-    df = _extract_location_dedup(df)
+    df = _extract_location_dedup(features[["location_key", "lon_bucket", "lat_bucket"]])
 
     return df[
         [
@@ -2,27 +2,28 @@
 
 import pandas as pd
 
-from de_project.project_p3.utils.utils import extract_severity_key
+from de_project.project_p3.modeling.build_features import SEVERITY_KEYS
 
 
-def _extract_severity_dedup(df: pd.DataFrame) -> pd.DataFrame:
+def _extract_severity_dedup(features: pd.DataFrame) -> pd.DataFrame:
     """Returns a dataset including the severity column deduplicated"""
-    return df.drop_duplicates("collision_severity")
+    return features.drop_duplicates("severity_key")
 
 
-def build_dim_severity(df: pd.DataFrame) -> pd.DataFrame:
-    """Returns a dataset representing a severity dimension in star schema"""
+def build_dim_severity(features: pd.DataFrame) -> pd.DataFrame:
+    """Returns a dataset representing a severity dimension in star schema
 
-    df = df.copy()
-
-    # derive dimension columns
-    df["severity_key"] = extract_severity_key(df)
-    df["severity_description"] = df["collision_severity"]
-    group_map = {"Slight": "low", "Serious": "medium", "Fatal": "high"}
-    df["severity_group"] = df["collision_severity"].map(group_map)
+    :param features: the collisions features, see `build_features`
+    """
 
     # create dimension dataset
-    df = _extract_severity_dedup(df)
+    df = _extract_severity_dedup(features[["severity_key"]])
+
+    # derive dimension columns, once per severity
+    descriptions = {key: label for label, key in SEVERITY_KEYS.items()}
+    df["severity_description"] = df["severity_key"].map(descriptions).astype("string")
+    group_map = {"Slight": "low", "Serious": "medium", "Fatal": "high"}
+    df["severity_group"] = df["severity_description"].map(group_map)
 
     return df[
         [
@@ -1,27 +1,21 @@
 """Builds a dataset representing time dimensional table"""
 
+import numpy as np
 import pandas as pd
 
-from de_project.project_p3.utils.utils import extract_time_key
+from de_project.project_p3.modeling.build_features import MINUTES_PER_DAY
 
 
-def _extract_time_dedup(df: pd.DataFrame) -> pd.DataFrame:
-    """Returns a dataset including the time columns deduplicated"""
-    return df.drop_duplicates(["hour", "minute"]).sort_values(["hour", "minute"])
-
-
-def build_dim_time(df: pd.DataFrame) -> pd.DataFrame:
-    """Returns a dataset representing a time dimension in star schema"""
-
-    df = df.copy()
-
-    # derive dimension columns
-    df["time_key"] = extract_time_key(df)
-    df["hour"] = df["collision_datetime"].dt.hour
-    df["minute"] = df["collision_datetime"].dt.minute
+def build_dim_time() -> pd.DataFrame:
+    """Returns a dataset representing a time dimension in star schema,
+    generated: every minute of the day, collisions or not"""
 
     # create dimension dataset
-    df = _extract_time_dedup(df)
+    minute_of_day = np.arange(MINUTES_PER_DAY, dtype=np.int32)
+    df = pd.DataFrame({"hour": minute_of_day // 60, "minute": minute_of_day % 60})
+
+    # hour:minute to int: 0:01 -> 1; 08:15 -> 815, same key as `build_features`
+    df["time_key"] = df["hour"] * 100 + df["minute"]
 
     return df[
         [
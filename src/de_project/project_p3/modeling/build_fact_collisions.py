@@ -1,51 +1,31 @@
 """Builds a dataset representing collisions fact table"""
 
+import numpy as np
 import pandas as pd
 
-from de_project.project_p3.utils.utils import (
-    extract_date_key,
-    extract_time_key,
-    extract_severity_key,
-    extract_location_key,
-)
+FACT_TABLE = "collisions_fact"
 
+# the dimension keys of a collision, a change of any of them changes the fact row
+DIMENSION_KEYS = ["date_key", "time_key", "severity_key", "location_key"]
 
-def build_fact_collisions(
-    df: pd.DataFrame,
-    dimensions: dict[str, pd.DataFrame],
-) -> pd.DataFrame:
-    """Returns a dataset representing a collisions fact in star schema"""
 
-    df = df.copy()
+def build_fact_collisions(features: pd.DataFrame) -> pd.DataFrame:
+    """Returns a dataset representing a collisions fact in star schema
 
-    # build dimensions datasets
-    dim_date: pd.DataFrame = dimensions["dim_date"]
-    dim_time: pd.DataFrame = dimensions["dim_time"]
-    dim_severity: pd.DataFrame = dimensions["dim_severity"]
-    dim_location: pd.DataFrame = dimensions["dim_location"]
+    :param features: the collisions features, see `build_features`,
+        the surrogate keys of the dimensions are derived there
+    """
 
-    # derive surrogate keys
-    df["date_key"] = extract_date_key(df)  # append to df, name date_key
-    df["time_key"] = extract_time_key(df)  # append to df, name time_key
-    df["severity_key"] = extract_severity_key(df)["severity_key"]
-    df["location_key"] = extract_location_key(df)["location_key"]
+    df = features[["collision_id", *DIMENSION_KEYS]]  # collision_id for traceability
 
     # add additional dimension columns
-    df["collision_key"] = df.reset_index(drop=True).index + 1  # surrogate key
-    df["collision_count"] = 1  # should be always 1
-
-    # create
-    (
-        df.merge(right=dim_date, how="inner", on="date_key")
-        .merge(right=dim_time, how="inner", on="time_key")
-        .merge(right=dim_severity, how="inner", on="severity_key")
-        .merge(right=dim_location, how="inner", on="location_key")
-    )
+    collision_key = np.arange(1, len(df) + 1, dtype=np.int64)  # surrogate key
+    df = df.assign(collision_key=collision_key, collision_count=1)  # count always 1
 
     return df[
         [
             "collision_key",
-            "collision_id",  # optional, keep it for traceability
+            "collision_id",
             "date_key",
             "time_key",
             "severity_key",
@@ -53,3 +33,44 @@ def build_fact_collisions(
             "collision_count",
         ]
     ]
+
+
+def diff_fact_collisions(
+    stored: pd.DataFrame, fact_df: pd.DataFrame
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Returns the (deleted, inserted) rows turning the stored fact into the fact dataset,
+    matched on collision_id: rows of removed or changed collisions are deleted,
+    rows of new or changed collisions are inserted.
+
+    Stored surrogate keys are kept: a changed collision keeps its collision_key,
+    new collisions get keys following the largest stored one.
+
+    :param stored: the stored fact rows, all the fact columns
+    :param fact_df: the fact dataset, see `build_fact_collisions`
+    """
+    stored = stored.set_index("collision_id")
+    new = fact_df.set_index("collision_id")
+
+    is_stored = new.index.isin(stored.index)
+    common = new.index[is_stored]
+    changed = common[
+        (
+            new.loc[common, DIMENSION_KEYS].to_numpy()
+            != stored.loc[common, DIMENSION_KEYS].to_numpy()
+        ).any(axis=1)
+    ]
+    removed = stored.index[~stored.index.isin(new.index)]
+
+    deleted = stored.loc[removed.append(changed)].reset_index()
+
+    updated = new.loc[changed].assign(
+        collision_key=stored.loc[changed, "collision_key"].to_numpy()
+    )
+    added = new[~is_stored]
+    first_key = int(stored["collision_key"].max()) + 1 if len(stored) else 1
+    added = added.assign(
+        collision_key=np.arange(first_key, first_key + len(added), dtype=np.int64)
+    )
+    inserted = pd.concat([updated, added]).reset_index()[fact_df.columns]
+
+    return deleted[fact_df.columns], inserted
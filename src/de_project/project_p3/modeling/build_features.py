@@ -0,0 +1,115 @@
+"""Builds a dataset of the dimension keys and attributes of every collision (feature pass)
+
+Keys and attributes are derived once, from the curated dataset, with integer arithmetic
+on the datetime and coordinate arrays. The dimension and fact builders only select
+and deduplicate the feature columns:
+
+collision_id | date_key | date       | time_key | hour | minute | severity_key | location_key | lon_bucket | lat_bucket
+2023010001   | 20230101 | 2023-01-01 | 815      | 8    | 15     | 1            | 513932273    | -0.03      | 52.75
+
+`location_key` identifies the location grid cell (lon_bucket, lat_bucket), so every collision
+of a cell references the same `dim_location` row. It is computed from the cell coordinates,
+the key of a cell is the same across runs.
+"""
+
+import numpy as np
+import pandas as pd
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+NS_PER_MINUTE = 60 * 1_000_000_000
+MINUTES_PER_DAY = 24 * 60
+
+SEVERITY_KEYS = {"Slight": 1, "Serious": 2, "Fatal": 3}
+
+LOCATION_BUCKET_PRECISION = 2  # grid size 1 square kilometer
+_CELLS_PER_DEGREE = 10**LOCATION_BUCKET_PRECISION
+# longitude cells from -180 to 180 degrees, included
+_LON_CELLS = 360 * _CELLS_PER_DEGREE + 1
+
+
+def _date_keys(days: np.ndarray) -> np.ndarray:
+    """Returns the yyyymmdd integer key of the days since epoch,
+    computed once per distinct day (~365 a year)"""
+    codes, unique_days = pd.factorize(days)
+    dates = unique_days.astype("datetime64[D]")
+    months = dates.astype("datetime64[M]")
+    year = months.astype(np.int64) // 12 + 1970
+    month = months.astype(np.int64) % 12 + 1
+    day = (dates - months).astype(np.int64) + 1
+    return (year * 10_000 + month * 100 + day)[codes]
+
+
+def _severity_keys(severity: pd.Series) -> np.ndarray:
+    """Returns the severity key of the severity labels, looked up once per distinct label"""
+    codes, labels = pd.factorize(severity)
+    unknown = [label for label in labels if label not in SEVERITY_KEYS]
+    if unknown or (codes < 0).any():
+        raise ValueError(f"Unknown collision severity values: {unknown or [None]}")
+    return np.array([SEVERITY_KEYS[label] for label in labels], dtype=np.int64)[codes]
+
+
+def _location_cells(coordinates: pd.Series) -> np.ndarray:
+    """Returns the location grid cell of the coordinates: the coordinates rounded to the grid,
+    as integers (the number of cells from 0 degrees)"""
+    if coordinates.isna().any():
+        raise ValueError(f"Missing {coordinates.name} values, can't derive locations")
+    # same rounding as `np.round(coordinates, LOCATION_BUCKET_PRECISION)`
+    cells = np.rint(coordinates.to_numpy(dtype=np.float64) * _CELLS_PER_DEGREE)
+    return cells.astype(np.int64)
+
+
+def _location_keys(lon_cells: np.ndarray, lat_cells: np.ndarray) -> np.ndarray:
+    """Returns the key of the location grid cells: the cell position in the world grid,
+    row by row of latitude, from (-180, -90) degrees. Keys start at 1"""
+    lon_offset = lon_cells + 180 * _CELLS_PER_DEGREE
+    lat_offset = lat_cells + 90 * _CELLS_PER_DEGREE
+    return lat_offset * _LON_CELLS + lon_offset + 1
+
+
+def build_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns a dataset of the dimension keys and attributes of every collision, in a single pass
+
+    :param df: the curated dataset (`collision_id`, `collision_datetime`,
+        `collision_severity`, `longitude`, `latitude`)
+    """
+    start = time.perf_counter()
+    if df["collision_datetime"].isna().any():
+        raise ValueError("Missing collision_datetime values, can't derive date keys")
+
+    # minutes since epoch, split into days since epoch and minute of day
+    minutes = (
+        df["collision_datetime"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        // NS_PER_MINUTE
+    )
+    days = minutes // MINUTES_PER_DAY
+    minute_of_day = (minutes - days * MINUTES_PER_DAY).astype(np.int32)
+    hour = minute_of_day // 60
+    minute = minute_of_day % 60
+
+    lon_cells = _location_cells(df["longitude"])
+    lat_cells = _location_cells(df["latitude"])
+
+    features = pd.DataFrame(
+        {
+            "collision_id": df["collision_id"].array,
+            "date_key": _date_keys(days),
+            "date": (days * MINUTES_PER_DAY * NS_PER_MINUTE).view("datetime64[ns]"),
+            # hour:minute to int: 0:01 -> 1; 08:15 -> 815; 23:59 -> 2359
+            "time_key": hour * 100 + minute,
+            "hour": hour,
+            "minute": minute,
+            "severity_key": _severity_keys(df["collision_severity"]),
+            # one location per grid cell, shared by the collisions of the cell
+            "location_key": _location_keys(lon_cells, lat_cells),
+            "lon_bucket": lon_cells / _CELLS_PER_DEGREE,
+            "lat_bucket": lat_cells / _CELLS_PER_DEGREE,
+        }
+    )
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"[METRIC] Derived features of {len(df)} collisions in {elapsed:.2f}s")
+    return features
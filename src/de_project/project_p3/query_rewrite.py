@@ -0,0 +1,181 @@
+"""Rewrites the standard analytical queries to read the hourly aggregate table
+
+The queries of `analytical-queries.sql` scan and join the whole `collisions_fact` table.
+Each one is registered here with an equivalent query on `collisions_agg_hourly`,
+one row per date, hour, severity and location of the collisions (the collisions of a row are summed).
+Queries are matched on their text, whitespace, comments and case ignored;
+other queries run unchanged.
+"""
+
+import pandas as pd
+from sqlalchemy import Engine
+
+from de_project.common.analytics import has_table, run_query
+from de_project.project_p3.modeling.build_agg_hourly import AGG_HOURLY_TABLE
+
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# (standard query, aggregate query) pairs.
+# SUM is cast to BIGINT, the COUNT type, since DuckDB sums integers as HUGEINT
+_REWRITES = [
+    # collisions per month
+    (
+        """
+        SELECT year, month, COUNT(*) AS collisions_per_month
+        FROM collisions_fact f
+            JOIN collisions_dim_date d ON f.date_key = d.date_key
+        GROUP BY year, month
+        ORDER BY year, month
+        """,
+        """
+        SELECT year, month, CAST(SUM(collision_count) AS BIGINT) AS collisions_per_month
+        FROM collisions_agg_hourly a
+            JOIN collisions_dim_date d ON a.date_key = d.date_key
+        GROUP BY year, month
+        ORDER BY year, month
+        """,
+    ),
+    # severity distribution (fact only)
+    (
+        """
+        SELECT severity_key, COUNT(*) AS severity_count_per_group
+        FROM collisions_fact
+        GROUP BY severity_key
+        """,
+        """
+        SELECT severity_key, CAST(SUM(collision_count) AS BIGINT) AS severity_count_per_group
+        FROM collisions_agg_hourly
+        GROUP BY severity_key
+        """,
+    ),
+    # severity distribution (fact and severity dimension)
+    (
+        """
+        SELECT severity_group, COUNT(*) AS severity_count_per_group
+        FROM collisions_fact f
+            JOIN collisions_dim_severity s ON f.severity_key = s.severity_key
+        GROUP BY s.severity_group
+        """,
+        """
+        SELECT severity_group, CAST(SUM(collision_count) AS BIGINT) AS severity_count_per_group
+        FROM collisions_agg_hourly a
+            JOIN collisions_dim_severity s ON a.severity_key = s.severity_key
+        GROUP BY s.severity_group
+        """,
+    ),
+    # weekday collisions
+    (
+        """
+        SELECT COUNT(collision_count) AS weekday_collisions_count
+        FROM collisions_fact f
+            JOIN collisions_dim_date d ON f.date_key = d.date_key
+        WHERE is_weekend = False
+        """,
+        """
+        SELECT CAST(COALESCE(SUM(collision_count), 0) AS BIGINT) AS weekday_collisions_count
+        FROM collisions_agg_hourly a
+            JOIN collisions_dim_date d ON a.date_key = d.date_key
+        WHERE is_weekend = False
+        """,
+    ),
+    # weekend collisions
+    (
+        """
+        SELECT COUNT(collision_count) AS weekend_collisions_count
+        FROM collisions_fact f
+            JOIN collisions_dim_date d ON f.date_key = d.date_key
+        WHERE d.is_weekend = True
+        """,
+        """
+        SELECT CAST(COALESCE(SUM(collision_count), 0) AS BIGINT) AS weekend_collisions_count
+        FROM collisions_agg_hourly a
+            JOIN collisions_dim_date d ON a.date_key = d.date_key
+        WHERE d.is_weekend = True
+        """,
+    ),
+    # weekday, weekend and total collisions
+    (
+        """
+        SELECT
+            SUM(CASE WHEN d.is_weekend = False THEN 1 END) AS weekday_collisions_count,
+            SUM(CASE WHEN d.is_weekend = True THEN 1 END) AS weekend_collisions_count,
+            COUNT(collision_count) AS total_collisions
+        FROM collisions_fact f
+            JOIN collisions_dim_date d ON f.date_key = d.date_key
+        """,
+        """
+        SELECT
+            CAST(
+                SUM(CASE WHEN d.is_weekend = False THEN collision_count END) AS BIGINT
+            ) AS weekday_collisions_count,
+            CAST(
+                SUM(CASE WHEN d.is_weekend = True THEN collision_count END) AS BIGINT
+            ) AS weekend_collisions_count,
+            CAST(COALESCE(SUM(collision_count), 0) AS BIGINT) AS total_collisions
+        FROM collisions_agg_hourly a
+            JOIN collisions_dim_date d ON a.date_key = d.date_key
+        """,
+    ),
+    # peak collision hours
+    (
+        """
+        SELECT t.hour, COUNT(collision_count) AS collisions
+        FROM collisions_fact f
+            JOIN collisions_dim_time t ON f.time_key = t.time_key
+        GROUP BY t.hour
+        HAVING collisions > 7000
+        ORDER BY collisions DESC
+        """,
+        """
+        SELECT hour, CAST(SUM(collision_count) AS BIGINT) AS collisions
+        FROM collisions_agg_hourly
+        GROUP BY hour
+        HAVING collisions > 7000
+        ORDER BY collisions DESC
+        """,
+    ),
+]
+
+
+def _normalize(sql: str) -> str:
+    """Returns the query text without comments, trailing `;`, extra whitespace, lower cased"""
+    sql = re.sub(r"--[^\n]*", " ", sql)
+    sql = re.sub(r"\s*([(),;])\s*", r"\1", " ".join(sql.split()))
+    return sql.rstrip(";").strip().lower()
+
+
+_REWRITES_BY_QUERY = {
+    _normalize(query): " ".join(rewrite.split()) for query, rewrite in _REWRITES
+}
+
+
+def rewrite_query(sql: str) -> str | None:
+    """Returns the aggregate query equivalent to the query, None if there is none"""
+    return _REWRITES_BY_QUERY.get(_normalize(sql))
+
+
+def resolve_query(engine: Engine, sql: str) -> str:
+    """Returns the query to run for the query: its aggregate query if any
+    and the aggregate table exists, the query itself otherwise
+
+    :param engine: the pipeline SQLite engine, used by the `sqlite` backend
+    """
+    rewrite = rewrite_query(sql)
+    if rewrite is not None and has_table(engine, AGG_HOURLY_TABLE):
+        return rewrite
+    return sql
+
+
+def run_analytical_query(engine: Engine, sql: str) -> pd.DataFrame:
+    """Runs a query against the analytical store, from the hourly aggregate table if possible.
+    Returns the result rows
+
+    :param engine: the pipeline SQLite engine, used by the `sqlite` backend
+    """
+    resolved = resolve_query(engine, sql)
+    if resolved != sql:
+        logger.info(f"Query answered from '{AGG_HOURLY_TABLE}'")
+    return run_query(engine, resolved)
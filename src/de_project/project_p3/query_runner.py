@@ -0,0 +1,181 @@
+"""Runs the analytical queries of `analytical-queries.sql` against the analytical store
+
+Each query is named after the last comment line above it, e.g. `Peak collision hours`.
+A run records the latency and the query plan of each query, the plans of slow queries are logged.
+
+Results are cached in `<data>/cache/queries`, as Parquet files named after the hash of:
+the query run, the analytical backend, the dtype backend and the version of every table it reads
+(`analytics.get_table_versions`). A table write changes its version, so a cached result
+is only served while the tables it was computed from are unchanged.
+Queries reading tables without a version (not written with `analytics.write_tables`) are never cached.
+"""
+
+import pandas as pd
+from sqlalchemy import Engine
+
+from de_project.common.analytics import explain_query, get_table_versions, run_query
+from de_project.common.config import (
+    get_analytics_backend,
+    get_data_path,
+    is_arrow_dtypes_enabled,
+)
+from de_project.project_p3.query_rewrite import resolve_query
+
+from dataclasses import dataclass
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+QUERIES_PATH = Path(__file__).parent / "analytical-queries.sql"
+
+SLOW_QUERY_SECONDS = 1.0
+
+_COMMENT_PREFIX = "ANALYTICAL QUERY:"
+
+# table names following FROM / JOIN, optionally quoted
+_TABLE_PATTERN = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?', re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class NamedQuery:
+    """A query of the analytical queries file"""
+
+    name: str
+    sql: str
+
+
+@dataclass
+class QueryResult:
+    """The result of a query run"""
+
+    name: str
+    sql: str  # the query run, see `query_rewrite.resolve_query`
+    result: pd.DataFrame
+    elapsed: float  # seconds
+    plan: str | None  # None when served from cache
+    cached: bool
+
+
+def parse_queries(path: Path = QUERIES_PATH) -> list[NamedQuery]:
+    """Returns the queries of a SQL file, named after the last comment line above each query"""
+    queries = []
+    for statement in path.read_text().split(";"):
+        comments = []
+        lines = []
+        for line in statement.splitlines():
+            stripped = line.strip()
+            if stripped.startswith("--"):
+                comments.append(stripped.lstrip("-").strip())
+            elif stripped:
+                lines.append(line)
+        if not lines:
+            continue
+
+        name = comments[-1] if comments else f"Query {len(queries) + 1}"
+        name = name.removeprefix(_COMMENT_PREFIX).strip()
+        queries.append(NamedQuery(name=name, sql="\n".join(lines).strip()))
+
+    return queries
+
+
+def get_query_tables(sql: str) -> list[str]:
+    """Returns the names of the tables a query reads, sorted"""
+    return sorted(set(_TABLE_PATTERN.findall(sql)))
+
+
+def _get_cache_dir() -> Path:
+    """Returns the path to the query results cache directory"""
+    return get_data_path() / "cache" / "queries"
+
+
+def _get_cache_key(engine: Engine, sql: str) -> str | None:
+    """Returns the cache key of a query, None if a table it reads has no version"""
+    tables = get_query_tables(sql)
+    versions = get_table_versions(engine, tables)
+    if not tables or len(versions) < len(tables):
+        return None
+
+    key = {
+        "sql": sql,
+        "backend": get_analytics_backend(),
+        "arrow_dtypes": is_arrow_dtypes_enabled(),
+        "versions": versions,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def _read_cache(cache_key: str) -> pd.DataFrame | None:
+    cache_path = _get_cache_dir() / f"{cache_key}.parquet"
+    try:
+        return pd.read_parquet(cache_path)
+    except FileNotFoundError:
+        return None
+
+
+def _write_cache(cache_key: str, df: pd.DataFrame) -> None:
+    # write to a temporary file first, readers never see a partial file
+    cache_path = _get_cache_dir() / f"{cache_key}.parquet"
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def run_named_query(
+    engine: Engine, query: NamedQuery, use_cache: bool = True
+) -> QueryResult:
+    """Runs a query, from the results cache if its tables are unchanged since it was cached
+
+    :param engine: the pipeline SQLite engine, used by the `sqlite` backend
+    :param use_cache=True: if False, the query runs and its result is not cached
+    """
+    start = time.perf_counter()
+    sql = resolve_query(engine, query.sql)
+    cache_key = _get_cache_key(engine, sql) if use_cache else None
+
+    if cache_key is not None:
+        df = _read_cache(cache_key)
+        if df is not None:
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"[METRIC] Query '{query.name}': {len(df)} rows from cache "
+                f"in {elapsed:.3f}s"
+            )
+            return QueryResult(query.name, sql, df, elapsed, None, cached=True)
+
+    df = run_query(engine, sql)
+    elapsed = time.perf_counter() - start
+    plan = explain_query(engine, sql)
+    if cache_key is not None:
+        _write_cache(cache_key, df)
+
+    logger.info(f"[METRIC] Query '{query.name}': {len(df)} rows in {elapsed:.3f}s")
+    if elapsed >= SLOW_QUERY_SECONDS:
+        logger.warning(f"Slow query '{query.name}' ({elapsed:.3f}s), plan:\n{plan}")
+    else:
+        logger.debug(f"Query '{query.name}' plan:\n{plan}")
+
+    return QueryResult(query.name, sql, df, elapsed, plan, cached=False)
+
+
+def run_queries(
+    engine: Engine, path: Path = QUERIES_PATH, use_cache: bool = True
+) -> list[QueryResult]:
+    """Runs the queries of a SQL file, in order, see `run_named_query`
+
+    :param engine: the pipeline SQLite engine, used by the `sqlite` backend
+    :param path=QUERIES_PATH: the SQL file, `analytical-queries.sql` by default
+    """
+    return [
+        run_named_query(engine, query, use_cache=use_cache)
+        for query in parse_queries(path)
+    ]